@@ -25,6 +25,7 @@ setup(
         'google-cloud-storage==1.28.1',
         'aioftp==0.16.0',
         'aiofiles==0.5.0',
+        'aiohttp==3.6.2',
         'pyproj==2.6.1.post1',
         'opencv-python==4.2.0.34',
         'Cartopy==0.18.0',
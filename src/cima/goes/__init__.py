@@ -1 +1,2 @@
 from cima.goes.utils._file_names import Band, Product, ProductBand, ANY_MODE, get_gcs_url
+from cima.goes.utils._file_names import GoesFileName, parse_file_name
@@ -0,0 +1,26 @@
+import importlib
+import sys
+from typing import Dict, List
+
+
+def lazy_exports(package: str, exports: Dict[str, List[str]]):
+    '''
+    PEP 562 __getattr__, __dir__ and __all__ of a package that re-exports names of its modules.
+    exports is {module: [names]}; a module is imported the first time one of its names
+    is used, so importing the package doesn't load every dependency of every module.
+    '''
+    modules = {name: module for module, names in exports.items() for name in names}
+
+    def __getattr__(name: str):
+        module = modules.get(name)
+        if module is None:
+            raise AttributeError(f'module {package!r} has no attribute {name!r}')
+        value = getattr(importlib.import_module(f'{package}.{module}'), name)
+        # Later lookups find it as a plain attribute
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(modules))
+
+    return __getattr__, __dir__, list(modules)
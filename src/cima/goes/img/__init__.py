@@ -1,6 +1,22 @@
-from cima.goes.img._images import save_image, get_cloud_tops_palette, pcolormesh, getfig
-from cima.goes.img._images import compose_rgb, get_cropped_cv2_image, get_clipped, get_image_inches
-from cima.goes.img._images import get_image_stream, get_pil_image, get_true_colors, apply_albedo
-from cima.goes.img._images import pil2cv, cv2pil, stream2cv, stream2pil, cv2stream, pil2stream
-from cima.goes.img._images import Grid, Color
-from cima.goes.img._palettes import CLOUD_TOPS_PALETTE
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562): cartopy, matplotlib
+# and cv2 are only loaded by the modules that need them
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_images': [
+        'save_image', 'get_cloud_tops_palette', 'pcolormesh', 'getfig', 'compose_rgb', 'get_cropped_cv2_image',
+        'get_clipped', 'get_image_inches', 'get_image_stream', 'get_pil_image', 'get_true_colors', 'apply_albedo',
+        'pil2cv', 'cv2pil', 'stream2cv', 'stream2pil', 'cv2stream', 'pil2stream', 'Grid', 'Color',
+    ],
+    '_palettes': ['CLOUD_TOPS_PALETTE'],
+    '_raster': [
+        'get_colormap_lut', 'value_limits', 'apply_colormap_lut', 'get_raster_image_stream', 'render_tiles',
+    ],
+    '_remap': [
+        'RemapPlan', 'get_remap_plan', 'remap', 'get_tiles_remap_plans', 'save_remap_plans', 'load_remap_plans',
+        'remap_plans_filepath', 'rebase_remap_plan', 'rebase_remap_plans', 'union_window', 'region_window', 'NEAREST',
+        'BILINEAR',
+    ],
+    '_true_colors': ['TrueColorEngine', 'compose_true_colors'],
+    '_pyramid': ['TilePyramid', 'PyramidGeometry', 'get_pyramid_geometry', 'downsample_level', 'TILE_SIZE'],
+})
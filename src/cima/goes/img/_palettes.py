@@ -1,17 +1,22 @@
+import functools
 import os
 
 from cima.goes.utils.load_cpt import load_cpt
-from matplotlib.colors import LinearSegmentedColormap
 
 
 LOCAL_BASE_PATH = os.path.dirname(os.path.abspath(__file__))
 
 
+@functools.lru_cache(maxsize=None)
 def _get_cloud_tops_palette():
+    from matplotlib.colors import LinearSegmentedColormap
     filepath = os.path.join(LOCAL_BASE_PATH, 'smn_topes.cpt')
     cpt = load_cpt(filepath)
     return LinearSegmentedColormap('cpt', cpt)
 
 
-CLOUD_TOPS_PALETTE = _get_cloud_tops_palette()
-
+def __getattr__(name: str):
+    # CLOUD_TOPS_PALETTE is built (parsing its CPT file) on first use, then kept
+    if name == 'CLOUD_TOPS_PALETTE':
+        return _get_cloud_tops_palette()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,197 @@
+import hashlib
+import math
+import posixpath
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
+from cima.goes.storage._file_systems import Storage
+from cima.goes.tiles import LatLonRegion, SatBandKey, get_dataset_key, get_data
+from cima.goes.tiles import band_key_as_string
+from cima.goes.img._remap import RemapPlan, NEAREST, get_lats_lons_remap_plan, region_window, remap
+from cima.goes.img._raster import get_colormap_lut, encode_values, value_limits
+
+
+TILE_SIZE = 256
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.0511287798
+
+TileKey = Tuple[int, int, int]
+
+
+def lon_to_tile_x(lon, zoom: int):
+    return (np.asarray(lon) + 180.) / 360. * (1 << zoom)
+
+
+def lat_to_tile_y(lat, zoom: int):
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    return (1. - np.arcsinh(np.tan(lat)) / math.pi) / 2. * (1 << zoom)
+
+
+def tile_x_to_lon(x, zoom: int):
+    return np.asarray(x) / (1 << zoom) * 360. - 180.
+
+
+def tile_y_to_lat(y, zoom: int):
+    return np.degrees(np.arctan(np.sinh(math.pi * (1. - 2. * np.asarray(y) / (1 << zoom)))))
+
+
+@dataclass
+class PyramidGeometry:
+    sat_band_key: SatBandKey
+    zoom: int
+    # Tile range at zoom (inclusive from, exclusive to)
+    x_from: int
+    x_to: int
+    y_from: int
+    y_to: int
+    # Gathers the zoom level raster (x_to - x_from, y_to - y_from tiles) from the dataset window
+    plan: RemapPlan
+
+
+def get_pyramid_geometry(dataset, region: LatLonRegion, zoom: int, tile_size: int = TILE_SIZE,
+                         method: str = NEAREST) -> PyramidGeometry:
+    '''
+    Tiles of zoom covering region and the remap plan of their Web Mercator raster
+    '''
+    last = (1 << zoom) - 1
+    x_from = int(np.clip(np.floor(lon_to_tile_x(region.lon_west, zoom)), 0, last))
+    x_to = int(np.clip(np.ceil(lon_to_tile_x(region.lon_east, zoom)), x_from + 1, last + 1))
+    y_from = int(np.clip(np.floor(lat_to_tile_y(region.lat_north, zoom)), 0, last))
+    y_to = int(np.clip(np.ceil(lat_to_tile_y(region.lat_south, zoom)), y_from + 1, last + 1))
+    # Pixel centers
+    xs = x_from + (np.arange((x_to - x_from) * tile_size) + 0.5) / tile_size
+    ys = y_from + (np.arange((y_to - y_from) * tile_size) + 0.5) / tile_size
+    lons, lats = np.meshgrid(tile_x_to_lon(xs, zoom), tile_y_to_lat(ys, zoom))
+    tiles_region = LatLonRegion(
+        lat_north=float(tile_y_to_lat(y_from, zoom)),
+        lat_south=float(tile_y_to_lat(y_to, zoom)),
+        lon_west=float(tile_x_to_lon(x_from, zoom)),
+        lon_east=float(tile_x_to_lon(x_to, zoom)))
+    window = region_window(dataset, tiles_region)
+    plan = get_lats_lons_remap_plan(dataset, lats, lons, window, region=tiles_region, method=method)
+    return PyramidGeometry(get_dataset_key(dataset), zoom, x_from, x_to, y_from, y_to, plan)
+
+
+def downsample_level(values: np.ndarray, x_from: int, y_from: int, tile_size: int = TILE_SIZE):
+    '''
+    Next zoom out of a level raster whose first tile is (x_from, y_from):
+    padded to an even tile range, then the NaN aware mean of each 2x2 block.
+    Returns (values, x_from, y_from) of the new level.
+    '''
+    rows, cols = values.shape
+    top = (y_from % 2) * tile_size
+    left = (x_from % 2) * tile_size
+    bottom = -(rows + top) % (2 * tile_size)
+    right = -(cols + left) % (2 * tile_size)
+    if top or left or bottom or right:
+        values = np.pad(values, ((top, bottom), (left, right)), constant_values=np.nan)
+    rows, cols = values.shape
+    blocks = values.reshape(rows // 2, 2, cols // 2, 2)
+    valid = np.isfinite(blocks)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3), dtype=np.float32)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        level = np.where(count > 0, total / count, np.nan).astype(np.float32)
+    return level, x_from // 2, y_from // 2
+
+
+def iter_level_tiles(values: np.ndarray, zoom: int, x_from: int, y_from: int, tile_size: int = TILE_SIZE):
+    rows, cols = values.shape
+    for row in range(0, rows, tile_size):
+        for col in range(0, cols, tile_size):
+            yield (zoom, x_from + col // tile_size, y_from + row // tile_size), values[row:row + tile_size, col:col + tile_size]
+
+
+class TilePyramid(object):
+    '''
+    XYZ (slippy map, Web Mercator) tile pyramid of a region, written to any Storage
+    as path/z/x/y.format.
+    Only max_zoom is remapped from the scan, with a plan built once per SatBandKey;
+    every lower zoom is the 2x downsampling of the one above, before the palette.
+    Empty tiles are not written, nor tiles whose values didn't change since the
+    last scan this pyramid wrote to the same file.
+    '''
+    def __init__(self, storage: Storage, path: str, region: LatLonRegion, max_zoom: int, min_zoom: int = 0,
+                 cmap=None, lut: np.ndarray = None, vmin: float = None, vmax: float = None,
+                 method: str = NEAREST, format: str = 'png', tile_size: int = TILE_SIZE, workers: int = 4):
+        if lut is None:
+            if cmap is None:
+                raise Exception('A cmap or a lut is needed for the tiles')
+            lut = get_colormap_lut(cmap)
+        if vmin is not None and vmax is not None and not vmin < vmax:
+            raise Exception(f'Empty color scale: vmin {vmin} vmax {vmax}')
+        self.storage = storage
+        self.path = path
+        self.region = region
+        self.max_zoom = max_zoom
+        self.min_zoom = min_zoom
+        self.lut = lut
+        self.vmin = vmin
+        self.vmax = vmax
+        self.method = method
+        self.format = format
+        self.tile_size = tile_size
+        self.workers = workers
+        self._geometries: Dict[str, PyramidGeometry] = {}
+        # Last written digest of each tile file
+        self._digests: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def geometry(self, dataset) -> PyramidGeometry:
+        key = band_key_as_string(get_dataset_key(dataset))
+        if key not in self._geometries:
+            self._geometries[key] = get_pyramid_geometry(
+                dataset, self.region, self.max_zoom, tile_size=self.tile_size, method=self.method)
+        return self._geometries[key]
+
+    def tile_filepath(self, key: TileKey, path: str = None) -> str:
+        z, x, y = key
+        return posixpath.join(self.path if path is None else path, str(z), str(x), f'{y}.{self.format}')
+
+    def levels(self, dataset, variable: str = None):
+        '''
+        Yields (zoom, values, x_from, y_from) from max_zoom down to min_zoom
+        '''
+        geometry = self.geometry(dataset)
+        values = remap(get_data(dataset, geometry.plan.window, variable), geometry.plan)
+        x_from, y_from = geometry.x_from, geometry.y_from
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            yield zoom, values, x_from, y_from
+            if zoom > self.min_zoom:
+                values, x_from, y_from = downsample_level(values, x_from, y_from, self.tile_size)
+
+    def write(self, dataset, variable: str = None, path: str = None) -> List[str]:
+        '''
+        Writes the pyramid of one scan and returns the written file paths
+        '''
+        vmin, vmax = self.vmin, self.vmax
+        # A tile is unchanged if its values and the color scale are
+        scale = np.array([0 if vmin is None else vmin, 0 if vmax is None else vmax], dtype=np.float64).tobytes()
+        written = []
+
+        def write_tile(item):
+            key, values = item
+            if not np.isfinite(values).any():
+                return None
+            digest = hashlib.blake2b(values.tobytes(), digest_size=16, key=scale).digest()
+            filepath = self.tile_filepath(key, path)
+            with self._lock:
+                if self._digests.get(filepath) == digest:
+                    return None
+            stream = encode_values(values, format=self.format, lut=self.lut, vmin=vmin, vmax=vmax)
+            self.storage.upload_data(stream.getvalue(), filepath)
+            with self._lock:
+                self._digests[filepath] = digest
+            return filepath
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for zoom, values, x_from, y_from in self.levels(dataset, variable):
+                if vmin is None or vmax is None:
+                    # Scale of the whole max zoom raster, shared by every level
+                    vmin, vmax = value_limits(values, vmin, vmax)
+                    scale = np.array([vmin, vmax], dtype=np.float64).tobytes()
+                tiles = iter_level_tiles(values, zoom, x_from, y_from, self.tile_size)
+                written.extend(filepath for filepath in executor.map(write_tile, tiles) if filepath is not None)
+        return written
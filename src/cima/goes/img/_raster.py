@@ -0,0 +1,124 @@
+import io
+import concurrent.futures
+from typing import Dict, Tuple
+import cv2
+import numpy as np
+from cima.goes.tiles import TilesDict, get_data
+from cima.goes.img._remap import RemapPlan, RemapPlans, NEAREST, get_tiles_remap_plans, union_window, rebase_remap_plans
+from cima.goes.img._remap import flat_window, remap, remap_flat
+
+
+LUT_SIZE = 256
+
+
+def get_colormap_lut(cmap, size: int = LUT_SIZE) -> np.ndarray:
+    # (size, 4) uint8 RGBA table of a matplotlib colormap
+    return np.round(cmap(np.linspace(0, 1, size)) * 255).astype(np.uint8)
+
+
+def value_limits(values: np.ndarray, vmin=None, vmax=None) -> Tuple[float, float]:
+    '''
+    vmin and vmax, the missing ones taken from the finite values (NaN if there are none)
+    '''
+    if vmin is None or vmax is None:
+        finite = values[np.isfinite(values)]
+        if vmin is None:
+            vmin = float(finite.min()) if finite.size else np.nan
+        if vmax is None:
+            vmax = float(finite.max()) if finite.size else np.nan
+    return vmin, vmax
+
+
+def apply_colormap_lut(values, lut: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    '''
+    Maps values to RGBA with a LUT. NaN values are transparent.
+    With an empty or non finite [vmin, vmax] range every finite value gets the first LUT color.
+    '''
+    size = lut.shape[0]
+    values = np.asarray(values)
+    valid = np.isfinite(values)
+    if not valid.any():
+        return np.zeros(values.shape + lut.shape[1:], dtype=lut.dtype)
+    if not (np.isfinite(vmin) and np.isfinite(vmax) and vmax > vmin):
+        rgba = lut[np.zeros(values.shape, dtype=np.intp)]
+        rgba[~valid, 3] = 0
+        return rgba
+    scaled = np.where(valid, values, vmin).astype(np.float32)
+    scaled -= vmin
+    scaled *= (size - 1) / float(vmax - vmin)
+    np.clip(scaled, 0, size - 1, out=scaled)
+    rgba = lut[np.rint(scaled).astype(np.intp)]
+    rgba[~valid, 3] = 0
+    return rgba
+
+
+def encode_image(rgba: np.ndarray, format='png') -> io.BytesIO:
+    if rgba.shape[2] == 4 and format.lower() == 'png':
+        image = cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA)
+    elif rgba.shape[2] == 4:
+        image = cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+    else:
+        image = cv2.cvtColor(rgba, cv2.COLOR_RGB2BGR)
+    ok, encoded = cv2.imencode(f'.{format}', image)
+    if not ok:
+        raise Exception(f'Could not encode image as {format}')
+    buffer = io.BytesIO(encoded.tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+def encode_values(values: np.ndarray, format='png', lut: np.ndarray = None, vmin=None, vmax=None) -> io.BytesIO:
+    if values.ndim == 3:
+        valid = np.isfinite(values).all(axis=2)
+        rgba = np.zeros(values.shape[:2] + (4,), dtype=np.uint8)
+        rgba[..., :3] = np.clip(np.nan_to_num(values) * 255, 0, 255)
+        rgba[..., 3] = np.where(valid, 255, 0)
+        return encode_image(rgba, format=format)
+    vmin, vmax = value_limits(values, vmin, vmax)
+    return encode_image(apply_colormap_lut(values, lut, vmin, vmax), format=format)
+
+
+def get_raster_image_stream(data, plan: RemapPlan, format='png', cmap=None, vmin=None, vmax=None,
+                            lut: np.ndarray = None) -> io.BytesIO:
+    '''
+    Fast alternative to get_image_stream for PlateCarree output:
+    a gather through the remap plan (get_remap_plan, data is the plan window),
+    a colormap LUT and direct encoding, without matplotlib.
+    RGB data (3D, values in 0..1) is encoded as is.
+    '''
+    values = remap(data, plan)
+    if values.ndim == 2 and lut is None:
+        if cmap is None:
+            raise Exception('A cmap or a lut is needed for one band images')
+        lut = get_colormap_lut(cmap)
+    return encode_values(values, format=format, lut=lut, vmin=vmin, vmax=vmax)
+
+
+def render_tiles(dataset, tiles: TilesDict, variable: str = None, format='png',
+                 cmap=None, vmin=None, vmax=None, lut: np.ndarray = None,
+                 plans: RemapPlans = None, method: str = NEAREST, workers: int = 1) -> Dict[Tuple[int, int], io.BytesIO]:
+    '''
+    Renders every tile of tiles from one read of the union window of all of them.
+    Plans (from get_tiles_remap_plans, or loaded) can be reused between scans.
+    vmin/vmax default to the range of the whole window, so tiles share the scale.
+    '''
+    if plans is None:
+        plans = get_tiles_remap_plans(dataset, tiles, method=method)
+    window = union_window(plans[key].window for key in tiles)
+    data = get_data(dataset, window, variable)
+    flat = flat_window(data)
+    if lut is None:
+        if cmap is None:
+            raise Exception('A cmap or a lut is needed for one band images')
+        lut = get_colormap_lut(cmap)
+    vmin, vmax = value_limits(flat, vmin, vmax)
+    rebased = rebase_remap_plans(plans, tiles.keys(), window)
+
+    def render(key):
+        values = remap_flat(flat, rebased[key])
+        return key, encode_values(values, format=format, lut=lut, vmin=vmin, vmax=vmax)
+
+    if workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(render, tiles.keys()))
+    return dict(render(key) for key in tiles.keys())
@@ -0,0 +1,258 @@
+import collections
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass, asdict, astuple
+from typing import Dict, Iterable, Tuple
+import numpy as np
+from cima.goes.storage._file_systems import Storage
+from cima.goes.tiles import LatLonRegion, RegionIndexes, SatBandKey, TilesDict
+from cima.goes.tiles import get_dataset_key, band_key_as_string, get_tile_extent
+from cima.goes.tiles import lats_lons_to_pixels, project_region_indexes
+
+
+NEAREST = 'nearest'
+BILINEAR = 'bilinear'
+
+# (SatBandKey, union window) entries kept by rebase_remap_plans
+REBASED_PLANS_CACHE_SIZE = 16
+
+
+@dataclass
+class RemapPlan:
+    sat_band_key: SatBandKey
+    region: LatLonRegion
+    # Window of the dataset the plan reads from
+    window: RegionIndexes
+    # Output (height, width)
+    shape: Tuple[int, int]
+    method: str
+    # (pixels, 1) for nearest or (pixels, 4) for bilinear flat window indexes, -1 where there is no data
+    indexes: np.ndarray
+    # (pixels, 4) bilinear weights, None for nearest
+    weights: np.ndarray = None
+
+
+RemapPlans = Dict[Tuple[int, int], RemapPlan]
+
+
+def get_remap_plan(dataset, region: LatLonRegion, window: RegionIndexes = None,
+                   width: int = None, height: int = None, method: str = NEAREST, trim_excess=0) -> RemapPlan:
+    '''
+    Source -> destination pixel mapping of a regular lat/lon raster over region.
+    Built once per SatBandKey and region, then every scan is remapped with one gather.
+    '''
+    if window is None:
+        window = region_window(dataset, region)
+    rows = window.y_max - window.y_min
+    cols = window.x_max - window.x_min
+    width = cols if width is None else width
+    height = rows if height is None else height
+    lon_west, lon_east, lat_south, lat_north = get_tile_extent(region, trim_excess=trim_excess)
+    lons = lon_west + (np.arange(width) + 0.5) * ((lon_east - lon_west) / width)
+    lats = lat_north - (np.arange(height) + 0.5) * ((lat_north - lat_south) / height)
+    lons, lats = np.meshgrid(lons, lats)
+    return get_lats_lons_remap_plan(dataset, lats, lons, window, region=region, method=method)
+
+
+def region_window(dataset, region: LatLonRegion) -> RegionIndexes:
+    # project_region_indexes gives the last row and column of the region, a window ends after them
+    indexes = project_region_indexes(dataset, region)
+    dataset_key = get_dataset_key(dataset)
+    return RegionIndexes(
+        x_min=indexes.x_min,
+        x_max=min(indexes.x_max + 1, dataset_key.x_size),
+        y_min=indexes.y_min,
+        y_max=min(indexes.y_max + 1, dataset_key.y_size))
+
+
+def get_lats_lons_remap_plan(dataset, lats: np.ndarray, lons: np.ndarray, window: RegionIndexes,
+                             region: LatLonRegion = None, method: str = NEAREST) -> RemapPlan:
+    '''
+    Remap plan of an output raster of any projection, given the lat/lon of its pixel centers (2D)
+    '''
+    rows = window.y_max - window.y_min
+    cols = window.x_max - window.x_min
+    x_pixels, y_pixels = lats_lons_to_pixels(dataset, lats, lons)
+    x_pixels = x_pixels.ravel() - window.x_min
+    y_pixels = y_pixels.ravel() - window.y_min
+    valid = np.isfinite(x_pixels) & np.isfinite(y_pixels)
+    x_pixels = np.where(valid, x_pixels, -1)
+    y_pixels = np.where(valid, y_pixels, -1)
+    index_type = np.int32 if rows * cols < np.iinfo(np.int32).max else np.int64
+
+    if method == NEAREST:
+        x = np.rint(x_pixels).astype(np.int64)
+        y = np.rint(y_pixels).astype(np.int64)
+        inside = valid & (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+        indexes = np.where(inside, y * cols + x, -1)[:, np.newaxis]
+        weights = None
+    elif method == BILINEAR:
+        x0 = np.floor(x_pixels)
+        y0 = np.floor(y_pixels)
+        fx = (x_pixels - x0).astype(np.float32)
+        fy = (y_pixels - y0).astype(np.float32)
+        x0 = x0.astype(np.int64)
+        y0 = y0.astype(np.int64)
+        inside = valid & (x0 >= 0) & (y0 >= 0) & (x0 < cols) & (y0 < rows)
+        x1 = np.minimum(x0 + 1, cols - 1)
+        y1 = np.minimum(y0 + 1, rows - 1)
+        indexes = np.stack([y0 * cols + x0, y0 * cols + x1, y1 * cols + x0, y1 * cols + x1], axis=1)
+        indexes[~inside] = -1
+        weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], axis=1)
+    else:
+        raise Exception(f'Remap method not implemented: {method}')
+
+    return RemapPlan(
+        sat_band_key=get_dataset_key(dataset),
+        region=region,
+        window=window,
+        shape=lats.shape,
+        method=method,
+        indexes=indexes.astype(index_type),
+        weights=weights)
+
+
+def remap(data, plan: RemapPlan, fill_value=np.nan) -> np.ndarray:
+    '''
+    data: the plan window (2D, or 3D with channels last)
+    '''
+    return remap_flat(flat_window(data, fill_value), plan)
+
+
+def flat_window(data, fill_value=np.nan) -> np.ndarray:
+    # Flattened float32 window with the fill value appended, so index -1 reads it
+    if np.ma.isMaskedArray(data):
+        data = np.ma.filled(data.astype(np.float32), fill_value)
+    data = np.asarray(data, dtype=np.float32)
+    channels = data.shape[2:]
+    return np.concatenate([data.reshape((-1,) + channels), np.full((1,) + channels, fill_value, dtype=np.float32)])
+
+
+def remap_flat(flat: np.ndarray, plan: RemapPlan) -> np.ndarray:
+    channels = flat.shape[1:]
+    values = flat[plan.indexes]
+    if plan.weights is None:
+        values = values[:, 0]
+    else:
+        # NaN aware: weights of the non finite neighbours are dropped and the rest renormalized
+        valid = np.isfinite(values)
+        weights = plan.weights.reshape(plan.weights.shape + (1,) * len(channels)) * valid
+        total = weights.sum(axis=1)
+        values = (np.where(valid, values, 0) * weights).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(total > 0, values / total, np.nan).astype(np.float32)
+    return values.reshape(tuple(plan.shape) + channels)
+
+
+def union_window(windows) -> RegionIndexes:
+    windows = list(windows)
+    return RegionIndexes(
+        x_min=min(w.x_min for w in windows),
+        x_max=max(w.x_max for w in windows),
+        y_min=min(w.y_min for w in windows),
+        y_max=max(w.y_max for w in windows))
+
+
+def rebase_remap_plan(plan: RemapPlan, window: RegionIndexes) -> RemapPlan:
+    '''
+    Same plan reading from a larger window that contains plan.window
+    '''
+    cols = plan.window.x_max - plan.window.x_min
+    new_cols = window.x_max - window.x_min
+    new_rows = window.y_max - window.y_min
+    y = plan.indexes // cols + (plan.window.y_min - window.y_min)
+    x = plan.indexes % cols + (plan.window.x_min - window.x_min)
+    index_type = np.int32 if new_rows * new_cols < np.iinfo(np.int32).max else np.int64
+    indexes = np.where(plan.indexes >= 0, y * new_cols + x, -1).astype(index_type)
+    return RemapPlan(
+        sat_band_key=plan.sat_band_key,
+        region=plan.region,
+        window=window,
+        shape=plan.shape,
+        method=plan.method,
+        indexes=indexes,
+        weights=plan.weights)
+
+
+_rebased_plans = collections.OrderedDict()
+_rebased_plans_lock = threading.Lock()
+
+
+def rebase_remap_plans(plans: RemapPlans, keys: Iterable[Tuple[int, int]], window: RegionIndexes) -> RemapPlans:
+    '''
+    rebase_remap_plan of plans[key] for every key, cached per (SatBandKey, window)
+    so the next scans of the same band and tiles reuse them.
+    A cached plan is only reused if it was rebased from the same indexes.
+    '''
+    rebased = {}
+    for key in keys:
+        plan = plans[key]
+        cache_key = (band_key_as_string(plan.sat_band_key), astuple(window))
+        with _rebased_plans_lock:
+            cached = _rebased_plans.get(cache_key, {}).get(key)
+        if cached is not None:
+            source, rebased_plan = cached
+            if source is plan.indexes or np.array_equal(source, plan.indexes):
+                rebased[key] = rebased_plan
+                continue
+        rebased[key] = rebase_remap_plan(plan, window)
+        with _rebased_plans_lock:
+            _rebased_plans.setdefault(cache_key, {})[key] = (plan.indexes, rebased[key])
+            _rebased_plans.move_to_end(cache_key)
+            while len(_rebased_plans) > REBASED_PLANS_CACHE_SIZE:
+                _rebased_plans.popitem(last=False)
+    return rebased
+
+
+def get_tiles_remap_plans(dataset, tiles: TilesDict, method: str = NEAREST,
+                          width: int = None, height: int = None, trim_excess=0) -> RemapPlans:
+    return {
+        key: get_remap_plan(dataset, region, width=width, height=height, method=method, trim_excess=trim_excess)
+        for key, region in tiles.items()
+    }
+
+
+def remap_plans_filepath(tiles_filepath: str, sat_band_key: SatBandKey) -> str:
+    base, _ = os.path.splitext(tiles_filepath)
+    return f'{base}.{band_key_as_string(sat_band_key).replace("#", "_")}.remap.npz'
+
+
+def save_remap_plans(plans: RemapPlans, storage: Storage, filepath: str):
+    arrays = {}
+    meta = {}
+    for key, plan in plans.items():
+        name = f'{key[0]}_{key[1]}'
+        meta[name] = {
+            'key': list(key),
+            'sat_band_key': asdict(plan.sat_band_key),
+            'region': asdict(plan.region),
+            'window': asdict(plan.window),
+            'shape': list(plan.shape),
+            'method': plan.method,
+        }
+        arrays[f'{name}.indexes'] = plan.indexes
+        if plan.weights is not None:
+            arrays[f'{name}.weights'] = plan.weights
+    arrays['meta'] = np.array(json.dumps(meta))
+    stream = io.BytesIO()
+    np.savez_compressed(stream, **arrays)
+    storage.upload_data(stream.getvalue(), filepath)
+
+
+def load_remap_plans(storage: Storage, filepath: str) -> RemapPlans:
+    data = np.load(io.BytesIO(storage.download_data(filepath)), allow_pickle=False)
+    meta = json.loads(str(data['meta']))
+    plans = {}
+    for name, v in meta.items():
+        weights_name = f'{name}.weights'
+        plans[tuple(v['key'])] = RemapPlan(
+            sat_band_key=SatBandKey(**v['sat_band_key']),
+            region=LatLonRegion(**v['region']),
+            window=RegionIndexes(**v['window']),
+            shape=tuple(v['shape']),
+            method=v['method'],
+            indexes=data[f'{name}.indexes'],
+            weights=data[weights_name] if weights_name in data.files else None)
+    return plans
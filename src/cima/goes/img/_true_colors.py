@@ -0,0 +1,104 @@
+from typing import Dict, Tuple
+import cv2
+import numpy as np
+from cima.goes.tiles import RegionIndexes
+
+
+GREEN_RED = 0.48358168
+GREEN_BLUE = 0.45706946
+GREEN_VEGGIE = 0.06038137
+GAMMA_LUT_SIZE = 1 << 16
+
+
+class TrueColorEngine(object):
+    '''
+    True color composition in float32 with buffers reused between frames.
+    Each channel is clipped and gamma corrected (through a LUT on the input
+    quantized to lut_size levels) at its own resolution, and resized to the
+    output shape once. Masked or NaN values become 0.
+    gamma=2.2 and contrast=None reproduce compose_rgb, gamma=1/0.4 and contrast=125 get_true_colors.
+    '''
+    def __init__(self, shape: Tuple[int, int], gamma: float = 2.2, contrast: float = None,
+                 lut_size: int = GAMMA_LUT_SIZE):
+        self.shape = tuple(shape)
+        self.gamma = gamma
+        self.contrast = contrast
+        self.lut_size = lut_size
+        self.gamma_lut = np.power(np.linspace(0, 1, lut_size, dtype=np.float32), 1 / gamma).astype(np.float32)
+        rows, cols = self.shape
+        # Planar red, green, blue
+        self.planes = np.empty((3, rows, cols), dtype=np.float32)
+        self.rgb = np.empty((rows, cols, 3), dtype=np.float32)
+        self.rgb_uint8 = np.empty((rows, cols, 3), dtype=np.uint8)
+        self._veggie = np.empty((rows, cols), dtype=np.float32)
+        self._scratch: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _scratch_buffers(self, shape):
+        if shape not in self._scratch:
+            self._scratch[shape] = (np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.intp))
+        return self._scratch[shape]
+
+    def _channel(self, data, out: np.ndarray):
+        values, indexes = self._scratch_buffers(data.shape)
+        np.copyto(values, np.ma.getdata(data), casting='unsafe')
+        mask = np.ma.getmask(data)
+        if mask is not np.ma.nomask:
+            np.copyto(values, 0, where=mask)
+        # fmax/fmin clip and turn NaN into 0 without temporaries
+        np.fmax(values, 0, out=values)
+        np.fmin(values, 1, out=values)
+        values *= self.lut_size - 1
+        np.rint(values, out=values)
+        np.copyto(indexes, values, casting='unsafe')
+        # intp indexes and mode='clip' let take write into out without a temporary
+        np.take(self.gamma_lut, indexes, out=values, mode='clip')
+        if values.shape == out.shape:
+            np.copyto(out, values)
+        else:
+            cv2.resize(values, dsize=(out.shape[1], out.shape[0]), dst=out, interpolation=cv2.INTER_CUBIC)
+
+    def compose(self, red, veggie, blue, as_uint8: bool = False) -> np.ndarray:
+        '''
+        Returns a (rows, cols, 3) array, valid until the next compose call
+        '''
+        red_plane, green_plane, blue_plane = self.planes
+        self._channel(red, red_plane)
+        self._channel(veggie, self._veggie)
+        self._channel(blue, blue_plane)
+
+        # Calculate the "True" Green
+        np.multiply(self._veggie, GREEN_VEGGIE, out=green_plane)
+        np.multiply(red_plane, GREEN_RED, out=self._veggie)
+        green_plane += self._veggie
+        np.multiply(blue_plane, GREEN_BLUE, out=self._veggie)
+        green_plane += self._veggie
+
+        if self.contrast is not None:
+            factor = (259 * (self.contrast + 255)) / (255. * 259 - self.contrast)
+            self.planes -= 0.5
+            self.planes *= factor
+            self.planes += 0.5
+        np.clip(self.planes, 0, 1, out=self.planes)
+
+        if as_uint8:
+            self.planes *= 255
+            self.planes += 0.5
+            np.copyto(self.rgb_uint8, self.planes.transpose(1, 2, 0), casting='unsafe')
+            return self.rgb_uint8
+        np.copyto(self.rgb, self.planes.transpose(1, 2, 0))
+        return self.rgb
+
+
+def compose_true_colors(dataset_red, dataset_veggie, dataset_blue,
+                        tile_red: RegionIndexes, tile_veggie: RegionIndexes, tile_blue: RegionIndexes,
+                        as_uint8: bool = False, engine: TrueColorEngine = None) -> np.ndarray:
+    '''
+    compose_rgb through a TrueColorEngine. Pass the same engine between frames to reuse its buffers.
+    '''
+    red_shape = (tile_red.y_max - tile_red.y_min, tile_red.x_max - tile_red.x_min)
+    if engine is None or engine.shape != red_shape:
+        engine = TrueColorEngine(red_shape)
+    red = dataset_red.variables['CMI'][tile_red.y_min: tile_red.y_max, tile_red.x_min: tile_red.x_max]
+    veggie = dataset_veggie.variables['CMI'][tile_veggie.y_min: tile_veggie.y_max, tile_veggie.x_min: tile_veggie.x_max]
+    blue = dataset_blue.variables['CMI'][tile_blue.y_min: tile_blue.y_max, tile_blue.x_min: tile_blue.x_max]
+    return engine.compose(red, veggie, blue, as_uint8=as_uint8)
@@ -1 +1,14 @@
-from cima.goes.projects._project import *
\ No newline at end of file
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562)
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_project': [
+        'HoursRange', 'DatesRange', 'BatchProcess', 'ProcessCall', 'DAY_UNIT', 'HOUR_UNIT',
+        'GOES_STORAGE_RESOURCE', 'STORAGE_RESOURCE', 'SHARED_ARRAYS_RESOURCE',
+        # Used to be exported by "from _project import *"
+        'ProductBand', 'Product', 'Band', 'GoesBlob', 'GoesStorage', 'Storage', 'StorageInfo', 'Prefetch',
+    ],
+    '_watcher': ['ScanWatcher'],
+    '_journal': ['ProgressJournal'],
+    '_shards': ['NodeSharding', 'ShardLeases', 'ShardQueue', 'shard_units', 'HASH_SHARDING', 'BLOCK_SHARDING'],
+})
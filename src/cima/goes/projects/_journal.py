@@ -0,0 +1,185 @@
+import datetime
+import glob
+import os
+import re
+import time
+from typing import Dict, List, Set, Tuple
+from cima.goes.storage._file_systems import Storage
+
+DateHour = Tuple[datetime.date, int]
+
+JOURNAL_EXTENSION = '.journal'
+# Next to each local file, how much of it is already in the remote log
+OFFSET_EXTENSION = '.offset'
+
+
+class ProgressJournal(object):
+    '''
+    Append only journal of the completed (date, hour) of a DatesRange.
+    Workers record in a local file of their own process, without locks or network.
+    The parent process appends what is new in those files to the remote log
+    (log_storage, f'{log_path}/{name}.log') in batches, at most every flush_interval seconds,
+    and keeps the flushed size of each file in file.offset, so files left by a previous run
+    are not sent again.
+    Lines keep the format of the previous text log, so old logs resume too.
+    '''
+    def __init__(self, name: str, local_path: str, log_storage: Storage = None, log_path: str = '',
+                 flush_interval: float = 60):
+        self.name = name
+        self.local_path = local_path
+        self.log_storage = log_storage
+        self.log_path = log_path
+        self.flush_interval = flush_interval
+        self._offsets: Dict[str, int] = {}
+        self._notes: List[str] = []
+        self._last_flush = time.monotonic()
+
+    def __getstate__(self):
+        # Workers only record: no storage and no flush state
+        return {'name': self.name, 'local_path': self.local_path, 'log_storage': None, 'log_path': self.log_path,
+                'flush_interval': self.flush_interval, '_offsets': {}, '_notes': [], '_last_flush': 0}
+
+    @property
+    def remote_filepath(self) -> str:
+        return f'{self.log_path}/{self.name}.log'
+
+    def local_filepath(self, pid: int = None) -> str:
+        return os.path.join(self.local_path, f'{self.name}.{os.getpid() if pid is None else pid}{JOURNAL_EXTENSION}')
+
+    #
+    # Worker side
+    #
+    def record(self, date: datetime.date, hour: int, text: str = None):
+        if text is None:
+            text = f'at {datetime.datetime.now().isoformat()}'
+        line = f'{date.isoformat()} {hour}# {text}\n'.encode('utf-8')
+        os.makedirs(self.local_path, exist_ok=True)
+        # One small O_APPEND write per line: nothing to lock, and a crash loses at most this line
+        fd = os.open(self.local_filepath(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    #
+    # Parent side
+    #
+    def note(self, text: str):
+        # Comment line (INIT, RESUMED...), sent with the next flush
+        self._notes.append(f'# {text}\n')
+
+    def completed(self) -> Set[DateHour]:
+        '''
+        (date, hour) recorded in the remote log or in any local journal file
+        '''
+        data = b''
+        if self.log_storage is not None:
+            try:
+                data = self.log_storage.download_data(self.remote_filepath)
+            except Exception as e:
+                msg = str(e).replace('\n', '# ')
+                self.note(f'INIT {datetime.datetime.now().isoformat()} {msg}')
+        lines = data.decode('utf-8').splitlines()
+        for filepath in self._local_files():
+            with open(filepath, mode='rb') as f:
+                lines.extend(f.read().decode('utf-8').splitlines())
+        return {date_hour for date_hour in map(_parse_line, lines) if date_hour is not None}
+
+    def remaining(self, dates_and_hours: Dict[datetime.date, List[int]]) -> Dict[datetime.date, List[int]]:
+        completed = self.completed()
+        remaining = {}
+        for date, hours in dates_and_hours.items():
+            hours = [hour for hour in hours if (date, hour) not in completed]
+            if hours:
+                remaining[date] = hours
+        return remaining
+
+    def flush(self, force: bool = False) -> int:
+        '''
+        Appends the new complete lines of the local files (and the notes) to the remote log.
+        Returns the number of bytes sent.
+        '''
+        if self.log_storage is None:
+            return 0
+        if not force and time.monotonic() - self._last_flush < self.flush_interval:
+            return 0
+        self._last_flush = time.monotonic()
+        batch = [note.encode('utf-8') for note in self._notes]
+        offsets = {}
+        for filepath in self._local_files():
+            offset = self._offset(filepath)
+            with open(filepath, mode='rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # Only whole lines: a worker may be writing the last one
+            end = data.rfind(b'\n') + 1
+            if end > 0:
+                batch.append(data[:end])
+                offsets[filepath] = offset + end
+        if not batch:
+            return 0
+        data = b''.join(batch)
+        self.log_storage.append_data(data, self.remote_filepath)
+        self._notes = []
+        self._offsets.update(offsets)
+        for filepath, offset in offsets.items():
+            _write_offset(filepath, offset)
+        return len(data)
+
+    def close(self):
+        '''
+        Last flush. Local files already in the remote log are removed.
+        '''
+        self.flush(force=True)
+        if self.log_storage is None:
+            return
+        for filepath in self._local_files():
+            if self._offset(filepath) == os.path.getsize(filepath):
+                os.remove(filepath)
+                _remove(filepath + OFFSET_EXTENSION)
+                self._offsets.pop(filepath, None)
+
+    def _offset(self, filepath: str) -> int:
+        if filepath not in self._offsets:
+            self._offsets[filepath] = _read_offset(filepath)
+        return self._offsets[filepath]
+
+    def _local_files(self) -> List[str]:
+        # name.pid.journal of every process
+        pattern = re.compile(re.escape(self.name) + r'\.\d+' + re.escape(JOURNAL_EXTENSION))
+        filepaths = glob.glob(os.path.join(glob.escape(self.local_path), f'{glob.escape(self.name)}.*{JOURNAL_EXTENSION}'))
+        return sorted(f for f in filepaths if pattern.fullmatch(os.path.basename(f)))
+
+
+def _read_offset(filepath: str) -> int:
+    try:
+        with open(filepath + OFFSET_EXTENSION, mode='r') as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_offset(filepath: str, offset: int):
+    # Replaced atomically: a crash leaves the previous offset (those lines are sent again)
+    tmp_filepath = f'{filepath}{OFFSET_EXTENSION}.{os.getpid()}.tmp'
+    with open(tmp_filepath, mode='w') as f:
+        f.write(str(offset))
+    os.replace(tmp_filepath, filepath + OFFSET_EXTENSION)
+
+
+def _remove(filepath: str):
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+def _parse_line(line: str):
+    # 'YYYY-MM-DD H# ...'
+    if not line or line[0] == '#':
+        return None
+    try:
+        date, hour = line.split('#')[0].split(' ')[:2]
+        return datetime.date.fromisoformat(date), int(hour)
+    except ValueError:
+        return None
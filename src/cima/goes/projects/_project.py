@@ -1,15 +1,22 @@
 import datetime
+import hashlib
 import os
+import tempfile
 from dataclasses import dataclass
 from typing import List, Callable, Any, Dict, Tuple, Union
-from multiprocessing import Lock, Manager
+import numpy as np
 
 from cima.goes import ProductBand, Product, Band
 from cima.goes.storage import GoesBlob, GoesStorage, mount_goes_storage
 from cima.goes.storage import StorageInfo
 from cima.goes.storage import mount_storage
+from cima.goes.storage import Prefetch, prefetch_blobs, PrefetchedGoesStorage, GroupedBandBlobs
+from cima.goes.storage import IndexedGoesStorage
 from cima.goes.storage._file_systems import Storage
-from cima.goes.tasks import run_concurrent, Task
+from cima.goes.tasks import iter_concurrent, Task, worker_resource, set_worker_resource
+from cima.goes.tasks import SharedArrays, SharedArray, attach_shared_arrays
+from cima.goes.projects._journal import ProgressJournal
+from cima.goes.projects._shards import NodeSharding, ShardQueue, WorkUnit, shard_units
 from cima.goes.utils import start_time, diff_time
 
 
@@ -31,9 +38,39 @@ class DatesRange:
     name: str = 'X'
 
 
+# BatchProcess work units: one task per day, or per (day, hour)
+DAY_UNIT = 'day'
+HOUR_UNIT = 'hour'
+
+
+# Worker resources mounted by BatchProcess in every worker process
+GOES_STORAGE_RESOURCE = 'goes_storage'
+STORAGE_RESOURCE = 'storage'
+SHARED_ARRAYS_RESOURCE = 'shared_arrays'
+_BATCH_RESOURCE = 'cima.goes.batch'
+
+
 ProcessCall = Callable[[GoesStorage, int, int, int, int, int, Dict[Tuple[Product, Band], GoesBlob], List[Any], Dict[str, Any]], Any]
 
 
+def _hour_grouped_blobs(goes_storage: GoesStorage, bands: List[ProductBand], date: datetime.date, hours: List[int]):
+    for hour in hours:
+        grouped_blobs_list = goes_storage.grouped_one_hour_blobs(
+            date.year, date.month, date.day, hour,
+            bands)
+        for grouped_blobs in grouped_blobs_list:
+            yield hour, grouped_blobs
+        # End of hour mark
+        yield hour, None
+
+
+def _blobs_to_fetch(item: Tuple[int, GroupedBandBlobs]) -> List[GoesBlob]:
+    _, grouped_blobs = item
+    if grouped_blobs is None:
+        return []
+    return [bb.blobs[0] for bb in grouped_blobs.blobs]
+
+
 def _process_day(process: ProcessCall,
                  goes_storage: Union[StorageInfo, GoesStorage],
                  bands: List[ProductBand],
@@ -42,9 +79,8 @@ def _process_day(process: ProcessCall,
                  dates_range: DatesRange,
                  *args,
                  storage: Storage = None,
-                 _log_storage: Storage = None,
-                 _log_path: str = None,
-                 _lock: Lock = None,
+                 _journal: ProgressJournal = None,
+                 _prefetch: Prefetch = None,
                  **kwargs):
     if isinstance(goes_storage, StorageInfo):
         goes_storage = mount_goes_storage(goes_storage)
@@ -54,33 +90,88 @@ def _process_day(process: ProcessCall,
         kwargs['storage'] = storage
     results = []
 
+    hour_grouped_blobs = _hour_grouped_blobs(goes_storage, bands, date, hours)
+    if _prefetch is not None:
+        hour_grouped_blobs = prefetch_blobs(goes_storage, hour_grouped_blobs, _blobs_to_fetch, _prefetch)
+    else:
+        hour_grouped_blobs = ((item, None) for item in hour_grouped_blobs)
+
     # Process loop
     current_time = start_time()
-    for hour in hours:
-        grouped_blobs_list = goes_storage.grouped_one_hour_blobs(
-            date.year, date.month, date.day, hour,
-            bands)
-        for grouped_blobs in grouped_blobs_list:
+    for (hour, grouped_blobs), blobs_data in hour_grouped_blobs:
+        if grouped_blobs is not None:
             minute = int(grouped_blobs.start[9:11])
-            hour = int(grouped_blobs.start[7:9])
+            start_hour = int(grouped_blobs.start[7:9])
             result = process(
-                goes_storage,
-                date.year, date.month, date.day, hour, minute,
+                goes_storage if blobs_data is None else PrefetchedGoesStorage(goes_storage, blobs_data),
+                date.year, date.month, date.day, start_hour, minute,
                 {(bb.product, bb.band): bb.blobs[0] for bb in grouped_blobs.blobs},
                 *args,
                 **kwargs
             )
             if result is not None:
                 results.append(result)
-        if _log_storage is not None:
-            if isinstance(_log_storage, StorageInfo):
-                _log_storage = mount_storage(_log_storage)
-            _log_processed(f'{date.isoformat()} {hour}# at {datetime.datetime.now().isoformat()} ({diff_time(current_time)})',
-                           dates_range, _log_storage, _log_path, _lock)
+            continue
+        if _journal is not None:
+            _journal.record(date, hour, f'at {datetime.datetime.now().isoformat()} ({diff_time(current_time)})')
             print(f'Completed {date.isoformat()} {hour} at {datetime.datetime.now().isoformat()} ({diff_time(current_time)})')
     return results
 
 
+@dataclass
+class _ShardResult:
+    shard: int
+    results: List[Any] = None
+    error: Exception = None
+    units: List[WorkUnit] = None
+
+
+@dataclass
+class _BatchContext:
+    # What every task of a run shares, sent once to each worker process
+    process: ProcessCall
+    goes_storage: Union[StorageInfo, GoesStorage]
+    bands: List[ProductBand]
+    args: Tuple
+    kwargs: Dict[str, Any]
+    storage: Union[StorageInfo, Storage] = None
+    prefetch: Prefetch = None
+    shared_arrays: Dict[str, SharedArray] = None
+
+
+def _init_batch_worker(context: _BatchContext, initializer: Callable = None, initargs: Tuple = ()):
+    # Storages are mounted once per worker process, not once per task
+    if isinstance(context.goes_storage, StorageInfo):
+        context.goes_storage = mount_goes_storage(context.goes_storage)
+    if isinstance(context.storage, StorageInfo):
+        context.storage = mount_storage(context.storage)
+    set_worker_resource(GOES_STORAGE_RESOURCE, context.goes_storage)
+    set_worker_resource(STORAGE_RESOURCE, context.storage)
+    if context.shared_arrays is not None:
+        # Views of the parent's shared memory, not copies
+        shared_arrays = attach_shared_arrays(context.shared_arrays)
+        context.kwargs = dict(context.kwargs, shared_arrays=shared_arrays)
+        set_worker_resource(SHARED_ARRAYS_RESOURCE, shared_arrays)
+    set_worker_resource(_BATCH_RESOURCE, context)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _process_batch_unit(shard: int, index: int, date: datetime.date, hours: List[int], dates_range: DatesRange,
+                        journal: ProgressJournal = None):
+    context: _BatchContext = worker_resource(_BATCH_RESOURCE)
+    if shard is None:
+        return _process_day(context.process, context.goes_storage, context.bands, date, hours, dates_range,
+                            *context.args, storage=context.storage, _journal=journal, _prefetch=context.prefetch,
+                            **context.kwargs)
+    # The parent needs the shard and units of every result (or failure) to record them
+    try:
+        results = _process_batch_unit(None, index, date, hours, dates_range, journal)
+        return _ShardResult(shard, results, units=[(index, date, hour) for hour in hours])
+    except Exception as e:
+        return _ShardResult(shard, error=e)
+
+
 def _get_dates_and_hours(date_range: DatesRange):
     dates = {}
     current_date = date_range.from_date
@@ -94,51 +185,6 @@ def _get_dates_and_hours(date_range: DatesRange):
     return dates
 
 
-def _get_resumed_range(
-        dates_range: DatesRange,
-        log_storage: Storage,
-        log_path: str,
-        ) -> Dict[datetime.date, List[int]]:
-    filepath = f'{log_path}/{dates_range.name}.log'
-    dates_and_hours = _get_dates_and_hours(dates_range)
-    try:
-        data = log_storage.download_data(filepath)
-        data = data.decode("utf-8").splitlines()
-        data_datetime = set([el.split('#')[0] for el in data if el[0] != '#'])
-        data_per_date = {}
-        if len(data) > 0:
-            for dt in data_datetime:
-                d, t = dt.split(' ')
-                if d not in data_per_date:
-                    data_per_date[d] = [t]
-                else:
-                    data_per_date[d].append(t)
-            for d, hours in data_per_date.items():
-                year, month, day = map(int, d.split('-'))
-                date = datetime.date(year=year, month=month, day=day)
-                if date in dates_and_hours:
-                    for hour in data_per_date[d]:
-                        dates_and_hours[date].remove(int(hour))
-        return dates_and_hours
-    except Exception as e:
-        msg = str(e).replace('\n', '# ')
-        init_str = f'# INIT {datetime.datetime.now().isoformat()} {msg}\n'
-        log_storage.upload_data(bytes(init_str, 'utf-8'), filepath)
-        return dates_and_hours
-
-
-def _log_processed(
-        text: str,
-        dates_range,
-        log_storage: Storage,
-        log_path: str,
-        lock: Lock,
-        ) -> DatesRange:
-    filepath = f'{log_path}/{dates_range.name}.log'
-    with lock:
-        log_storage.append_data(bytes(text+'\n', 'utf-8'), filepath)
-
-
 class BatchProcess(object):
     def __init__(self,
                  goes_storage: GoesStorage,
@@ -147,75 +193,200 @@ class BatchProcess(object):
                  log_storage: Storage = None,
                  log_base_path: str = '',
                  machine_id: str = '',
+                 listing_path: str = None,
+                 journal_path: str = None,
+                 flush_interval: float = 60,
+                 sharding: NodeSharding = None,
                  ):
         self.bands = bands
         self.dates_ranges = dates_ranges
+        if listing_path is not None:
+            # One listing per (product, day) instead of one per hour and band
+            goes_storage = IndexedGoesStorage(goes_storage, listing_path)
         self.goes_storage = goes_storage
         self.log_storage = log_storage
         self.machine_id = machine_id
         self.log_base_path = log_base_path
         self.log_path = os.path.join(f'{log_base_path}', f'{machine_id}')
+        if journal_path is None:
+            # One directory per log_path: projects on the same host don't resume or flush each other's files
+            digest = hashlib.sha1(self.log_path.encode('utf-8')).hexdigest()
+            journal_path = os.path.join(tempfile.gettempdir(), 'cima_goes_journal', digest)
+        # Local progress journal files, flushed to log_storage every flush_interval seconds
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        # Split of the work between nodes, None to process every range here
+        self.sharding = sharding
 
-    def run(self, process: ProcessCall, *args, workers=1, storage: Storage=None, **kwargs):
-        tasks = []
-        results = []
-        manager = Manager()
-        lock = manager.Lock()
-        for range in self.dates_ranges:
-            # Check if resume range
-            dates_and_hours = []
-            if self.log_storage is not None:
-                last_from = range.from_date
-                dates_and_hours = _get_resumed_range(range, self.log_storage, self.log_path)
-                if dates_and_hours and last_from <= max(dates_and_hours.keys()):
-                    _log_processed(
-                        f'# RESUMED from {last_from.isoformat()} to {range.to_date} at {datetime.datetime.now().isoformat()}',
-                        range, self.log_storage, self.log_path, lock)
-            else:
-                dates_and_hours = _get_dates_and_hours(range)
-
-            if not dates_and_hours:
-                _log_processed(
-                    f'# NOTHING TO DO from {range.from_date} to {range.to_date} at {datetime.datetime.now().isoformat()}',
-                    range, self.log_storage, self.log_path, lock)
-            else:
+    def run(self, process: ProcessCall, *args, workers=1, storage: Storage=None, prefetch: Prefetch = None,
+            max_in_flight: int = None, max_tasks_per_child: int = None, work_unit: str = HOUR_UNIT,
+            initializer: Callable = None, initargs: Tuple = (), shared_arrays: Union[SharedArrays, Dict[str, np.ndarray]] = None,
+            **kwargs):
+        return list(self.iter_run(process, *args, workers=workers, storage=storage, prefetch=prefetch,
+                                  max_in_flight=max_in_flight, max_tasks_per_child=max_tasks_per_child,
+                                  work_unit=work_unit, initializer=initializer, initargs=initargs,
+                                  shared_arrays=shared_arrays, **kwargs))
+
+    def iter_run(self, process: ProcessCall, *args, workers=1, storage: Storage=None, prefetch: Prefetch = None,
+                 max_in_flight: int = None, max_tasks_per_child: int = None, work_unit: str = HOUR_UNIT,
+                 initializer: Callable = None, initargs: Tuple = (), shared_arrays: Union[SharedArrays, Dict[str, np.ndarray]] = None,
+                 **kwargs):
+        '''
+        Yields the results list of every work unit as it completes.
+        With workers > 1 the range is split in work_unit tasks (HOUR_UNIT by default,
+        so a short range still keeps every worker busy) that are handed to
+        free workers as they finish, at most max_in_flight pending at a time.
+        Worker processes are replaced every max_tasks_per_child tasks.
+        Each worker process gets process, args, kwargs and the storages once, mounts the
+        storages (as GOES_STORAGE_RESOURCE and STORAGE_RESOURCE worker resources) and then
+        runs initializer(*initargs), e.g. init_worker_resources to load palettes or caches;
+        tasks only carry their dates. With workers=1, initializer runs here, once.
+        shared_arrays (name: read only array) reach process as the shared_arrays keyword:
+        with workers > 1 they are copied once to shared memory and every worker gets views of it.
+        A SharedArrays (e.g. filled by share_lats_lons) is used as it is, without copies.
+        With sharding, only the shards this node claims are processed.
+        '''
+        if work_unit not in (DAY_UNIT, HOUR_UNIT):
+            raise Exception(f'Work unit not implemented: {work_unit}')
+        journals = {}
+        queue = None if self.sharding is None else ShardQueue(self.sharding)
+        shared = None
+        if workers > 1:
+            context = _BatchContext(
+                process, self.goes_storage.get_storage_info(), self.bands, args, kwargs,
+                storage=None if storage is None else storage.get_storage_info(), prefetch=prefetch)
+            if isinstance(shared_arrays, SharedArrays):
+                # Published by the caller, who closes them
+                context.shared_arrays = shared_arrays.handles
+            elif shared_arrays is not None:
+                shared = SharedArrays()
+                for key, array in shared_arrays.items():
+                    shared.publish(key, array)
+                context.shared_arrays = shared.handles
+        else:
+            if isinstance(shared_arrays, SharedArrays):
+                kwargs['shared_arrays'] = attach_shared_arrays(shared_arrays.handles)
+            elif shared_arrays is not None:
+                kwargs['shared_arrays'] = shared_arrays
+            if initializer is not None:
+                initializer(*initargs)
+        try:
+            while True:
                 if workers > 1:
-                    for date, hours in dates_and_hours.items():
-                        tasks.append(
-                            Task(
-                                _process_day,
-                                process,
-                                self.goes_storage.get_storage_info(),
-                                self.bands,
-                                date,
-                                hours,
-                                range,
-                                *args,
-                                storage=None if storage is None else storage.get_storage_info(),
-                                _log_storage=None if self.log_storage is None else self.log_storage.get_storage_info(),
-                                _log_path=self.log_path,
-                                _lock=lock,
-                        **kwargs)
-                        )
+                    results = iter_concurrent(
+                        self._tasks(journals, work_unit, queue), workers,
+                        max_in_flight=max_in_flight, max_tasks_per_child=max_tasks_per_child,
+                        initializer=_init_batch_worker, initargs=(context, initializer, initargs))
                 else:
-                    for date, hours in dates_and_hours.items():
-                        result = _process_day(
-                            process,
-                            self.goes_storage,
-                            self.bands,
-                            date,
-                            hours,
-                            range,
-                            *args,
-                            storage=storage,
-                            _log_storage=self.log_storage,
-                            _log_path=self.log_path,
-                            _lock=lock,
-                            **kwargs
-                        )
-                        if result is not None:
-                            results.append(result)
-
-        if tasks:
-            return run_concurrent(tasks, workers)
-        return results
+                    results = self._run_days(process, args, kwargs, storage, prefetch, journals, queue, work_unit)
+                for result in results:
+                    if isinstance(result, _ShardResult):
+                        queue.finished(result.shard, failed=result.error is not None, units=result.units)
+                        result = result.results if result.error is None else result.error
+                    for journal in journals.values():
+                        journal.flush()
+                    yield result
+                if queue is None or not queue.waiting:
+                    break
+                # Nothing in flight: wait for the shards of other nodes to end, or to expire and steal them
+                queue.wait()
+        finally:
+            for journal in journals.values():
+                journal.close()
+            if queue is not None:
+                queue.close()
+            if shared is not None:
+                shared.close()
+
+    def journal(self, dates_range: DatesRange) -> ProgressJournal:
+        return ProgressJournal(dates_range.name, self.journal_path, self.log_storage, self.log_path,
+                               flush_interval=self.flush_interval)
+
+    def _run_days(self, process: ProcessCall, args, kwargs, storage: Storage, prefetch: Prefetch,
+                  journals: Dict[str, ProgressJournal], queue: ShardQueue = None, work_unit: str = HOUR_UNIT):
+        for shard, index, range, date, hours in self._dates_and_hours(journals, queue):
+            # Sharded runs record every work unit in the shard lease as it ends
+            units = [[hour] for hour in hours] if shard is not None and work_unit == HOUR_UNIT else [hours]
+            for unit_hours in units:
+                if shard is not None:
+                    queue.started(shard)
+                try:
+                    result = _process_day(
+                        process,
+                        self.goes_storage,
+                        self.bands,
+                        date,
+                        unit_hours,
+                        range,
+                        *args,
+                        storage=storage,
+                        _journal=journals.get(range.name),
+                        _prefetch=prefetch,
+                        **kwargs
+                    )
+                except Exception:
+                    if shard is not None:
+                        queue.finished(shard, failed=True)
+                    raise
+                if shard is not None:
+                    queue.finished(shard, units=[(index, date, hour) for hour in unit_hours])
+                if result is not None:
+                    yield result
+
+    def _tasks(self, journals: Dict[str, ProgressJournal], work_unit: str, queue: ShardQueue = None):
+        for shard, index, range, date, hours in self._dates_and_hours(journals, queue):
+            units = [[hour] for hour in hours] if work_unit == HOUR_UNIT else [hours]
+            for unit_hours in units:
+                if shard is not None:
+                    queue.started(shard)
+                yield Task(_process_batch_unit, shard, index, date, unit_hours, range, journals.get(range.name))
+
+    def _dates_and_hours(self, journals: Dict[str, ProgressJournal], queue: ShardQueue = None):
+        # Yields (shard, range index, range, date, hours), shard is None without sharding
+        if queue is not None:
+            yield from self._sharded_dates_and_hours(journals, queue)
+            return
+        for index, range in enumerate(self.dates_ranges):
+            for date, hours in self._remaining(range, journals).items():
+                yield None, index, range, date, hours
+
+    def _sharded_dates_and_hours(self, journals: Dict[str, ProgressJournal], queue: ShardQueue):
+        units = [
+            (index, date, hour)
+            for index, range in enumerate(self.dates_ranges)
+            for date, hours in _get_dates_and_hours(range).items()
+            for hour in hours]
+        by_shard = shard_units(units, self.sharding.shards, self.sharding.method,
+                               names=[range.name for range in self.dates_ranges])
+        # Only the first pass leaves notes in the logs
+        note = queue.passes == 0
+        remaining = [self._remaining(range, journals, note) for range in self.dates_ranges]
+        for shard in queue.claimed():
+            # Units another node processed before this one claimed the shard are not in its journal
+            done = queue.done_units(shard)
+            shard_dates: Dict[Tuple[int, datetime.date], List[int]] = {}
+            for index, date, hour in by_shard[shard]:
+                if hour in remaining[index].get(date, ()) and (index, date, hour) not in done:
+                    shard_dates.setdefault((index, date), []).append(hour)
+            lost = False
+            for (index, date), hours in shard_dates.items():
+                if not queue.holds(shard):
+                    lost = True
+                    break
+                yield shard, index, self.dates_ranges[index], date, hours
+            queue.exhausted(shard, failed=lost)
+
+    def _remaining(self, range: DatesRange, journals: Dict[str, ProgressJournal],
+                   note: bool = True) -> Dict[datetime.date, List[int]]:
+        dates_and_hours = _get_dates_and_hours(range)
+        # Check if resume range
+        if self.log_storage is not None:
+            if range.name not in journals:
+                journals[range.name] = self.journal(range)
+            journal = journals[range.name]
+            dates_and_hours = journal.remaining(dates_and_hours)
+            if note and dates_and_hours:
+                journal.note(f'RESUMED from {range.from_date.isoformat()} to {range.to_date} at {datetime.datetime.now().isoformat()}')
+            elif note:
+                journal.note(f'NOTHING TO DO from {range.from_date} to {range.to_date} at {datetime.datetime.now().isoformat()}')
+        return dates_and_hours
@@ -0,0 +1,342 @@
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from cima.goes.storage._file_systems import Storage
+
+# Sharding methods of the (date, hour) work space
+HASH_SHARDING = 'hash'
+BLOCK_SHARDING = 'block'
+
+# (range index, date, hour)
+WorkUnit = Tuple[int, datetime.date, int]
+
+
+def shard_units(units: List[WorkUnit], shards: int, method: str = HASH_SHARDING,
+                names: List[str] = None) -> Dict[int, List[WorkUnit]]:
+    '''
+    Splits units in shards the same way on every node.
+    HASH_SHARDING: crc32 of 'name date hour' (names[range index], the range index by default).
+    BLOCK_SHARDING: contiguous blocks of the units, in order, of about the same size.
+    '''
+    by_shard: Dict[int, List[WorkUnit]] = {shard: [] for shard in range(shards)}
+    if method == HASH_SHARDING:
+        for unit in units:
+            index, date, hour = unit
+            name = str(index) if names is None else names[index]
+            by_shard[zlib.crc32(f'{name} {date.isoformat()} {hour}'.encode('utf-8')) % shards].append(unit)
+    elif method == BLOCK_SHARDING:
+        for i, unit in enumerate(units):
+            by_shard[i * shards // len(units)].append(unit)
+    else:
+        raise Exception(f'Sharding method not implemented: {method}')
+    return by_shard
+
+
+@dataclass
+class Lease:
+    token: str = None
+    node_id: str = None
+    expires: float = 0
+    done: bool = False
+    epoch: int = -1
+    # Units processed under this lease
+    units: Set[WorkUnit] = field(default_factory=set)
+
+    def is_live(self, now: float) -> bool:
+        return self.token is not None and self.expires > now
+
+
+def parse_lease(data: bytes, epoch: int = -1) -> Lease:
+    '''
+    Reads one claim file: its CLAIM line and what its holder appended after it.
+    RENEW extends the lease, UNIT records a processed unit, DONE ends the shard
+    and RELEASE gives it up (with its units still recorded).
+    '''
+    lease = Lease(epoch=epoch)
+    for line in data.decode('utf-8').splitlines():
+        fields = line.split(' ')
+        try:
+            if fields[0] == 'CLAIM' and lease.token is None and not lease.done:
+                lease.token, lease.node_id, lease.expires = fields[1], fields[2], float(fields[4])
+            elif fields[0] == 'RENEW' and fields[1] == lease.token:
+                lease.expires = float(fields[3])
+            elif fields[0] == 'UNIT':
+                lease.units.add((int(fields[1]), datetime.date.fromisoformat(fields[2]), int(fields[3])))
+            elif fields[0] == 'DONE' and fields[1] == lease.token:
+                lease.done = True
+            elif fields[0] == 'RELEASE' and fields[1] == lease.token and not lease.done:
+                lease.token = None
+        except (IndexError, ValueError):
+            # A partial line
+            pass
+    return lease
+
+
+class ShardLeases(object):
+    '''
+    Claim protocol over a Storage with create_data (an atomic create if missing, e.g. NFS).
+    Every claim of a shard is a new file, path/shard-{shard}-of-{shards}.{epoch}.lease:
+    nodes that see the shard free try to create the next epoch and only one can,
+    so the holder is the node that created the last epoch.
+    Only the holder appends to its file: RENEW, a UNIT line for every processed unit
+    (the next holders skip them, see done_units) and DONE or RELEASE at the end.
+    Leases last lease_seconds and are renewed by the holder; an expired lease can be
+    claimed by any node. Nodes are expected to have their clocks in sync (NTP),
+    with an error much smaller than lease_seconds.
+    '''
+    def __init__(self, storage: Storage, path: str, shards: int, node_id: str, lease_seconds: float = 600,
+                 clock: Callable[[], float] = time.time):
+        self.storage = storage
+        self.path = path
+        self.shards = shards
+        self.node_id = node_id.replace(' ', '_')
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self.held: Dict[int, Lease] = {}
+        # Units processed under earlier leases of the held shards
+        self.done_units: Dict[int, Set[WorkUnit]] = {}
+        self._lock = threading.Lock()
+
+    def filepath(self, shard: int, epoch: int) -> str:
+        return f'{self.path}/shard-{shard}-of-{self.shards}.{epoch}.lease'
+
+    def leases(self, shard: int) -> List[Lease]:
+        '''
+        Every claim of shard, in order: the last one is the current lease
+        '''
+        leases = []
+        while True:
+            try:
+                data = self.storage.download_data(self.filepath(shard, len(leases)))
+            except Exception:
+                # Not claimed again (yet)
+                return leases
+            leases.append(parse_lease(data, len(leases)))
+
+    def lease(self, shard: int) -> Lease:
+        leases = self.leases(shard)
+        return leases[-1] if leases else Lease()
+
+    def claim(self, shard: int) -> bool:
+        now = self.clock()
+        leases = self.leases(shard)
+        if leases and (leases[-1].done or leases[-1].is_live(now)):
+            return False
+        token = uuid.uuid4().hex
+        line = f'CLAIM {token} {self.node_id} {now:.3f} {now + self.lease_seconds:.3f}\n'
+        if not self.storage.create_data(line.encode('utf-8'), self.filepath(shard, len(leases))):
+            # Another node claimed it first
+            return False
+        with self._lock:
+            self.held[shard] = Lease(token, self.node_id, now + self.lease_seconds, epoch=len(leases))
+            self.done_units[shard] = set().union(*(lease.units for lease in leases))
+        return True
+
+    def holds(self, shard: int) -> bool:
+        with self._lock:
+            lease = self.held.get(shard)
+        return lease is not None and lease.is_live(self.clock())
+
+    def renew(self, force: bool = False) -> List[int]:
+        '''
+        Renews the held leases past half their time and returns the shards lost
+        '''
+        lost = []
+        with self._lock:
+            held = list(self.held.items())
+        for shard, lease in held:
+            now = self.clock()
+            if not force and lease.expires - now > self.lease_seconds / 2:
+                continue
+            self._append(shard, lease, f'RENEW {lease.token} {now:.3f} {now + self.lease_seconds:.3f}')
+            current = self.lease(shard)
+            with self._lock:
+                if current.token == lease.token and current.epoch == lease.epoch:
+                    self.held[shard] = current
+                else:
+                    self.held.pop(shard, None)
+                    lost.append(shard)
+        return lost
+
+    def units_done(self, shard: int, units: List[WorkUnit]):
+        with self._lock:
+            lease = self.held.get(shard)
+        if lease is not None and units:
+            lines = [f'UNIT {index} {date.isoformat()} {hour}' for index, date, hour in units]
+            self._append(shard, lease, '\n'.join(lines))
+
+    def done(self, shard: int):
+        self._end(shard, 'DONE')
+
+    def release(self, shard: int):
+        self._end(shard, 'RELEASE')
+
+    def _end(self, shard: int, action: str):
+        with self._lock:
+            lease = self.held.pop(shard, None)
+            self.done_units.pop(shard, None)
+        if lease is not None:
+            self._append(shard, lease, f'{action} {lease.token} {self.clock():.3f}')
+
+    def _append(self, shard: int, lease: Lease, lines: str):
+        # Only the holder appends to its claim file: one writer, no interleaving between nodes
+        self.storage.append_data(f'{lines}\n'.encode('utf-8'), self.filepath(shard, lease.epoch))
+
+
+@dataclass
+class NodeSharding:
+    '''
+    Splits the work of a BatchProcess between nodes (machines).
+    The (date, hour) units of all its DatesRange are split in shards (nodes * 4 by default)
+    with method, and node_index owns a contiguous run of them.
+    With a lease storage (one with create_data, e.g. NFS), shards are claimed under lease in path, and a node
+    that ends its own shards steals the others that are unclaimed or expired,
+    polling every poll_interval seconds until every shard is done. Without one, each node just processes its own shards.
+    '''
+    nodes: int
+    node_index: int
+    storage: Storage = None
+    path: str = 'shards'
+    shards: int = None
+    method: str = HASH_SHARDING
+    lease_seconds: float = 600
+    steal: bool = True
+    poll_interval: float = 60
+    node_id: str = None
+
+    def __post_init__(self):
+        if not 0 <= self.node_index < self.nodes:
+            raise Exception(f'Node index {self.node_index} out of range for {self.nodes} nodes')
+        if self.shards is None:
+            self.shards = self.nodes * 4
+        if self.node_id is None:
+            self.node_id = f'{socket.gethostname()}-{os.getpid()}-{self.node_index}'
+
+    def owner(self, shard: int) -> int:
+        return shard * self.nodes // self.shards
+
+    def own_shards(self) -> List[int]:
+        return [shard for shard in range(self.shards) if self.owner(shard) == self.node_index]
+
+    def leases(self) -> Optional[ShardLeases]:
+        if self.storage is None:
+            return None
+        return ShardLeases(self.storage, self.path, self.shards, self.node_id, self.lease_seconds)
+
+
+class ShardQueue(object):
+    '''
+    Shards of one node: claims them (own first), keeps their leases renewed from a thread
+    and marks each one done when its units ended, or releases it if one failed.
+    A shard released after a failure is not claimed again by this node.
+    '''
+    def __init__(self, sharding: NodeSharding):
+        self.sharding = sharding
+        self.leases = sharding.leases()
+        # Shards held by other nodes in the last pass
+        self.waiting: List[int] = []
+        self.passes = 0
+        self._pending: Dict[int, int] = {}
+        self._failed: Set[int] = set()
+        self._exhausted: Set[int] = set()
+        self._given_up: Set[int] = set()
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def claimed(self) -> Iterator[int]:
+        '''
+        One pass over the shards: yields every shard this node must process, as it claims it
+        '''
+        own = self.sharding.own_shards()
+        self.passes += 1
+        if self.leases is None:
+            yield from own
+            return
+        self._start_renewer()
+        shards = own
+        if self.sharding.steal:
+            shards = own + [shard for shard in range(self.sharding.shards) if shard not in own]
+        self.waiting = []
+        for shard in shards:
+            if shard in self._given_up:
+                continue
+            lease = self.leases.lease(shard)
+            if lease.done:
+                continue
+            if lease.is_live(self.leases.clock()) or not self.leases.claim(shard):
+                # Held by another node: to retry when it ends or expires
+                self.waiting.append(shard)
+                continue
+            self._pending[shard] = 0
+            self._failed.discard(shard)
+            self._exhausted.discard(shard)
+            yield shard
+
+    def holds(self, shard: int) -> bool:
+        return self.leases is None or self.leases.holds(shard)
+
+    def done_units(self, shard: int) -> Set[WorkUnit]:
+        # Processed under earlier leases of shard (by this or other nodes)
+        return set() if self.leases is None else self.leases.done_units.get(shard, set())
+
+    def started(self, shard: int):
+        self._pending[shard] = self._pending.get(shard, 0) + 1
+
+    def finished(self, shard: int, failed: bool = False, units: List[WorkUnit] = None):
+        self._pending[shard] -= 1
+        if failed:
+            self._failed.add(shard)
+        elif units and self.leases is not None:
+            self.leases.units_done(shard, units)
+        self._check(shard)
+
+    def exhausted(self, shard: int, failed: bool = False):
+        # Every unit of shard was started (failed: some were not, the lease was lost)
+        self._exhausted.add(shard)
+        if failed:
+            self._failed.add(shard)
+        self._check(shard)
+
+    def wait(self):
+        time.sleep(self.sharding.poll_interval)
+
+    def close(self):
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        if self.leases is not None:
+            for shard in list(self.leases.held):
+                self.leases.release(shard)
+
+    def _check(self, shard: int):
+        if shard not in self._exhausted or self._pending.get(shard, 0) > 0:
+            return
+        if self.leases is None:
+            return
+        if shard in self._failed:
+            self._given_up.add(shard)
+            self.leases.release(shard)
+        else:
+            self.leases.done(shard)
+
+    def _start_renewer(self):
+        if self._renewer is not None:
+            return
+        self._stop.clear()
+
+        def renew():
+            while not self._stop.wait(self.leases.lease_seconds / 4):
+                try:
+                    self.leases.renew()
+                except Exception as e:
+                    print(f'Lease renewal failed: {e}')
+
+        self._renewer = threading.Thread(target=renew, name='shard-leases', daemon=True)
+        self._renewer.start()
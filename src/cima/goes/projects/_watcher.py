@@ -0,0 +1,102 @@
+import datetime
+import time
+from typing import List, Dict, Callable, Any
+from cima.goes import ProductBand
+from cima.goes.storage import GoesStorage, GroupedBandBlobs, IndexedGoesStorage
+from cima.goes.utils._file_names import goes_datetime
+from cima.goes.projects._project import ProcessCall
+
+
+class ScanWatcher(object):
+    '''
+    Near real time mode: each poll lists only the current and previous hour
+    prefixes and calls process once for every new complete scan group
+    (one with all the bands), oldest first, with the same arguments
+    BatchProcess gives it. Handled observation starts are remembered for keep_hours,
+    at least the 2 hours listed.
+    Listings go to the storage under any IndexedGoesStorage of the wrappers
+    (its day listings would miss new scans); blobs are read through all of them.
+    '''
+    def __init__(self,
+                 goes_storage: GoesStorage,
+                 bands: List[ProductBand],
+                 process: ProcessCall,
+                 *args,
+                 keep_hours: int = 3,
+                 utcnow: Callable[[], datetime.datetime] = datetime.datetime.utcnow,
+                 **kwargs):
+        if keep_hours < 2:
+            raise Exception(f'keep_hours must be at least 2 (the hours listed), not {keep_hours}')
+        self.goes_storage = goes_storage
+        self.listing_storage = _listing_storage(goes_storage)
+        self.bands = bands
+        self.process = process
+        self.args = args
+        self.kwargs = kwargs
+        self.keep_hours = keep_hours
+        self.utcnow = utcnow
+        self.handled: Dict[str, datetime.datetime] = {}
+        self._band_keys = {(band.product, band.band) for band in bands}
+
+    def new_groups(self, now: datetime.datetime = None) -> List[GroupedBandBlobs]:
+        now = self.utcnow() if now is None else now
+        groups = []
+        for hour_time in (now - datetime.timedelta(hours=1), now):
+            groups.extend(self.listing_storage.grouped_one_hour_blobs(
+                hour_time.year, hour_time.month, hour_time.day, hour_time.hour, self.bands))
+        return [
+            group for group in groups
+            if group.start not in self.handled and self.is_complete(group)
+        ]
+
+    def is_complete(self, group: GroupedBandBlobs) -> bool:
+        return self._band_keys <= {(bb.product, bb.band) for bb in group.blobs}
+
+    def poll(self, now: datetime.datetime = None) -> List[Any]:
+        '''
+        Processes the new complete groups and returns the results that are not None
+        '''
+        now = self.utcnow() if now is None else now
+        results = []
+        for group in self.new_groups(now):
+            start = goes_datetime(group.start)
+            result = self.process(
+                self.goes_storage,
+                start.year, start.month, start.day, start.hour, start.minute,
+                {(bb.product, bb.band): bb.blobs[0] for bb in group.blobs},
+                *self.args,
+                **self.kwargs)
+            self.handled[group.start] = now
+            if result is not None:
+                results.append(result)
+        self._forget(now)
+        return results
+
+    def watch(self, interval: float = 30, polls: int = None, on_results: Callable[[List[Any]], None] = None):
+        '''
+        Polls every interval seconds (forever unless polls is given)
+        '''
+        count = 0
+        while polls is None or count < polls:
+            started = time.monotonic()
+            results = self.poll()
+            if on_results is not None and results:
+                on_results(results)
+            count += 1
+            if polls is None or count < polls:
+                time.sleep(max(0., interval - (time.monotonic() - started)))
+
+    def _forget(self, now: datetime.datetime):
+        oldest = now - datetime.timedelta(hours=self.keep_hours)
+        self.handled = {start: handled for start, handled in self.handled.items() if handled >= oldest}
+
+
+def _listing_storage(goes_storage: GoesStorage) -> GoesStorage:
+    # The storage wrapped by the innermost IndexedGoesStorage (goes_storage if there is none)
+    listing_storage = goes_storage
+    storage = goes_storage
+    while storage is not None:
+        if isinstance(storage, IndexedGoesStorage):
+            listing_storage = storage.goes_storage
+        storage = getattr(storage, 'goes_storage', None)
+    return listing_storage
@@ -1,10 +1,24 @@
-from cima.goes.storage._ftp import FTP
-from cima.goes.storage._http import HTTP
-from cima.goes.storage._async_ftp import AFTP
-from cima.goes.storage._nfs import NFS
-from cima.goes.storage._async_nfs import ANFS
-from cima.goes.storage._gcs import GCS
-from cima.goes.storage._factories import mount_goes_storage, mount_storage
-from cima.goes.storage._blobs import GroupedBandBlobs, GoesBlob, BandBlobs
-from cima.goes.storage._goes_data import GoesStorage
-from cima.goes.storage._file_systems import StorageInfo
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562): only the backends
+# in use are loaded (google-cloud-storage, aiohttp, aioftp, aiofiles...)
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_ftp': ['FTP'],
+    '_http': ['HTTP'],
+    '_async_ftp': ['AFTP'],
+    '_nfs': ['NFS'],
+    '_async_nfs': ['ANFS'],
+    '_gcs': ['GCS'],
+    '_async_gcs': ['AGCS'],
+    '_factories': ['mount_goes_storage', 'mount_storage'],
+    '_blobs': ['GroupedBandBlobs', 'GoesBlob', 'BandBlobs', 'ListedBlob'],
+    '_goes_data': ['GoesStorage', 'WrappedGoesStorage'],
+    '_file_systems': ['StorageInfo'],
+    '_datasets': [
+        'open_dataset_from_memory', 'open_dataset_from_file', 'open_dataset_from_url', 'open_dataset_from_mmap',
+        'open_dataset_from_path', 'open_downloaded_dataset', 'OPEN_MEMORY', 'OPEN_PATH', 'OPEN_MMAP',
+    ],
+    '_prefetch': ['Prefetch', 'prefetch_blobs', 'PrefetchedGoesStorage'],
+    '_cache': ['CachedGoesStorage', 'CacheStats'],
+    '_listing': ['IndexedGoesStorage', 'DayListing'],
+})
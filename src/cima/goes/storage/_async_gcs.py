@@ -0,0 +1,298 @@
+import asyncio
+import io
+import random
+import urllib.parse
+from typing import List, Callable
+import aiohttp
+import netCDF4
+from google.oauth2 import service_account
+import google.auth.transport.requests
+from cima.goes import ANY_MODE
+from cima.goes.utils._file_names import ProductBand, Product, GOES_PUBLIC_BUCKET, GCS_MEDIA_URL, get_media_url
+from cima.goes.utils._file_names import path_prefix, day_path_prefix
+from cima.goes.storage._file_systems import storage_type, StorageInfo
+from cima.goes.storage._blobs import GroupedBandBlobs, BandBlobs, BlobsByStart, ListedBlob
+from cima.goes.storage._blobs import group_blobs_by_start, add_blobs_by_start, start_ordered_blobs
+from cima.goes.storage._goes_data import GoesStorage
+from cima.goes.storage._datasets import open_dataset_from_memory
+
+
+GCS_API_URL = 'https://storage.googleapis.com/storage/v1'
+READ_ONLY_SCOPE = 'https://www.googleapis.com/auth/devstorage.read_only'
+# Transient statuses, retried with backoff
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class _RetryableError(Exception):
+    pass
+
+
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, _RetryableError)
+
+
+class AGCS(GoesStorage):
+    '''
+    Google Cloud Storage, asyncio version of GCS (and HTTP, which reads the same public URLs).
+    Lists with the JSON API and downloads from the media URL of each object.
+    At most max_concurrency requests are in flight; transient errors
+    are retried up to retries times with exponential backoff.
+    Every method that does I/O is a coroutine.
+    '''
+    def __init__(self,
+                 bucket: str = GOES_PUBLIC_BUCKET,
+                 product: Product = Product.CMIPF,
+                 mode: str = ANY_MODE,
+                 subproduct: int = None,
+                 credentials_as_dict: dict = None,
+                 max_concurrency: int = 64,
+                 retries: int = 5,
+                 backoff: float = 0.5,
+                 timeout: float = 60,
+                 base_url: str = GCS_MEDIA_URL,
+                 api_url: str = GCS_API_URL):
+        self.bucket = bucket
+        self.product = product
+        self.mode = mode
+        self.subproduct = subproduct
+        self.credentials_as_dict = credentials_as_dict
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_url = base_url
+        self.api_url = api_url
+        self._reset_session()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ('_session', '_semaphore', '_loop', '_credentials'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_session()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    #
+    # Storage methods
+    #
+    def get_storage_info(self) -> StorageInfo:
+        return StorageInfo(storage_type.AGCS,
+                           bucket=self.bucket,
+                           product=self.product,
+                           mode=self.mode,
+                           subproduct=self.subproduct,
+                           credentials_as_dict=self.credentials_as_dict,
+                           max_concurrency=self.max_concurrency,
+                           retries=self.retries,
+                           backoff=self.backoff,
+                           timeout=self.timeout,
+                           base_url=self.base_url,
+                           api_url=self.api_url)
+
+    async def list(self, path: str):
+        return await self.list_blobs(path)
+
+    async def mkdir(self, path: str):
+        raise Exception('Not implemented: mkdir')
+
+    async def upload_data(self, data: bytes, filepath: str):
+        raise Exception('Not implemented: upload_data')
+
+    async def upload_stream(self, stream: io.BytesIO, filepath: str):
+        raise Exception('Not implemented: upload_stream')
+
+    async def append_data(self, data: bytes, filepath: str):
+        raise Exception('Not implemented: append_data')
+
+    async def append_stream(self, stream: io.BytesIO, filepath: str):
+        raise Exception('Not implemented: append_stream')
+
+    async def download_data(self, filepath: str) -> bytes:
+        return await self.download_blob(self.get_blob(filepath))
+
+    async def download_stream(self, filepath: str) -> io.BytesIO:
+        return io.BytesIO(await self.download_data(filepath))
+
+    async def get_dataset(self, blob: ListedBlob) -> netCDF4.Dataset:
+        return open_dataset_from_memory(await self.download_blob(blob))
+
+    #
+    # GoesStorage methods
+    #
+    async def grouped_one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        blobs_by_start = await self._blobs_by_start(
+            lambda product: path_prefix(year=year, month=month, day=day, hour=hour, product=product),
+            product_bands)
+        return group_blobs_by_start(blobs_by_start)
+
+    async def one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_band: ProductBand) -> BandBlobs:
+        blobs_by_start = await self._blobs_by_start(
+            lambda product: path_prefix(year=year, month=month, day=day, hour=hour, product=product),
+            [product_band])
+        blobs = start_ordered_blobs(blobs_by_start)
+        return BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct)
+
+    async def grouped_one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        blobs_by_start = await self._blobs_by_start(
+            lambda product: day_path_prefix(year=year, month=month, day=day, product=product),
+            product_bands, hours=hours, delimiter=None)
+        return group_blobs_by_start(blobs_by_start)
+
+    async def one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand) -> BandBlobs:
+        blobs_by_start = await self._blobs_by_start(
+            lambda product: day_path_prefix(year=year, month=month, day=day, product=product),
+            [product_band], hours=hours, delimiter=None)
+        blobs = start_ordered_blobs(blobs_by_start)
+        return BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct)
+
+    def get_blob(self, name: str, generation: int = None, size: int = None) -> ListedBlob:
+        return ListedBlob(name, size, generation)
+
+    async def download_blob(self, blob: ListedBlob) -> bytes:
+        chunks = []
+
+        async def read(response):
+            chunks.clear()
+            async for chunk in response.content.iter_any():
+                chunks.append(chunk)
+            _check_length(response, sum(len(chunk) for chunk in chunks))
+
+        await self._get(self._media_url(blob), read)
+        return b''.join(chunks)
+
+    #
+    # AGCS methods
+    #
+    async def list_blobs(self, path: str, delimiter='/') -> List[ListedBlob]:
+        url = f'{self.api_url}/b/{urllib.parse.quote(self.bucket, safe="")}/o'
+        params = {'prefix': path, 'fields': 'items(name,size,generation),nextPageToken'}
+        if delimiter:
+            params['delimiter'] = delimiter
+        blobs = []
+        while True:
+            page = {}
+
+            async def read(response):
+                page.update(await response.json())
+
+            await self._get(url, read, params=params)
+            blobs.extend(
+                ListedBlob(item['name'], int(item['size']), int(item['generation']))
+                for item in page.get('items', []))
+            if 'nextPageToken' not in page:
+                return blobs
+            params = dict(params, pageToken=page['nextPageToken'])
+
+    async def download_blob_into(self, blob: ListedBlob, buffer) -> int:
+        '''
+        Streams the blob into a preallocated writable buffer (bytearray, numpy array, mmap...)
+        and returns its size. The buffer can be reused between downloads.
+        '''
+        view = memoryview(buffer).cast('B')
+        size = 0
+
+        async def read(response):
+            nonlocal size
+            size = 0
+            async for chunk in response.content.iter_any():
+                end = size + len(chunk)
+                if end > len(view):
+                    raise Exception(f'{blob.name} does not fit in a {len(view)} bytes buffer')
+                view[size:end] = chunk
+                size = end
+            _check_length(response, size)
+
+        await self._get(self._media_url(blob), read)
+        return size
+
+    async def download_blobs(self, blobs: List[ListedBlob]) -> List[bytes]:
+        return await asyncio.gather(*[self.download_blob(blob) for blob in blobs])
+
+    async def get_datasets(self, blobs: List[ListedBlob]) -> List[netCDF4.Dataset]:
+        return [open_dataset_from_memory(data) for data in await self.download_blobs(blobs)]
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._reset_session()
+
+    def _media_url(self, blob: ListedBlob) -> str:
+        url = get_media_url(urllib.parse.quote(blob.name), self.bucket, self.base_url)
+        if blob.generation is not None:
+            url = f'{url}?generation={blob.generation}'
+        return url
+
+    def _reset_session(self):
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+        self._credentials = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Sessions and semaphores belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout))
+        return self._session
+
+    async def _headers(self) -> dict:
+        if not self.credentials_as_dict:
+            return {}
+        if self._credentials is None:
+            self._credentials = service_account.Credentials.from_service_account_info(
+                self.credentials_as_dict, scopes=[READ_ONLY_SCOPE])
+        if not self._credentials.valid:
+            request = google.auth.transport.requests.Request()
+            await asyncio.get_running_loop().run_in_executor(None, self._credentials.refresh, request)
+        return {'Authorization': f'Bearer {self._credentials.token}'}
+
+    async def _get(self, url: str, read: Callable, params: dict = None):
+        '''
+        GET url and await read(response), retrying the whole request on transient errors
+        '''
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    headers = await self._headers()
+                    async with session.get(url, params=params, headers=headers) as response:
+                        if response.status in RETRY_STATUS:
+                            raise _RetryableError(f'GET {url}: {response.status}')
+                        if response.status != 200:
+                            raise Exception(f'GET {url}: {response.status} {await response.text()}')
+                        return await read(response)
+            except RETRYABLE_ERRORS:
+                if attempt == self.retries:
+                    raise
+            # Exponential backoff with jitter, outside the semaphore
+            await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    async def _blobs_by_start(self, get_prefix: Callable[[Product], str], product_bands: List[ProductBand],
+                              hours: List[int] = None, delimiter='/') -> BlobsByStart:
+        # Products are listed concurrently
+        products = list(dict.fromkeys(pb.product for pb in product_bands))
+        listings = await asyncio.gather(*[self.list_blobs(get_prefix(product), delimiter=delimiter) for product in products])
+        blobs_by_start: BlobsByStart = {}
+        for blobs in listings:
+            add_blobs_by_start(blobs_by_start, blobs, product_bands, self.mode, hours)
+        return blobs_by_start
+
+
+def _check_length(response, size: int):
+    # A connection dropped mid body can end the stream early.
+    # Content-Length is the encoded size when the body is compressed, so it can't be checked then
+    if 'Content-Encoding' in response.headers or response.content_length is None:
+        return
+    if size != response.content_length:
+        raise _RetryableError(f'GET {response.url}: {size} of {response.content_length} bytes')
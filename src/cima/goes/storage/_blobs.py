@@ -1,10 +1,22 @@
+import re
 from dataclasses import dataclass
-from typing import Union, List
-from cima.goes import Product, Band
+from typing import Union, List, Dict, Tuple, Iterable, TYPE_CHECKING
+from cima.goes import Product, Band, ProductBand
+from cima.goes.utils._file_names import parse_file_name, product_band_key
 
-from google.cloud.storage.blob import Blob
+if TYPE_CHECKING:
+    # Only for annotations: google-cloud-storage is loaded by GCS
+    from google.cloud.storage.blob import Blob
 
-GoesBlob = Union[Blob]
+
+@dataclass
+class ListedBlob:
+    name: str
+    size: int = None
+    generation: int = None
+
+
+GoesBlob = Union['Blob', ListedBlob]
 
 
 @dataclass
@@ -21,3 +33,39 @@ class GroupedBandBlobs:
     blobs: List[BandBlobs]
 
 
+BlobsByStart = Dict[str, Dict[Tuple[Product, Band], List[GoesBlob]]]
+
+
+def group_blobs_by_start(blobs_by_start: BlobsByStart) -> List[GroupedBandBlobs]:
+    return [
+        GroupedBandBlobs(start, [BandBlobs(pband[0], pband[1], blobs) for pband, blobs in band_blobs_dict.items()])
+        for start, band_blobs_dict in sorted(blobs_by_start.items())
+    ]
+
+
+def add_blobs_by_start(blobs_by_start: BlobsByStart, blobs: Iterable[GoesBlob], product_bands: List[ProductBand],
+                       mode: str, hours: List[int] = None) -> BlobsByStart:
+    # Every name is parsed once, then filtered by band, mode and hour and grouped
+    wanted = {product_band_key(pb): (pb.product, pb.band) for pb in product_bands}
+    mode_pattern = re.compile(mode)
+    hours = None if hours is None else {f'{hour:02d}' for hour in hours}
+    for blob in blobs:
+        file_name = parse_file_name(blob.name)
+        if file_name is None:
+            continue
+        band_key = wanted.get(file_name.key)
+        if band_key is None or not mode_pattern.fullmatch(file_name.mode):
+            continue
+        if hours is not None and file_name.start[7:9] not in hours:
+            continue
+        blobs_by_start.setdefault(file_name.start, {}).setdefault(band_key, []).append(blob)
+    return blobs_by_start
+
+
+def start_ordered_blobs(blobs_by_start: BlobsByStart) -> List[GoesBlob]:
+    return [
+        blob
+        for start in sorted(blobs_by_start.keys())
+        for blobs in blobs_by_start[start].values()
+        for blob in blobs
+    ]
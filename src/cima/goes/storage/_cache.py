@@ -0,0 +1,181 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+import netCDF4
+from cima.goes.storage._blobs import GoesBlob
+from cima.goes.storage._file_systems import StorageInfo, storage_type
+from cima.goes.storage._goes_data import GoesStorage, WrappedGoesStorage
+from cima.goes.storage._datasets import open_dataset_from_path, OPEN_PATH
+
+
+CACHE_EXTENSION = '.nc'
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+    bytes_downloaded: int = 0
+    evicted: int = 0
+
+
+def blob_cache_key(blob) -> str:
+    if isinstance(blob, str):
+        return blob
+    version = getattr(blob, 'generation', None) or getattr(blob, 'md5_hash', None) or ''
+    return f'{blob.name}#{version}'
+
+
+class CachedGoesStorage(WrappedGoesStorage):
+    '''
+    GoesStorage wrapper that keeps downloaded blobs in a local directory.
+    Files are keyed by blob name and generation (or md5), written atomically
+    and evicted least recently used first, so several processes can share one cache.
+    '''
+    def __init__(self, goes_storage: GoesStorage, path: str, max_bytes: int = 50 << 30):
+        super().__init__(goes_storage)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    #
+    # Cache methods
+    #
+    def cached_filepath(self, blob) -> str:
+        digest = hashlib.sha1(blob_cache_key(blob).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest + CACHE_EXTENSION)
+
+    def fetch(self, blob) -> str:
+        filepath = self.cached_filepath(blob)
+        try:
+            size = os.path.getsize(filepath)
+            # Touch to keep LRU order
+            os.utime(filepath)
+            with self._lock:
+                self.stats.hits += 1
+                self.stats.bytes_saved += size
+            return filepath
+        except FileNotFoundError:
+            pass
+        if isinstance(blob, str):
+            data = self.goes_storage.download_data(blob)
+        else:
+            data = self.goes_storage.download_blob(blob)
+        self._write(filepath, data)
+        with self._lock:
+            self.stats.misses += 1
+            self.stats.bytes_downloaded += len(data)
+        self._added(len(data), filepath)
+        return filepath
+
+    def cache_size(self) -> int:
+        return sum(size for _, size, _ in self._cached_files())
+
+    def clear(self):
+        for filepath, _, _ in self._cached_files():
+            _remove(filepath)
+        self._size = 0
+
+    def _write(self, filepath: str, data: bytes):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = f'{filepath}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_filepath, mode='wb') as f:
+                f.write(data)
+            os.replace(tmp_filepath, filepath)
+        finally:
+            _remove(tmp_filepath)
+
+    def _opened(self, blob, open_file):
+        try:
+            return open_file(self.fetch(blob))
+        except FileNotFoundError:
+            # Evicted by another process between fetch and open: a miss
+            return open_file(self.fetch(blob))
+
+    def _added(self, size: int, added: str):
+        with self._lock:
+            if self._size is None:
+                self._size = self.cache_size()
+            else:
+                self._size += size
+            if self._size <= self.max_bytes:
+                return
+            # Other processes share the directory: evict by what is really on disk
+            files = sorted(self._cached_files(), key=lambda f: f[2])
+            total = sum(size for _, size, _ in files)
+            for filepath, size, _ in files:
+                if total <= self.max_bytes:
+                    break
+                if filepath == added:
+                    # Never the file just written (bigger than max_bytes or the newest one)
+                    continue
+                if _remove(filepath):
+                    self.stats.evicted += 1
+                total -= size
+            self._size = total
+
+    def _cached_files(self):
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if not filename.endswith(CACHE_EXTENSION):
+                    continue
+                filepath = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+                yield filepath, stat.st_size, stat.st_mtime
+
+    #
+    # Storage methods
+    #
+    def get_storage_info(self) -> StorageInfo:
+        return StorageInfo(storage_type.GOES_CACHE,
+                           storage_info=self.goes_storage.get_storage_info(),
+                           path=self.path,
+                           max_bytes=self.max_bytes)
+
+    def download_data(self, filepath: str) -> bytes:
+        return self._opened(filepath, _read)
+
+    def download_stream(self, filepath: str) -> io.BytesIO:
+        return io.BytesIO(self.download_data(filepath))
+
+    def get_dataset(self, blob, open_mode: str = OPEN_PATH) -> netCDF4.Dataset:
+        return self._opened(blob, lambda filepath: open_dataset_from_path(filepath, open_mode))
+
+    #
+    # GoesStorage methods
+    #
+    def download_blob(self, blob: GoesBlob) -> bytes:
+        return self._opened(blob, _read)
+
+
+def _read(filepath: str) -> bytes:
+    with open(filepath, mode='rb') as f:
+        return f.read()
+
+
+def _remove(filepath: str) -> bool:
+    try:
+        os.remove(filepath)
+        return True
+    except FileNotFoundError:
+        return False
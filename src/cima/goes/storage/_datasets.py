@@ -0,0 +1,71 @@
+import io
+import mmap
+import tempfile
+from typing import Callable
+import netCDF4
+
+
+# Dataset open modes
+# The whole file in a Python bytes buffer
+OPEN_MEMORY = 'memory'
+# By path: netCDF-C reads only the metadata and the sliced chunks
+OPEN_PATH = 'path'
+# A read only map of the file: pages come from the page cache, nothing is copied
+OPEN_MMAP = 'mmap'
+
+
+def open_dataset_from_memory(data) -> netCDF4.Dataset:
+    return netCDF4.Dataset("in_memory_file", mode='r', memory=data)
+
+
+def open_dataset_from_file(filepath: str) -> netCDF4.Dataset:
+    # The HDF5 library reads only the metadata and the chunks that are sliced
+    return netCDF4.Dataset(filepath, mode='r')
+
+
+def open_dataset_from_url(url: str) -> netCDF4.Dataset:
+    # netCDF-C byte-range mode: superblock, chunk index and the sliced
+    # chunks are fetched with HTTP Range requests
+    return netCDF4.Dataset(f'{url}#mode=bytes', mode='r')
+
+
+def open_dataset_from_mmap(file) -> netCDF4.Dataset:
+    '''
+    file: a path or an open binary file. The map outlives the file,
+    and the dataset keeps it alive until it is closed.
+    '''
+    if isinstance(file, str):
+        with open(file, mode='rb') as f:
+            return open_dataset_from_mmap(f)
+    file.flush()
+    return open_dataset_from_memory(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def open_dataset_from_path(filepath: str, open_mode: str = OPEN_PATH) -> netCDF4.Dataset:
+    if open_mode == OPEN_PATH:
+        return open_dataset_from_file(filepath)
+    if open_mode == OPEN_MMAP:
+        return open_dataset_from_mmap(filepath)
+    if open_mode == OPEN_MEMORY:
+        with open(filepath, mode='rb') as f:
+            return open_dataset_from_memory(f.read())
+    raise Exception(f'Open mode not implemented: {open_mode}')
+
+
+def open_downloaded_dataset(download: Callable, open_mode: str = OPEN_MEMORY) -> netCDF4.Dataset:
+    '''
+    Opens what download(file) writes to a binary file.
+    OPEN_MEMORY keeps it in a single bytes buffer. OPEN_MMAP writes it to an anonymous
+    temporary file (removed when the dataset is closed) and maps it, so the
+    download takes no process memory.
+    '''
+    if open_mode == OPEN_MEMORY:
+        stream = io.BytesIO()
+        download(stream)
+        # getvalue shares the buffer instead of copying it, as read() would
+        return open_dataset_from_memory(stream.getvalue())
+    if open_mode == OPEN_MMAP:
+        with tempfile.TemporaryFile() as f:
+            download(f)
+            return open_dataset_from_mmap(f)
+    raise Exception(f'Open mode not implemented for downloads: {open_mode}')
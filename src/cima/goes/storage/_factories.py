@@ -1,33 +1,52 @@
 from cima.goes.storage._goes_data import GoesStorage
-from cima.goes.storage._ftp import FTP
-from cima.goes.storage._async_ftp import AFTP
-from cima.goes.storage._nfs import NFS
-from cima.goes.storage._async_nfs import ANFS
-from cima.goes.storage._gcs import GCS
-from cima.goes.storage._http import HTTP
 from cima.goes.storage._file_systems import Storage, StorageInfo, storage_type
 
 
+# Backends are imported when they are mounted, so a process only loads
+# the client libraries of the storages it uses
 def mount_storage(store: StorageInfo) -> Storage:
     if store.stype == storage_type.FTP:
+        from cima.goes.storage._ftp import FTP
         return FTP(**store.kwargs)
     if store.stype == storage_type.HTTP:
+        from cima.goes.storage._http import HTTP
         return HTTP(**store.kwargs)
     if store.stype == storage_type.AFTP:
+        from cima.goes.storage._async_ftp import AFTP
         return AFTP(**store.kwargs)
     if store.stype == storage_type.GCS:
+        from cima.goes.storage._gcs import GCS
         return GCS(**store.kwargs)
+    if store.stype == storage_type.AGCS:
+        from cima.goes.storage._async_gcs import AGCS
+        return AGCS(**store.kwargs)
     if store.stype == storage_type.NFS:
+        from cima.goes.storage._nfs import NFS
         return NFS()
     if store.stype == storage_type.ANFS:
+        from cima.goes.storage._async_nfs import ANFS
         return ANFS()
     raise Exception(f'{store.stype.value} not implemented')
 
 
 def mount_goes_storage(store: StorageInfo) -> GoesStorage:
     if store.stype == storage_type.GCS:
+        from cima.goes.storage._gcs import GCS
         return GCS(**store.kwargs)
+    if store.stype == storage_type.AGCS:
+        from cima.goes.storage._async_gcs import AGCS
+        return AGCS(**store.kwargs)
     if store.stype == storage_type.HTTP:
+        from cima.goes.storage._http import HTTP
         return HTTP(**store.kwargs)
+    if store.stype == storage_type.GOES_CACHE:
+        from cima.goes.storage._cache import CachedGoesStorage
+        kwargs = dict(store.kwargs)
+        goes_storage = mount_goes_storage(kwargs.pop('storage_info'))
+        return CachedGoesStorage(goes_storage, **kwargs)
+    if store.stype == storage_type.GOES_INDEX:
+        from cima.goes.storage._listing import IndexedGoesStorage
+        kwargs = dict(store.kwargs)
+        goes_storage = mount_goes_storage(kwargs.pop('storage_info'))
+        return IndexedGoesStorage(goes_storage, **kwargs)
     raise Exception(f'{store.stype.value} not implemented')
-
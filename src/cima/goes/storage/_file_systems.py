@@ -12,7 +12,10 @@ class storage_type(Enum):
     FTP = 'ftp' # File Transfer Protocol
     AFTP = 'async_ftp' # File Transfer Protocol
     GCS = 'gcs' # Google Cloud Storage
+    AGCS = 'async_gcs' # Google Cloud Storage
     HTTP = 'http' # HTTP protocol
+    GOES_CACHE = 'goes_cache' # Local cache of a GOES storage
+    GOES_INDEX = 'goes_index' # Day listings index of a GOES storage
 
 
 @dataclass
@@ -67,3 +70,10 @@ class Storage(metaclass=abc.ABCMeta):
     def get_dataset(self, blob) -> netCDF4.Dataset:
         pass
 
+    def create_data(self, data: bytes, filepath: str) -> bool:
+        '''
+        Writes filepath only if it doesn't exist, in one atomic step (the base of shard leases).
+        Returns True if this call created it.
+        '''
+        raise Exception('Not implemented: create_data')
+
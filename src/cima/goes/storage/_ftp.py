@@ -1,124 +1,279 @@
 import os
 import io
+import time
 import ftplib
+import posixpath
+import threading
+import contextlib
+import concurrent.futures
+from typing import Iterable, Tuple, List
 import netCDF4
 from cima.goes.storage._file_systems import Storage, StorageInfo, storage_type
+from cima.goes.storage._datasets import open_downloaded_dataset, OPEN_MEMORY
+
+
+# Connection level failures: the connection is dropped and the operation retried on a new one
+RECONNECT_ERRORS = (OSError, EOFError, ftplib.error_reply)
+# Seconds before repeating a command refused with a transient (4xx) reply, on the same connection
+TEMP_ERROR_DELAY = 1
 
 
 class FTP(Storage):
     '''
     File Transfer Protocol
+    Up to pool_size logged in connections are kept open and shared between threads.
+    A connection idle for more than keepalive seconds is checked with NOOP before reuse,
+    and a read that fails because its connection dropped is retried once on a new one.
+    A command refused with a transient (4xx) reply is repeated once on the same connection.
+    Writes (STOR, APPE) always check the connection first and are only retried if that
+    check or the new connection failed: one that dropped mid transfer may have been applied.
+    Directories created (or found) by uploads are remembered, so they are created once.
     '''
-    def __init__(self, host=None, port=21, user='', password=''):
+    def __init__(self, host=None, port=21, user='', password='', pool_size: int = 4, keepalive: float = 30,
+                 timeout: float = 60):
         self.host = host
         self.user = user
         self.password = password
         self.port = port
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._reset_pool()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ('_idle', '_pool_lock', '_pool_slots', '_pool_pid', '_dirs', '_dirs_lock'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_pool()
 
     def get_storage_info(self) -> StorageInfo:
-        return StorageInfo(storage_type.FTP, host=self.host, port=self.port, user=self.user, password=self.password)
+        return StorageInfo(storage_type.FTP, host=self.host, port=self.port, user=self.user, password=self.password,
+                           pool_size=self.pool_size, keepalive=self.keepalive, timeout=self.timeout)
 
     def list(self, path: str):
-        ftp = ftplib.FTP()
-        try:
-            ftp.connect(host=self.host, port=self.port)
-            ftp.login(user=self.user, passwd=self.password)
-            return ftp.nlst(path)
-        finally:
-            try:
-                ftp.quit()
-            except:
-                ftp.close()
+        return self._run(lambda ftp: ftp.nlst(path))
 
     def mkdir(self, path: str):
-        ftp = ftplib.FTP()
-        try:
-            ftp.connect(host=self.host, port=self.port)
-            ftp.login(user=self.user, passwd=self.password)
-            ftp.mkd(path)
-        finally:
-            try:
-                ftp.quit()
-            except:
-                ftp.close()
+        self._run(lambda ftp: ftp.mkd(path))
+        with self._dirs_lock:
+            self._dirs.add(posixpath.normpath(path))
+
+    def makedirs(self, path: str):
+        self._run(lambda ftp: self._makedirs(ftp, path))
 
     def try_create_path(self, ftp, path):
-        parts = path.split('/')
-        if path[0] == '/':
-            ftp.cwd('/')
-        try:
-            for part in parts:
-                try:
-                    ftp.cwd(part)
-                except Exception as e:
-                    ftp.mkd(part)
-                    ftp.cwd(part)
-        except:
-            pass
+        self._makedirs(ftp, path)
 
     def upload_data(self, data: bytes, filepath: str, override: bool = True):
-        stream = io.BytesIO()
-        stream.write(data)
-        self.upload_stream(stream, filepath, override)
+        self.upload_stream(io.BytesIO(data), filepath, override)
 
     def upload_stream(self, stream: io.BytesIO, filepath: str, override: bool = True):
-        ftp = ftplib.FTP()
-        try:
-            ftp.connect(host=self.host, port=self.port)
-            ftp.login(user=self.user, passwd=self.password)
-            path = os.path.dirname(os.path.abspath(filepath))
-            self.try_create_path(ftp, path)
+        def upload(ftp):
+            self._makedirs(ftp, posixpath.dirname(filepath))
             stream.seek(0)
             if override:
                 try:
                     ftp.delete(filepath)
-                except:
+                except ftplib.error_perm:
                     pass
             ftp.storbinary('STOR ' + filepath, stream)
-        finally:
-            try:
-                ftp.quit()
-            except:
-                ftp.close()
+        try:
+            self._run(upload, idempotent=False)
+        except ftplib.error_perm:
+            # The directory may have been removed since it was cached
+            self._forget_dirs(posixpath.dirname(filepath))
+            self._run(upload, idempotent=False)
+
+    def upload_many(self, items: Iterable[Tuple[str, bytes]], override: bool = True, workers: int = None) -> List[str]:
+        '''
+        Uploads (filepath, data) items over the pooled connections, pool_size at a time.
+        Returns the uploaded file paths; the first failure is raised after the others end.
+        '''
+        workers = self.pool_size if workers is None else workers
+
+        def upload(item):
+            filepath, data = item
+            self.upload_data(data, filepath, override)
+            return filepath
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(upload, items))
 
     def download_data(self, filepath: str) -> bytes:
-        stream = self.download_stream(filepath)
-        return stream.read()
+        return self.download_stream(filepath).getvalue()
 
     def download_stream(self, filepath: str) -> io.BytesIO:
-        ftp = ftplib.FTP()
-        try:
-            ftp.connect(host=self.host, port=self.port)
-            ftp.login(user=self.user, passwd=self.password)
+        def download(ftp):
             in_memory_file = io.BytesIO()
-            ftp.retrbinary('RETR ' + filepath, lambda block: in_memory_file.write(block))
+            ftp.retrbinary('RETR ' + filepath, in_memory_file.write)
             in_memory_file.seek(0)
             return in_memory_file
-        finally:
-            try:
-                ftp.quit()
-            except:
-                ftp.close()
+        return self._run(download)
 
     def append_data(self, data: bytes, filepath: str):
-        stream = io.BytesIO()
-        stream.write(data)
-        self.append_stream(stream, filepath)
+        self.append_stream(io.BytesIO(data), filepath)
 
     def append_stream(self, stream: io.BytesIO, filepath: str):
-        ftp = ftplib.FTP()
-        try:
-            ftp.connect(host=self.host, port=self.port)
-            ftp.login(user=self.user, passwd=self.password)
-            path = os.path.dirname(os.path.abspath(filepath))
+        def append(ftp):
             stream.seek(0)
             ftp.storbinary('APPE ' + filepath, stream)
-        finally:
+        self._run(append, idempotent=False)
+
+    def get_dataset(self, filepath: str, open_mode: str = OPEN_MEMORY) -> netCDF4.Dataset:
+        def download(file):
+            def retrieve(ftp):
+                # A retry starts over
+                file.seek(0)
+                file.truncate()
+                ftp.retrbinary('RETR ' + filepath, file.write)
+            self._run(retrieve)
+        return open_downloaded_dataset(download, open_mode)
+
+    def close(self):
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for ftp, _ in idle:
+            _quit(ftp)
+
+    #
+    # Connection pool
+    #
+    def _reset_pool(self):
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._pool_slots = threading.BoundedSemaphore(self.pool_size)
+        self._pool_pid = os.getpid()
+        self._dirs = set()
+        self._dirs_lock = threading.Lock()
+
+    def _connect(self) -> ftplib.FTP:
+        ftp = ftplib.FTP(timeout=self.timeout)
+        ftp.connect(host=self.host, port=self.port)
+        ftp.login(user=self.user, passwd=self.password)
+        return ftp
+
+    def _take(self, check: bool = False) -> ftplib.FTP:
+        while True:
+            with self._pool_lock:
+                if not self._idle:
+                    break
+                ftp, last_used = self._idle.pop()
+            if not check and time.monotonic() - last_used < self.keepalive:
+                return ftp
             try:
-                ftp.quit()
-            except:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except ftplib.all_errors:
                 ftp.close()
+        return self._connect()
+
+    @contextlib.contextmanager
+    def _connection(self, check: bool = False):
+        if self._pool_pid != os.getpid():
+            # Sockets inherited from the parent process can't be shared
+            self._reset_pool()
+        with self._pool_slots:
+            ftp = self._take(check)
+            try:
+                yield ftp
+            except BaseException as e:
+                if _connection_dropped(e):
+                    ftp.close()
+                else:
+                    # Command level errors leave the connection usable
+                    self._give_back(ftp)
+                raise
+            self._give_back(ftp)
+
+    def _give_back(self, ftp: ftplib.FTP):
+        with self._pool_lock:
+            self._idle.append((ftp, time.monotonic()))
+
+    def _run(self, operation, idempotent: bool = True):
+        '''
+        operation(ftp) on a pooled connection, retried once on a new one if the connection dropped.
+        A non idempotent operation runs on a connection just checked with NOOP,
+        and is not retried on a new one if it was already started.
+        A transient reply is retried once on the same connection, except an aborted transfer (426)
+        of a non idempotent operation.
+        '''
+        started = False
+
+        def run(ftp):
+            nonlocal started
+            started = True
+            try:
+                return operation(ftp)
+            except ftplib.error_temp as e:
+                if _connection_dropped(e) or (not idempotent and str(e).startswith('426')):
+                    raise
+            time.sleep(TEMP_ERROR_DELAY)
+            return operation(ftp)
+
+        try:
+            with self._connection(check=not idempotent) as ftp:
+                return run(ftp)
+        except ftplib.all_errors as e:
+            if not _connection_dropped(e) or (started and not idempotent):
+                raise
+            # When one connection drops the idle ones usually did too
+            self.close()
+            with self._connection(check=not idempotent) as ftp:
+                return operation(ftp)
+
+    def _makedirs(self, ftp: ftplib.FTP, path: str):
+        # Creates every missing component with absolute or login relative MKD, without changing directory
+        path = posixpath.normpath(path)
+        if path in ('.', '/', ''):
+            return
+        with self._dirs_lock:
+            if path in self._dirs:
+                return
+        parts = path.split('/')
+        for i in range(1, len(parts) + 1):
+            current = '/'.join(parts[:i])
+            if current == '':
+                continue
+            with self._dirs_lock:
+                if current in self._dirs:
+                    continue
+            try:
+                ftp.mkd(current)
+            except ftplib.error_perm:
+                # Already exists, or could not be created
+                if not _is_directory(ftp, current):
+                    continue
+            with self._dirs_lock:
+                self._dirs.add(current)
+
+    def _forget_dirs(self, path: str):
+        path = posixpath.normpath(path)
+        with self._dirs_lock:
+            self._dirs = {d for d in self._dirs if not (path == d or path.startswith(d + '/'))}
+
+
+def _connection_dropped(error: BaseException) -> bool:
+    # 421 is a transient reply too, but the server closes the connection after it
+    return isinstance(error, RECONNECT_ERRORS) or (isinstance(error, ftplib.error_temp) and str(error).startswith('421'))
+
+
+def _is_directory(ftp: ftplib.FTP, path: str) -> bool:
+    # CWD into path and back
+    current = ftp.pwd()
+    try:
+        ftp.cwd(path)
+    except ftplib.error_perm:
+        return False
+    ftp.cwd(current)
+    return True
+
 
-    def get_dataset(self, filepath: str) -> netCDF4.Dataset:
-        data = self.download_data(filepath)
-        return netCDF4.Dataset("in_memory_file", mode='r', memory=data)
+def _quit(ftp: ftplib.FTP):
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
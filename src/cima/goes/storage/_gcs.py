@@ -2,17 +2,22 @@ import os
 import io
 import netCDF4
 from collections import namedtuple
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Callable
+import threading
 import google.cloud.storage as gcs
+import requests.adapters
 from google.auth.credentials import AnonymousCredentials
-from cima.goes.utils._file_names import ProductBand, GOES_PUBLIC_BUCKET
+from google.auth.transport.requests import AuthorizedSession
+from cima.goes.utils._file_names import ProductBand, GOES_PUBLIC_BUCKET, get_media_url
 from google.oauth2 import service_account
-from cima.goes.utils._file_names import file_regex_pattern, path_prefix, slice_obs_start, Product
-from cima.goes.utils._file_names import day_path_prefix, hour_file_regex_pattern
+from cima.goes.utils._file_names import path_prefix, day_path_prefix, Product
+from cima.goes.utils._file_names import parse_file_name
 from cima.goes import Band, ANY_MODE
 from cima.goes.storage._file_systems import Storage, storage_type, StorageInfo
-from cima.goes.storage._blobs import GoesBlob, GroupedBandBlobs, BandBlobs
+from cima.goes.storage._blobs import GoesBlob, ListedBlob, GroupedBandBlobs, BandBlobs, BlobsByStart, group_blobs_by_start
+from cima.goes.storage._blobs import add_blobs_by_start, start_ordered_blobs
 from cima.goes.storage._goes_data import GoesStorage
+from cima.goes.storage._datasets import open_dataset_from_url, open_downloaded_dataset, OPEN_MEMORY
 
 
 class GCS(GoesStorage):
@@ -23,7 +28,9 @@ class GCS(GoesStorage):
                  bucket: str=GOES_PUBLIC_BUCKET,
                  product: Product=Product.CMIPF, mode: str = ANY_MODE,
                  subproduct: int = None,
-                 credentials_filepath: str=None):
+                 credentials_filepath: str=None,
+                 byte_range: bool = False,
+                 pool_size: int = 10):
         self.credentials_as_dict = credentials_as_dict
         self.credentials_filepath = credentials_filepath
         if credentials_as_dict is not None:
@@ -36,6 +43,19 @@ class GCS(GoesStorage):
         self.subproduct = subproduct
         self.mode = mode
         self.bucket = bucket
+        self.byte_range = byte_range
+        self.pool_size = pool_size
+        self._reset_client()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ('_client', '_bucket', '_client_pid', '_client_lock'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_client()
 
     #
     # Storage methods
@@ -45,7 +65,9 @@ class GCS(GoesStorage):
                            credentials_as_dict=self.credentials_as_dict,
                            bucket=self.bucket,
                            product=self.product,
-                           credentials_filepath=self.credentials_filepath)
+                           credentials_filepath=self.credentials_filepath,
+                           byte_range=self.byte_range,
+                           pool_size=self.pool_size)
 
     def list(self, path):
         return self.list_blobs(path)
@@ -75,34 +97,64 @@ class GCS(GoesStorage):
     # GoesStorage methods
     #
     def get_client(self):
-        if self.credentials_as_dict:
-            client = gcs.Client(project="<none>", credentials=self.credentials)
-        else:
-            client = gcs.Client(project="<none>", credentials=AnonymousCredentials())
+        # One client per process: rebuilt after fork, since connections can't be shared
+        if self._client is None or self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    self._client = self._new_client()
+                    self._bucket = None
+                    self._client_pid = os.getpid()
+        return self._client
+
+    def get_bucket(self):
+        client = self.get_client()
+        if self._bucket is None:
+            # client.bucket doesn't make the metadata round trip of client.get_bucket
+            self._bucket = client.bucket(self.bucket)
+        return self._bucket
+
+    def _new_client(self):
+        credentials = self.credentials if self.credentials_as_dict else AnonymousCredentials()
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        client = gcs.Client(project="<none>", credentials=credentials, _http=session)
         client.project = None
         return client
 
-    def get_dataset(self, blob: GoesBlob) -> netCDF4.Dataset:
-        data = self.download_from_blob(blob)
-        return netCDF4.Dataset("in_memory_file", mode='r', memory=data)
+    def _reset_client(self):
+        self._client = None
+        self._bucket = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+
+    def get_dataset(self, blob: GoesBlob, byte_range: bool = None, open_mode: str = OPEN_MEMORY) -> netCDF4.Dataset:
+        '''
+        open_mode: OPEN_MEMORY or OPEN_MMAP (download to a temporary file and map it)
+        '''
+        if byte_range is None:
+            byte_range = self.byte_range
+        # Range requests go through the public media URL, so they need an anonymous bucket
+        if byte_range and not self.credentials_as_dict:
+            return open_dataset_from_url(get_media_url(blob.name, self.bucket))
+        return open_downloaded_dataset(self.gcs_blob(blob).download_to_file, open_mode)
 
     def grouped_one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_bands: List[ProductBand]) -> List[GroupedBandBlobs]:
-        band_blobs_list: List[BandBlobs] = []
-        for product_band in product_bands:
-            blobs = self.band_blobs(year, month, day, hour, product_band)
-            band_blobs_list.append(BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct))
-        return self.group_blobs(band_blobs_list)
+        blobs_by_start = self._blobs_by_start(
+            lambda product: path_prefix(year=year, month=month, day=day, hour=hour, product=product),
+            product_bands)
+        return group_blobs_by_start(blobs_by_start)
 
     def one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_band: ProductBand) -> BandBlobs:
         blobs = self.band_blobs(year, month, day, hour, product_band)
         return BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct)
 
     def grouped_one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_bands: List[ProductBand]) -> List[GroupedBandBlobs]:
-        band_blobs_list: List[BandBlobs] = []
-        for product_band in product_bands:
-            blobs = self.day_band_blobs(year, month, day, hours, product_band)
-            band_blobs_list.append(BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct))
-        return self.group_blobs(band_blobs_list)
+        blobs_by_start = self._blobs_by_start(
+            lambda product: day_path_prefix(year=year, month=month, day=day, product=product),
+            product_bands, hours=hours, delimiter=None)
+        return group_blobs_by_start(blobs_by_start)
 
     def one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand) -> BandBlobs:
         blobs = self.day_band_blobs(year, month, day, hours, product_band)
@@ -113,13 +165,15 @@ class GCS(GoesStorage):
     #
     def download_from_blob(self, blob):
         in_memory_file = io.BytesIO()
-        blob.download_to_file(in_memory_file)
-        in_memory_file.seek(0)
-        return in_memory_file.read()
+        self.gcs_blob(blob).download_to_file(in_memory_file)
+        # getvalue shares the buffer, read() would copy it
+        return in_memory_file.getvalue()
+
+    def download_blob(self, blob: GoesBlob) -> bytes:
+        return self.download_from_blob(blob)
 
     def download_as_stream(self, filepath):
-        client = self.get_client()
-        bucket = client.get_bucket(self.bucket)
+        bucket = self.get_bucket()
         blob = bucket.blob(filepath)
         return self.download_from_blob(blob)
 
@@ -128,49 +182,40 @@ class GCS(GoesStorage):
         return netCDF4.Dataset("in_memory_file", mode='r', memory=data)
 
     def list_blobs(self, path: str, delimiter='/'):
-        client = self.get_client()
-        bucket = client.get_bucket(self.bucket)
+        bucket = self.get_bucket()
         return bucket.list_blobs(prefix=path, delimiter=delimiter)
 
-    def get_blob(self, name: str):
-        client = self.get_client()
-        bucket = client.get_bucket(self.bucket)
-        return bucket.blob(name)
+    def get_blob(self, name: str, generation: int = None):
+        bucket = self.get_bucket()
+        return bucket.blob(name, generation=generation)
+
+    def gcs_blob(self, blob: GoesBlob):
+        # Blobs from a saved listing carry only their name, size and generation
+        if isinstance(blob, ListedBlob):
+            return self.get_blob(blob.name, generation=blob.generation)
+        return blob
 
     def band_blobs(self, year: int, month: int, day: int, hour: int, product_band: ProductBand) -> List[GoesBlob]:
-        return self._list_blobs(
-            path_prefix(year=year, month=month, day=day, hour=hour, product=product_band.product),
-            [file_regex_pattern(band=product_band.band, product=product_band.product, mode=self.mode, subproduct=product_band.subproduct)]
-        )
+        blobs_by_start = self._blobs_by_start(
+            lambda product: path_prefix(year=year, month=month, day=day, hour=hour, product=product),
+            [product_band])
+        return start_ordered_blobs(blobs_by_start)
 
     def day_band_blobs(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand) -> List[GoesBlob]:
-        return self._list_blobs(
-            day_path_prefix(year=year, month=month, day=day, product=product_band.product),
-            [hour_file_regex_pattern(hour=hour, band=product_band.band, product=product_band.product, mode=self.mode, subproduct=product_band.subproduct) for hour in hours],
-            delimiter=None
-        )
+        blobs_by_start = self._blobs_by_start(
+            lambda product: day_path_prefix(year=year, month=month, day=day, product=product),
+            [product_band], hours=hours, delimiter=None)
+        return start_ordered_blobs(blobs_by_start)
 
     def group_blobs(self, band_blobs_list: List[BandBlobs]) -> List[GroupedBandBlobs]:
-        blobs_by_start: Dict[str, Dict[Tuple[Product, Band], List[GoesBlob]]] = {}
+        blobs_by_start: BlobsByStart = {}
         for band_blobs in band_blobs_list:
+            band_key = (band_blobs.product, band_blobs.band)
             for blob in band_blobs.blobs:
-                key = blob.name[slice_obs_start(product=band_blobs.product, subproduct=band_blobs.subproduct)]
-                if key not in blobs_by_start:
-                    blobs_by_start[key] = {(band_blobs.product, band_blobs.band): [blob]}
-                else:
-                    band_key = (band_blobs.product, band_blobs.band)
-                    if band_key not in blobs_by_start[key]:
-                        blobs_by_start[key][band_key] = [blob]
-                    else:
-                        blobs_by_start[key][band_key].append(blob)
-        result: List[GroupedBandBlobs] = []
-        for start, band_blobs_dict in blobs_by_start.items():
-            blobs_list: List[BandBlobs] = []
-            for pband, blobs in band_blobs_dict.items():
-                band_blob: BandBlobs = BandBlobs(pband[0], pband[1], blobs)
-                blobs_list.append(band_blob)
-            result.append(GroupedBandBlobs(start, blobs_list))
-        return result
+                file_name = parse_file_name(blob.name)
+                if file_name is not None:
+                    blobs_by_start.setdefault(file_name.start, {}).setdefault(band_key, []).append(blob)
+        return group_blobs_by_start(blobs_by_start)
 
     def get_datasets(self, year: int, month: int, day: int, hour: int, bands: List[Band]):
         blobs = self.one_hour_blobs(year, month, day, hour, bands)
@@ -193,16 +238,11 @@ class GCS(GoesStorage):
     def set_credentials_dict(self, credentials_as_dict: dict):
         self.credentials = service_account.Credentials.from_service_account_info(credentials_as_dict)
 
-    def _list_blobs(self, path: str, gcs_patterns, delimiter='/') -> List[GoesBlob]:
-        blobs = self.list_blobs(path, delimiter=delimiter)
-        result = []
-        if gcs_patterns is None or len(gcs_patterns) == 0:
-            for blob in blobs:
-                result.append(blob)
-        else:
-            for blob in blobs:
-                for pattern in gcs_patterns:
-                    if pattern.search(blob.name):
-                        result.append(blob)
-        return result
-
+    def _blobs_by_start(self, get_prefix: Callable[[Product], str], product_bands: List[ProductBand],
+                        hours: List[int] = None, delimiter='/') -> BlobsByStart:
+        # One listing per product
+        blobs_by_start: BlobsByStart = {}
+        for product in dict.fromkeys(pb.product for pb in product_bands):
+            blobs = self.list_blobs(get_prefix(product), delimiter=delimiter)
+            add_blobs_by_start(blobs_by_start, blobs, product_bands, self.mode, hours)
+        return blobs_by_start
@@ -26,3 +26,77 @@ class GoesStorage(Storage):
     @abc.abstractmethod
     def get_blob(self, name: str) -> GoesBlob:
         pass
+
+    def download_blob(self, blob: GoesBlob) -> bytes:
+        return self.download_data(blob.name)
+
+
+class WrappedGoesStorage(GoesStorage):
+    '''
+    GoesStorage that delegates everything to another one
+    '''
+    def __init__(self, goes_storage: GoesStorage):
+        self.goes_storage = goes_storage
+
+    def __getattr__(self, name):
+        # Backend specific methods and attributes (list_blobs, mode, ...)
+        if name == 'goes_storage':
+            raise AttributeError(name)
+        return getattr(self.goes_storage, name)
+
+    #
+    # Storage methods
+    #
+    def get_storage_info(self):
+        return self.goes_storage.get_storage_info()
+
+    def list(self, path: str):
+        return self.goes_storage.list(path)
+
+    def mkdir(self, path: str):
+        return self.goes_storage.mkdir(path)
+
+    def append_data(self, data: bytes, filepath: str):
+        return self.goes_storage.append_data(data, filepath)
+
+    def append_stream(self, stream, filepath: str):
+        return self.goes_storage.append_stream(stream, filepath)
+
+    def create_data(self, data: bytes, filepath: str) -> bool:
+        return self.goes_storage.create_data(data, filepath)
+
+    def upload_data(self, data: bytes, filepath: str):
+        return self.goes_storage.upload_data(data, filepath)
+
+    def upload_stream(self, stream, filepath: str):
+        return self.goes_storage.upload_stream(stream, filepath)
+
+    def download_data(self, filepath: str) -> bytes:
+        return self.goes_storage.download_data(filepath)
+
+    def download_stream(self, filepath: str):
+        return self.goes_storage.download_stream(filepath)
+
+    def get_dataset(self, blob, **kwargs) -> Dataset:
+        return self.goes_storage.get_dataset(blob, **kwargs)
+
+    #
+    # GoesStorage methods
+    #
+    def grouped_one_hour_blobs(self, year: int, month: int, day: int, hour: int, bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        return self.goes_storage.grouped_one_hour_blobs(year, month, day, hour, bands)
+
+    def one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_band: ProductBand) -> BandBlobs:
+        return self.goes_storage.one_hour_blobs(year, month, day, hour, product_band)
+
+    def grouped_one_day_blobs(self, year: int, month: int, day: int, hours: List[int], bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        return self.goes_storage.grouped_one_day_blobs(year, month, day, hours, bands)
+
+    def one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand) -> BandBlobs:
+        return self.goes_storage.one_day_blobs(year, month, day, hours, product_band)
+
+    def get_blob(self, name: str, **kwargs) -> GoesBlob:
+        return self.goes_storage.get_blob(name, **kwargs)
+
+    def download_blob(self, blob: GoesBlob) -> bytes:
+        return self.goes_storage.download_blob(blob)
@@ -1,13 +1,16 @@
 import io
 from typing import List
 
+import shutil
 import netCDF4
-import urllib
+import urllib.request
 
 from cima.goes.storage._blobs import GroupedBandBlobs, BandBlobs, GoesBlob
 from cima.goes.storage._file_systems import StorageInfo, storage_type
 from cima.goes.storage._file_systems import Storage
 from cima.goes.utils._file_names import ProductBand, GOES_PUBLIC_BUCKET, ANY_MODE, Product, get_gcs_url, get_browse_url
+from cima.goes.utils._file_names import GCS_MEDIA_URL, get_media_url
+from cima.goes.storage._datasets import open_dataset_from_url, open_downloaded_dataset, OPEN_MEMORY
 
 
 class HTTP(Storage):
@@ -17,10 +20,14 @@ class HTTP(Storage):
     def __init__(self,
                  bucket: str=GOES_PUBLIC_BUCKET,
                  product: Product=Product.CMIPF,
-                 mode: str = ANY_MODE):
+                 mode: str = ANY_MODE,
+                 byte_range: bool = False,
+                 base_url: str = GCS_MEDIA_URL):
         self.product = product
         self.mode = mode
         self.bucket = bucket
+        self.byte_range = byte_range
+        self.base_url = base_url
 
     #
     # Storage methods
@@ -54,9 +61,16 @@ class HTTP(Storage):
     def download_stream(self, filepath: str) -> io.BytesIO:
         raise Exception('Not implemented: mkdir')
 
-    def get_dataset(self, filepath: str) -> netCDF4.Dataset:
-        resp = urllib.request.urlopen(get_gcs_url(filepath))
-        return netCDF4.Dataset("in_memory_file", mode='r', memory=resp.read())
+    def get_dataset(self, filepath: str, byte_range: bool = None, open_mode: str = OPEN_MEMORY) -> netCDF4.Dataset:
+        if byte_range is None:
+            byte_range = self.byte_range
+        if byte_range:
+            return open_dataset_from_url(get_media_url(filepath, self.bucket, self.base_url))
+
+        def download(file):
+            with urllib.request.urlopen(get_gcs_url(filepath)) as resp:
+                shutil.copyfileobj(resp, file)
+        return open_downloaded_dataset(download, open_mode)
 
     def append_data(self, data: bytes, filepath: str):
         raise Exception('Not implemented: upload_stream')
@@ -0,0 +1,174 @@
+import collections
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+from cima.goes.utils._file_names import ProductBand, Product, ANY_MODE, day_path_prefix, get_day_of_year
+from cima.goes.utils._file_names import FileNameKey, parse_file_name, product_band_key
+from cima.goes.storage._blobs import GroupedBandBlobs, BandBlobs, BlobsByStart, group_blobs_by_start
+from cima.goes.storage._blobs import ListedBlob
+from cima.goes.storage._file_systems import StorageInfo, storage_type
+from cima.goes.storage._goes_data import GoesStorage, WrappedGoesStorage
+
+
+# Listings of days that ended this long ago are considered complete
+COMPLETE_DAY_DELAY = datetime.timedelta(hours=2)
+
+
+class DayListing(object):
+    '''
+    Blobs of one (product, day) listing, indexed by observation start
+    '''
+    def __init__(self, blobs: List[ListedBlob]):
+        self.blobs = blobs
+        self.by_start: Dict[str, Dict[FileNameKey, List[Tuple[str, ListedBlob]]]] = {}
+        for blob in blobs:
+            file_name = parse_file_name(blob.name)
+            if file_name is None:
+                continue
+            band_blobs = self.by_start.setdefault(file_name.start, {}).setdefault(file_name.key, [])
+            band_blobs.append((file_name.mode, blob))
+        self.starts = sorted(self.by_start.keys())
+
+    def select(self, product_band: ProductBand, mode: str = ANY_MODE, hours: List[int] = None) -> List[Tuple[str, ListedBlob]]:
+        key = product_band_key(product_band)
+        mode_pattern = re.compile(mode)
+        hours = None if hours is None else set(hours)
+        result = []
+        for start in self.starts:
+            if hours is not None and int(start[7:9]) not in hours:
+                continue
+            for blob_mode, blob in self.by_start[start].get(key, []):
+                if mode_pattern.fullmatch(blob_mode):
+                    result.append((start, blob))
+        return result
+
+
+class IndexedGoesStorage(WrappedGoesStorage):
+    '''
+    Lists each (product, day) prefix once and answers the hour/day blobs
+    queries from that listing. Listings of complete days are kept in path,
+    so reprocessing a range doesn't list again. Days still receiving scans
+    (today) are listed again once their listing is incomplete_day_ttl seconds old.
+    '''
+    def __init__(self, goes_storage: GoesStorage, path: str = None, max_days_in_memory: int = 8,
+                 incomplete_day_ttl: float = 60):
+        super().__init__(goes_storage)
+        self.path = path
+        self.max_days_in_memory = max_days_in_memory
+        self.incomplete_day_ttl = incomplete_day_ttl
+        self.listing_calls = 0
+        self._days = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_days'] = collections.OrderedDict()
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_storage_info(self) -> StorageInfo:
+        return StorageInfo(storage_type.GOES_INDEX,
+                           storage_info=self.goes_storage.get_storage_info(),
+                           path=self.path,
+                           max_days_in_memory=self.max_days_in_memory,
+                           incomplete_day_ttl=self.incomplete_day_ttl)
+
+    #
+    # Listing index
+    #
+    def day_listing(self, product: Product, year: int, month: int, day: int) -> DayListing:
+        key = (product, year, month, day)
+        with self._lock:
+            if key in self._days:
+                listing, expires = self._days[key]
+                if expires is None or expires > time.monotonic():
+                    self._days.move_to_end(key)
+                    return listing
+        # Listed without the lock: other threads keep answering from the cached days
+        expires = None
+        listing = self._load(product, year, month, day)
+        if listing is None:
+            listing = self._list(product, year, month, day)
+            if _is_complete_day(year, month, day):
+                self._save(listing, product, year, month, day)
+            else:
+                expires = time.monotonic() + self.incomplete_day_ttl
+        with self._lock:
+            self._days[key] = (listing, expires)
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_days_in_memory:
+                self._days.popitem(last=False)
+        return listing
+
+    def listing_filepath(self, product: Product, year: int, month: int, day: int) -> str:
+        day_of_year = get_day_of_year(year, month, day)
+        return os.path.join(self.path, product.value, f'{year:04d}', f'{day_of_year:03d}.json')
+
+    def _list(self, product: Product, year: int, month: int, day: int) -> DayListing:
+        with self._lock:
+            self.listing_calls += 1
+        prefix = day_path_prefix(year=year, month=month, day=day, product=product)
+        blobs = [
+            ListedBlob(blob.name, blob.size, blob.generation)
+            for blob in self.goes_storage.list_blobs(prefix, delimiter=None)
+        ]
+        return DayListing(blobs)
+
+    def _load(self, product: Product, year: int, month: int, day: int):
+        if self.path is None:
+            return None
+        try:
+            with open(self.listing_filepath(product, year, month, day), mode='r') as f:
+                return DayListing([ListedBlob(*blob) for blob in json.load(f)])
+        except FileNotFoundError:
+            return None
+
+    def _save(self, listing: DayListing, product: Product, year: int, month: int, day: int):
+        if self.path is None:
+            return
+        filepath = self.listing_filepath(product, year, month, day)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = f'{filepath}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_filepath, mode='w') as f:
+            json.dump([list(asdict(blob).values()) for blob in listing.blobs], f)
+        os.replace(tmp_filepath, filepath)
+
+    def _select(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand):
+        listing = self.day_listing(product_band.product, year, month, day)
+        return listing.select(product_band, getattr(self.goes_storage, 'mode', ANY_MODE), hours)
+
+    #
+    # GoesStorage methods
+    #
+    def grouped_one_hour_blobs(self, year: int, month: int, day: int, hour: int, bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        return self.grouped_one_day_blobs(year, month, day, [hour], bands)
+
+    def one_hour_blobs(self, year: int, month: int, day: int, hour: int, product_band: ProductBand) -> BandBlobs:
+        return self.one_day_blobs(year, month, day, [hour], product_band)
+
+    def grouped_one_day_blobs(self, year: int, month: int, day: int, hours: List[int], bands: List[ProductBand]) -> List[GroupedBandBlobs]:
+        blobs_by_start: BlobsByStart = {}
+        for product_band in bands:
+            band_key = (product_band.product, product_band.band)
+            for start, blob in self._select(year, month, day, hours, product_band):
+                blobs_by_start.setdefault(start, {}).setdefault(band_key, []).append(blob)
+        return group_blobs_by_start(blobs_by_start)
+
+    def one_day_blobs(self, year: int, month: int, day: int, hours: List[int], product_band: ProductBand) -> BandBlobs:
+        blobs = [blob for _, blob in self._select(year, month, day, hours, product_band)]
+        return BandBlobs(product_band.product, product_band.band, blobs, subproduct=product_band.subproduct)
+
+
+def _is_complete_day(year: int, month: int, day: int) -> bool:
+    day_end = datetime.datetime(year=year, month=month, day=day) + datetime.timedelta(days=1)
+    return day_end + COMPLETE_DAY_DELAY < datetime.datetime.utcnow()
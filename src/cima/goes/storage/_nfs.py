@@ -1,7 +1,9 @@
 import os
 import io
+import uuid
 import netCDF4
 from cima.goes.storage._file_systems import Storage, storage_type, StorageInfo
+from cima.goes.storage._datasets import open_dataset_from_path, OPEN_PATH
 
 
 class NFS(Storage):
@@ -39,12 +41,45 @@ class NFS(Storage):
         with open(filepath, mode='rb') as f:
             return f.read()
 
-    def get_dataset(self, filepath):
-        data = self.download_data(filepath)
-        return netCDF4.Dataset("in_memory_file", mode='r', memory=data)
+    def get_dataset(self, filepath, byte_range: bool = False, open_mode: str = OPEN_PATH):
+        '''
+        open_mode: OPEN_PATH, OPEN_MMAP or OPEN_MEMORY (the whole file read in memory).
+        byte_range is kept for compatibility: it means OPEN_PATH.
+        '''
+        if byte_range:
+            open_mode = OPEN_PATH
+        return open_dataset_from_path(filepath, open_mode)
 
     def append_data(self, data: bytes, filepath: str):
-        raise Exception('Not implemented: upload_stream')
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A single O_APPEND write, so appends of several processes don't interleave
+        fd = os.open(filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
 
     def append_stream(self, stream: io.BytesIO, filepath: str):
-        raise Exception('Not implemented: upload_stream')
+        self.append_data(stream.read(), filepath)
+
+    def create_data(self, data: bytes, filepath: str) -> bool:
+        '''
+        A complete temporary file is hard linked as filepath: link fails if it exists,
+        atomically also between NFS clients (unlike O_APPEND or O_EXCL on old NFS versions)
+        '''
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filepath = f'{filepath}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_filepath, mode='wb') as f:
+            f.write(data)
+        try:
+            os.link(tmp_filepath, filepath)
+            return True
+        except FileExistsError:
+            # A retried NFS LINK can fail after it was done: then the file has 2 links
+            return os.stat(tmp_filepath).st_nlink == 2
+        finally:
+            os.remove(tmp_filepath)
@@ -0,0 +1,94 @@
+import collections
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+from cima.goes.storage._blobs import GoesBlob
+from cima.goes.storage._goes_data import GoesStorage, WrappedGoesStorage
+from cima.goes.storage._datasets import open_dataset_from_memory
+
+
+@dataclass
+class Prefetch:
+    # Items downloaded ahead of the one being processed
+    groups: int = 2
+    # Download threads
+    workers: int = 4
+    # Budget for downloaded (and being downloaded) bytes
+    max_bytes: int = 1 << 30
+    # Bytes counted for a blob listed without its size
+    blob_size: int = 1 << 27
+
+
+BlobsData = Dict[str, bytes]
+
+
+def _blob_size(blob: GoesBlob, default: int) -> int:
+    size = getattr(blob, 'size', None)
+    return int(size) if size is not None else default
+
+
+def prefetch_blobs(goes_storage: GoesStorage,
+                   items: Iterable[Any],
+                   get_blobs: Callable[[Any], List[GoesBlob]],
+                   prefetch: Prefetch) -> Iterator[Tuple[Any, BlobsData]]:
+    '''
+    Yields (item, {blob name: data}) for every item, while the blobs of the
+    next prefetch.groups items are downloaded by a thread pool.
+    The item being processed counts against max_bytes until the consumer asks for the next one.
+    Items without blobs (e.g. end of hour marks) pass through without taking a group.
+    '''
+    items = iter(items)
+    pending = collections.deque()
+    state = {'bytes': 0, 'groups': 0, 'next': None, 'exhausted': False}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch.workers) as executor:
+        def fill():
+            while not state['exhausted'] and state['groups'] < prefetch.groups:
+                if state['next'] is None:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        state['exhausted'] = True
+                        return
+                    state['next'] = (item, get_blobs(item))
+                item, blobs = state['next']
+                nbytes = sum(_blob_size(blob, prefetch.blob_size) for blob in blobs)
+                if blobs and state['bytes'] > 0 and state['bytes'] + nbytes > prefetch.max_bytes:
+                    return
+                futures = {blob.name: executor.submit(goes_storage.download_blob, blob) for blob in blobs}
+                pending.append((item, futures, nbytes))
+                state['bytes'] += nbytes
+                state['groups'] += 1 if blobs else 0
+                state['next'] = None
+
+        while True:
+            fill()
+            if not pending:
+                break
+            item, futures, nbytes = pending.popleft()
+            state['groups'] -= 1 if futures else 0
+            fill()
+            blobs_data = {name: future.result() for name, future in futures.items()}
+            yield item, blobs_data
+            state['bytes'] -= nbytes
+
+
+class PrefetchedGoesStorage(WrappedGoesStorage):
+    '''
+    GoesStorage that opens already downloaded blobs from memory
+    '''
+    def __init__(self, goes_storage: GoesStorage, blobs_data: BlobsData):
+        super().__init__(goes_storage)
+        self.blobs_data = blobs_data
+
+    def download_blob(self, blob: GoesBlob) -> bytes:
+        data = self.blobs_data.get(blob.name)
+        if data is None:
+            return self.goes_storage.download_blob(blob)
+        return data
+
+    def get_dataset(self, blob: GoesBlob, **kwargs):
+        data = self.blobs_data.get(blob.name)
+        if data is None:
+            return self.goes_storage.get_dataset(blob, **kwargs)
+        return open_dataset_from_memory(data)
@@ -1 +1,8 @@
-from cima.goes.tasks._concurrent import run_concurrent, Task, Tasks
\ No newline at end of file
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562)
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_concurrent': ['run_concurrent', 'iter_concurrent', 'run_concurrent_async', 'Task', 'Tasks'],
+    '_worker': ['worker_resource', 'set_worker_resource', 'init_worker_resources'],
+    '_shared': ['SharedArrays', 'SharedArray', 'attach_shared_arrays'],
+})
@@ -1,7 +1,7 @@
 import asyncio
 import concurrent.futures
 from dataclasses import dataclass
-from typing import Callable, List, Dict, Tuple
+from typing import Callable, List, Dict, Tuple, Iterable, Iterator, Any
 
 
 @dataclass
@@ -18,28 +18,79 @@ class Task:
 Tasks = List[Task]
 
 
-async def _run(tasks: Tasks, workers):
-    def submit(task):
-        return executor.submit(task.func, *task.args, **task.kwargs)
+def _run_task(task: Task):
+    return task.func(*task.args, **task.kwargs)
 
-    out = []
-    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
-        futures = [submit(task) for task in tasks]
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                out.append(future.result())
-            except Exception as e:
-                out.append(e)
-    return out
-
-
-def run_concurrent(tasks: Tasks, workers):
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    loop = asyncio.get_event_loop()
 
+def iter_concurrent(tasks: Iterable[Task], workers: int,
+                    max_in_flight: int = None, max_tasks_per_child: int = None,
+                    initializer: Callable = None, initargs: Tuple = ()) -> Iterator[Any]:
+    '''
+    Runs tasks on a process pool and yields every result (or the exception
+    it raised) in completion order.
+    tasks is consumed lazily and at most max_in_flight (default 2 * workers)
+    tasks are pickled and pending at any time.
+    With max_tasks_per_child, the pool is replaced after workers * max_tasks_per_child
+    submissions, so no worker process runs more than about max_tasks_per_child tasks.
+    The old pool ends its pending tasks before the new one starts: at most workers processes run.
+    initializer(*initargs) runs once in every worker process, before its first task,
+    to set up what its tasks share (see worker_resource) instead of sending it with each task.
+    '''
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    max_in_flight = max(1, max_in_flight)
+    pool_tasks = None if max_tasks_per_child is None else workers * max_tasks_per_child
+    tasks = iter(tasks)
+    pending = set()
+    executor = None
+    submitted = 0
     try:
-        future = asyncio.ensure_future(_run(tasks, workers))
-        results = loop.run_until_complete(future)
-        return results
+        while True:
+            while len(pending) < max_in_flight:
+                if executor is not None and pool_tasks is not None and submitted >= pool_tasks:
+                    if pending:
+                        # Drained first, so the old and new pools never run at the same time
+                        break
+                    executor.shutdown(wait=True)
+                    executor = None
+                task = next(tasks, None)
+                if task is None:
+                    break
+                if executor is None:
+                    executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers, initializer=initializer, initargs=initargs)
+                    submitted = 0
+                pending.add(executor.submit(_run_task, task))
+                submitted += 1
+            if not pending:
+                return
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield e
     finally:
-        loop.close()
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def run_concurrent(tasks: Iterable[Task], workers: int,
+                   max_in_flight: int = None, max_tasks_per_child: int = None,
+                   initializer: Callable = None, initargs: Tuple = ()) -> List[Any]:
+    return list(iter_concurrent(tasks, workers, max_in_flight=max_in_flight, max_tasks_per_child=max_tasks_per_child,
+                                initializer=initializer, initargs=initargs))
+
+
+async def run_concurrent_async(tasks: Iterable[Task], workers: int,
+                               max_in_flight: int = None, max_tasks_per_child: int = None,
+                               initializer: Callable = None, initargs: Tuple = ()) -> List[Any]:
+    '''
+    run_concurrent for code already in an event loop: the pool is driven
+    from a thread, so the loop is not blocked while tasks run.
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, run_concurrent, tasks, workers, max_in_flight, max_tasks_per_child, initializer, initargs)
@@ -0,0 +1,88 @@
+import uuid
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+import numpy as np
+
+# Blocks attached by this process, kept open while it lives
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+@dataclass
+class SharedArray:
+    '''
+    Picklable handle of an array published by SharedArrays
+    '''
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    def attach(self) -> np.ndarray:
+        '''
+        Read only view of the array, without copying it. A block is attached once per process.
+        '''
+        block = _attached.get(self.name)
+        if block is None:
+            block = shared_memory.SharedMemory(name=self.name)
+            _attached[self.name] = block
+        array = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=block.buf)
+        array.setflags(write=False)
+        return array
+
+
+def attach_shared_arrays(handles: Dict[str, SharedArray]) -> Dict[str, np.ndarray]:
+    return {key: handle.attach() for key, handle in handles.items()}
+
+
+class SharedArrays(object):
+    '''
+    Read only arrays (full disk lats/lons, region indexes, lookup tables...)
+    published once in shared memory by the parent process.
+    Workers get the SharedArray handles (a few bytes each) and attach them
+    as numpy views, so the memory used doesn't grow with the number of workers.
+    The owner unlinks every block on close.
+    '''
+    def __init__(self):
+        self._blocks: Dict[str, shared_memory.SharedMemory] = {}
+        self.handles: Dict[str, SharedArray] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def create(self, key: str, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        '''
+        Allocates key and returns a writable view, to be filled in place
+        (e.g. by row blocks) without a private copy of the whole array
+        '''
+        if key in self.handles:
+            raise Exception(f'Shared array already published: {key}')
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        block = shared_memory.SharedMemory(name=f'cima_{uuid.uuid4().hex[:16]}', create=True, size=size)
+        self._blocks[key] = block
+        self.handles[key] = SharedArray(block.name, shape, dtype.str)
+        return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def publish(self, key: str, array: np.ndarray) -> SharedArray:
+        if np.ma.isMaskedArray(array):
+            raise Exception(f'Masked arrays can not be shared, fill {key} first')
+        array = np.asarray(array)
+        view = self.create(key, array.shape, array.dtype)
+        view[...] = array
+        del view
+        return self.handles[key]
+
+    def close(self):
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # Views of create() still alive here: the memory is freed when they are
+                pass
+            block.unlink()
+        self._blocks = {}
+        self.handles = {}
@@ -0,0 +1,28 @@
+from typing import Any, Callable, Dict
+
+# Objects of the current process, shared by every task it runs
+_resources: Dict[str, Any] = {}
+
+
+def worker_resource(name: str, factory: Callable[[], Any] = None) -> Any:
+    '''
+    Resource name of this process (None if it doesn't exist).
+    With factory, a missing resource is created once and kept for the next tasks.
+    '''
+    if name not in _resources and factory is not None:
+        _resources[name] = factory()
+    return _resources.get(name)
+
+
+def set_worker_resource(name: str, value: Any):
+    _resources[name] = value
+
+
+def init_worker_resources(factories: Dict[str, Callable[[], Any]]):
+    '''
+    Worker initializer: creates every resource of factories (name: factory) in the new process,
+    e.g. initializer=init_worker_resources, initargs=({'palette': get_cloud_tops_palette},)
+    Factories must be picklable (module level functions, functools.partial...).
+    '''
+    for name, factory in factories.items():
+        _resources[name] = factory()
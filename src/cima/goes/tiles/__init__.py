@@ -1,6 +1,16 @@
-from cima.goes.tiles._dataset_region import DatasetRegion, LatLonRegion, RegionIndexes, SatBandKey
-from cima.goes.tiles._dataset_region import find_dataset_region, dataset_region_as_dict, expand_region, band_key_as_string
-from cima.goes.tiles._dataset_region import get_tiles, tiles_to_dict, TilesDict, dataset_key_as_string
-from cima.goes.tiles._dataset_region import region_data_from_dict, get_dataset_key, dict_to_tiles, get_tile_extent
-from cima.goes.tiles._dataset_region import save_tiles, save_region_data, load_tiles, load_region_data, RegionData, save_netcdf
-from cima.goes.tiles._dataset_region import get_data, generate_region_data, get_dataset_region, get_lats_lons, contract_region
\ No newline at end of file
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562)
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_dataset_region': [
+        'DatasetRegion', 'LatLonRegion', 'RegionIndexes', 'SatBandKey', 'find_dataset_region',
+        'dataset_region_as_dict', 'expand_region', 'band_key_as_string', 'get_tiles', 'tiles_to_dict', 'TilesDict',
+        'dataset_key_as_string', 'region_data_from_dict', 'get_dataset_key', 'dict_to_tiles', 'get_tile_extent',
+        'save_tiles', 'save_region_data', 'load_tiles', 'load_region_data', 'RegionData', 'save_netcdf', 'get_data',
+        'generate_region_data', 'get_dataset_region', 'get_lats_lons', 'contract_region', 'project_lats_lons',
+        'get_geos_projection', 'project_region_indexes', 'lats_lons_to_indexes', 'lats_lons_to_pixels',
+        'disk_region_indexes',
+    ],
+    '_lats_lons_cache': ['LatsLonsCache', 'share_lats_lons'],
+    '_clip': ['save_netcdf_blocks', 'get_variable_name'],
+})
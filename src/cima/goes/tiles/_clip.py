@@ -0,0 +1,94 @@
+import numpy as np
+from netCDF4 import Dataset
+from cima.goes.tiles._dataset_region import RegionIndexes, get_dataset_key, project_lats_lons
+
+
+PACK_INT16 = 'int16'
+
+
+def get_variable_name(dataset, variable: str = None) -> str:
+    if variable is None:
+        if 'CMI' in dataset.variables:
+            variable = 'CMI'
+        elif 'Rad' in dataset.variables:
+            variable = 'Rad'
+    return variable
+
+
+def full_indexes(dataset) -> RegionIndexes:
+    return RegionIndexes(
+        x_min=0, x_max=dataset.dimensions['x'].size,
+        y_min=0, y_max=dataset.dimensions['y'].size)
+
+
+def save_netcdf_blocks(filename: str, dataset, indexes: RegionIndexes = None, variable: str = None,
+                       block_rows: int = 512, complevel: int = 4, shuffle: bool = True,
+                       pack: str = None, coords_dtype=np.float32, lats_lons_cache=None):
+    '''
+    Same output layout as save_netcdf, but the region is read, projected and
+    written by blocks of block_rows rows, so memory is bound by the block size.
+    pack='int16' stores the variable as int16 with the source scale_factor/add_offset
+    (and _Unsigned).
+    '''
+    variable = get_variable_name(dataset, variable)
+    if indexes is None:
+        indexes = full_indexes(dataset)
+    source = dataset.variables[variable]
+    dataset_key = get_dataset_key(dataset)
+    x = np.array(dataset['x'][indexes.x_min: indexes.x_max])
+    y = np.array(dataset['y'][indexes.y_min: indexes.y_max])
+    rows, cols = len(y), len(x)
+    chunksizes = (max(1, min(block_rows, rows)), max(1, cols))
+    compression = dict(zlib=complevel > 0, complevel=complevel, shuffle=shuffle, chunksizes=chunksizes)
+
+    clipped_dataset = Dataset(filename, 'w', format='NETCDF4')
+    try:
+        clipped_dataset.createDimension('x', rows)
+        clipped_dataset.createDimension('y', cols)
+
+        # create latitude axis
+        new_lats = clipped_dataset.createVariable('lats', coords_dtype, ('x', 'y'), **compression)
+        new_lats.standard_name = 'latitude'
+        new_lats.long_name = 'latitude'
+        new_lats.units = 'degrees_north'
+        new_lats.axis = 'Y'
+
+        # create longitude axis
+        new_lons = clipped_dataset.createVariable('lons', coords_dtype, ('x', 'y'), **compression)
+        new_lons.standard_name = 'longitude'
+        new_lons.long_name = 'longitude'
+        new_lons.units = 'degrees_east'
+        new_lons.axis = 'X'
+
+        # create variable array
+        if pack == PACK_INT16:
+            if not hasattr(source, 'scale_factor'):
+                raise Exception(f'{variable} has no scale_factor to pack as int16')
+            fill_value = getattr(source, '_FillValue', np.int16(-1))
+            new_data = clipped_dataset.createVariable(variable, np.int16, ('x', 'y'), fill_value=fill_value, **compression)
+            new_data.scale_factor = source.scale_factor
+            new_data.add_offset = getattr(source, 'add_offset', 0.0)
+            if hasattr(source, '_Unsigned'):
+                # Set before writing: the packed values are converted through the unsigned type
+                new_data._Unsigned = source._Unsigned
+        elif pack is None:
+            new_data = clipped_dataset.createVariable(variable, np.float32, ('x', 'y'), **compression)
+        else:
+            raise Exception(f'Packing not implemented: {pack}')
+        new_data.long_name = source.long_name
+        new_data.units = source.units
+
+        for row in range(0, rows, block_rows):
+            last_row = min(row + block_rows, rows)
+            y_min = indexes.y_min + row
+            y_max = indexes.y_min + last_row
+            if lats_lons_cache is not None:
+                block_indexes = RegionIndexes(x_min=indexes.x_min, x_max=indexes.x_max, y_min=y_min, y_max=y_max)
+                lats, lons = lats_lons_cache.get_lats_lons(dataset, block_indexes)
+            else:
+                lats, lons = project_lats_lons(dataset_key, x, y[row:last_row])
+            new_lats[row:last_row, :] = lats
+            new_lons[row:last_row, :] = lons
+            new_data[row:last_row, :] = source[y_min: y_max, indexes.x_min: indexes.x_max]
+    finally:
+        clipped_dataset.close()
@@ -2,7 +2,6 @@ import json
 from dataclasses import dataclass, asdict
 from typing import Dict, Tuple, List
 import numpy as np
-import pyproj
 from netCDF4 import Dataset
 from cima.goes.storage._file_systems import Storage
 from cima.goes.storage._goes_data import GoesStorage
@@ -184,19 +183,32 @@ def contract_region(region: LatLonRegion, lat, lon):
     )
 
 
-def get_lats_lons(dataset, indexes: RegionIndexes = None):
+def get_geos_projection(dataset_key: SatBandKey):
+    # pyproj is only loaded by the processes that project
+    import pyproj
+    return pyproj.Proj(proj='geos', h=dataset_key.sat_height, lon_0=dataset_key.sat_lon,
+                       sweep=dataset_key.sat_sweep)
+
+
+def project_lats_lons(dataset_key: SatBandKey, x, y):
+    # x, y: scan angles (radians)
+    XX, YY = np.meshgrid(np.array(x) * dataset_key.sat_height, np.array(y) * dataset_key.sat_height)
+    projection = get_geos_projection(dataset_key)
+    lons, lats = projection(XX, YY, inverse=True)
+    return np.array(lats), np.array(lons)
+
+
+def get_lats_lons(dataset, indexes: RegionIndexes = None, cache=None):
+    if cache is not None:
+        return cache.get_lats_lons(dataset, indexes)
     dataset_key = get_dataset_key(dataset)
     if indexes is None:
-        x = dataset['x'][:] * dataset_key.sat_height
-        y = dataset['y'][:] * dataset_key.sat_height
+        x = dataset['x'][:]
+        y = dataset['y'][:]
     else:
-        x = dataset['x'][indexes.x_min: indexes.x_max] * dataset_key.sat_height
-        y = dataset['y'][indexes.y_min: indexes.y_max] * dataset_key.sat_height
-    XX, YY = np.meshgrid(np.array(x), np.array(y))
-    projection = pyproj.Proj(proj='geos', h=dataset_key.sat_height, lon_0=dataset_key.sat_lon,
-                             sweep=dataset_key.sat_sweep)
-    lons, lats = projection(XX, YY, inverse=True)
-    return np.array(lats), np.array(lons)
+        x = dataset['x'][indexes.x_min: indexes.x_max]
+        y = dataset['y'][indexes.y_min: indexes.y_max]
+    return project_lats_lons(dataset_key, x, y)
 
 
 def get_data(dataset, indexes: RegionIndexes = None, variable: str = None):
@@ -215,7 +227,8 @@ def get_data(dataset, indexes: RegionIndexes = None, variable: str = None):
     return data
 
 
-def save_netcdf(filename: str, dataset, indexes: RegionIndexes = None, variable: str = None, compressed=True):
+def save_netcdf(filename: str, dataset, indexes: RegionIndexes = None, variable: str = None, compressed=True,
+                lats_lons_cache=None):
     if variable is None:
         if 'CMI' in dataset.variables:
             variable = 'CMI'
@@ -224,7 +237,7 @@ def save_netcdf(filename: str, dataset, indexes: RegionIndexes = None, variable:
 
     data = get_data(dataset, indexes, variable)
 
-    lats, lons = get_lats_lons(dataset, indexes)
+    lats, lons = get_lats_lons(dataset, indexes, cache=lats_lons_cache)
 
     clipped_dataset = Dataset(filename, 'w', format='NETCDF4')
     clipped_dataset.createDimension('x', data.shape[0])
@@ -269,10 +282,14 @@ def get_dataset_key(dataset: Dataset) -> SatBandKey:
     )
 
 
-def find_dataset_region(dataset, region: LatLonRegion, major_order=default_major_order) -> DatasetRegion:
+def find_dataset_region(dataset, region: LatLonRegion, major_order=default_major_order,
+                        exhaustive: bool = False) -> DatasetRegion:
     sat_band_key = get_dataset_key(dataset)
-    lats, lons = get_lats_lons(dataset)
-    indexes = find_indexes(region, lats, lons, major_order)
+    if exhaustive:
+        lats, lons = get_lats_lons(dataset)
+        indexes = find_indexes(region, lats, lons, major_order)
+    else:
+        indexes = project_region_indexes(dataset, region)
     return DatasetRegion(
         sat_band_key=sat_band_key,
         region=region,
@@ -300,6 +317,93 @@ def find_indexes(region: LatLonRegion, lats, lons, major_order) -> RegionIndexes
     return indexes
 
 
+def lats_lons_to_pixels(dataset, lats, lons):
+    # Forward geos projection: lat/lon -> scan angles -> fractional pixel (x, y).
+    # Points outside the earth disk are NaN.
+    dataset_key = get_dataset_key(dataset)
+    projection = get_geos_projection(dataset_key)
+    xx, yy = projection(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    xx = np.where(np.isfinite(xx), xx, np.nan)
+    yy = np.where(np.isfinite(yy), yy, np.nan)
+    x_var = dataset['x']
+    y_var = dataset['y']
+    x_pixels = (xx / dataset_key.sat_height - float(x_var[0])) / float(x_var.scale_factor)
+    y_pixels = (yy / dataset_key.sat_height - float(y_var[0])) / float(y_var.scale_factor)
+    return x_pixels, y_pixels
+
+
+def lats_lons_to_indexes(dataset, lats, lons):
+    # Nearest pixel (x, y) indexes. Points outside the earth disk are dropped,
+    # project_region_indexes falls back to disk_region_indexes for those regions.
+    dataset_key = get_dataset_key(dataset)
+    x_pixels, y_pixels = lats_lons_to_pixels(dataset, lats, lons)
+    valid = np.isfinite(x_pixels) & np.isfinite(y_pixels)
+    x_indexes = np.rint(x_pixels[valid]).astype(np.int64)
+    y_indexes = np.rint(y_pixels[valid]).astype(np.int64)
+    x_indexes = np.clip(x_indexes, 0, dataset_key.x_size - 1)
+    y_indexes = np.clip(y_indexes, 0, dataset_key.y_size - 1)
+    return x_indexes, y_indexes
+
+
+def region_boundary(region: LatLonRegion, edge_samples: int = 32):
+    # Corners plus samples along each edge (edges are curved in the geos grid)
+    lat_steps = np.linspace(region.lat_north, region.lat_south, edge_samples + 1)
+    lon_steps = np.linspace(region.lon_west, region.lon_east, edge_samples + 1)
+    lats = np.concatenate([
+        np.full_like(lon_steps, region.lat_north),
+        np.full_like(lon_steps, region.lat_south),
+        lat_steps,
+        lat_steps])
+    lons = np.concatenate([
+        lon_steps,
+        lon_steps,
+        np.full_like(lat_steps, region.lon_west),
+        np.full_like(lat_steps, region.lon_east)])
+    return lats, lons
+
+
+def project_region_indexes(dataset, region: LatLonRegion, edge_samples: int = 32) -> RegionIndexes:
+    lats, lons = region_boundary(region, edge_samples)
+    x_indexes, y_indexes = lats_lons_to_indexes(dataset, lats, lons)
+    if len(x_indexes) < len(lats):
+        # The boundary leaves the earth disk: the window can't be taken from the boundary alone
+        return disk_region_indexes(dataset, region)
+    return RegionIndexes(
+        x_min=int(x_indexes.min()),
+        x_max=int(x_indexes.max()),
+        y_min=int(y_indexes.min()),
+        y_max=int(y_indexes.max()),
+    )
+
+
+def disk_region_indexes(dataset, region: LatLonRegion, block_rows: int = 512) -> RegionIndexes:
+    '''
+    Extent of the on-disk pixels inside the region, projecting the grid by
+    blocks of block_rows rows.
+    '''
+    dataset_key = get_dataset_key(dataset)
+    x = np.array(dataset['x'][:])
+    y = np.array(dataset['y'][:])
+    x_min = y_min = None
+    x_max = y_max = -1
+    for row in range(0, len(y), block_rows):
+        lats, lons = project_lats_lons(dataset_key, x, y[row: row + block_rows])
+        inside = ((lats <= region.lat_north) & (lats >= region.lat_south) &
+                  (lons >= region.lon_west) & (lons <= region.lon_east))
+        rows, cols = np.nonzero(inside)
+        if len(rows) == 0:
+            continue
+        if y_min is None:
+            y_min = row + int(rows.min())
+            x_min = int(cols.min())
+        x_min = min(x_min, int(cols.min()))
+        x_max = max(x_max, int(cols.max()))
+        y_max = row + int(rows.max())
+    if y_min is None:
+        raise Exception(f'Region outside of the satellite disk: {region}')
+    return RegionIndexes(x_min=x_min, x_max=x_max, y_min=y_min, y_max=y_max)
+
+
 def get_tiles(region: LatLonRegion,
               lat_step: float,
               lon_step: float,
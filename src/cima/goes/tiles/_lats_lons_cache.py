@@ -0,0 +1,96 @@
+import os
+import threading
+from typing import Dict, Tuple
+import numpy as np
+from cima.goes.tiles._dataset_region import SatBandKey, RegionIndexes
+from cima.goes.tiles._dataset_region import get_dataset_key, band_key_as_string, project_lats_lons
+from cima.goes.tasks._shared import SharedArrays
+
+
+class LatsLonsCache(object):
+    '''
+    On disk cache of full grid lats/lons per SatBandKey.
+    Grids are stored as float32 .npy files and opened memory-mapped,
+    so a region is just a slice of the mapped file.
+    '''
+    def __init__(self, base_path: str, dtype=np.float32, block_rows: int = 512):
+        self.base_path = base_path
+        self.dtype = dtype
+        self.block_rows = block_rows
+        self._grids: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def get_lats_lons(self, dataset, indexes: RegionIndexes = None):
+        lats, lons = self.get_grid(dataset)
+        if indexes is None:
+            return lats, lons
+        window = (slice(indexes.y_min, indexes.y_max), slice(indexes.x_min, indexes.x_max))
+        return lats[window], lons[window]
+
+    def get_grid(self, dataset):
+        sat_band_key = get_dataset_key(dataset)
+        key = band_key_as_string(sat_band_key)
+        grid = self._grids.get(key)
+        if grid is not None:
+            return grid
+        with self._lock:
+            if key not in self._grids:
+                lats_path, lons_path = self.grid_paths(sat_band_key)
+                if not (os.path.exists(lats_path) and os.path.exists(lons_path)):
+                    self._build(dataset, sat_band_key, lats_path, lons_path)
+                self._grids[key] = (np.load(lats_path, mmap_mode='r'), np.load(lons_path, mmap_mode='r'))
+            return self._grids[key]
+
+    def grid_paths(self, sat_band_key: SatBandKey) -> Tuple[str, str]:
+        name = band_key_as_string(sat_band_key).replace('#', '_')
+        return (os.path.join(self.base_path, f'{name}.lats.npy'),
+                os.path.join(self.base_path, f'{name}.lons.npy'))
+
+    def _build(self, dataset, sat_band_key: SatBandKey, lats_path: str, lons_path: str):
+        os.makedirs(self.base_path, exist_ok=True)
+        x = np.array(dataset['x'][:])
+        y = np.array(dataset['y'][:])
+        shape = (len(y), len(x))
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        tmp_lats_path = lats_path + suffix
+        tmp_lons_path = lons_path + suffix
+        try:
+            lats = np.lib.format.open_memmap(tmp_lats_path, mode='w+', dtype=self.dtype, shape=shape)
+            lons = np.lib.format.open_memmap(tmp_lons_path, mode='w+', dtype=self.dtype, shape=shape)
+            # Project by row blocks to avoid full grid float64 temporaries
+            for row in range(0, shape[0], self.block_rows):
+                rows = slice(row, min(row + self.block_rows, shape[0]))
+                lats[rows], lons[rows] = project_lats_lons(sat_band_key, x, y[rows])
+            lats.flush()
+            lons.flush()
+            del lats, lons
+            # Atomic publish, so concurrent workers never see partial files
+            os.replace(tmp_lats_path, lats_path)
+            os.replace(tmp_lons_path, lons_path)
+        finally:
+            for path in (tmp_lats_path, tmp_lons_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def share_lats_lons(shared_arrays: SharedArrays, dataset, indexes: RegionIndexes = None, prefix: str = '',
+                    dtype=np.float32, block_rows: int = 512) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Publishes the lats/lons of dataset (or of its indexes region) in shared_arrays
+    as f'{prefix}lats' and f'{prefix}lons', projected by row blocks straight
+    into shared memory. Returns the parent's views.
+    '''
+    sat_band_key = get_dataset_key(dataset)
+    if indexes is None:
+        x = np.array(dataset['x'][:])
+        y = np.array(dataset['y'][:])
+    else:
+        x = np.array(dataset['x'][indexes.x_min: indexes.x_max])
+        y = np.array(dataset['y'][indexes.y_min: indexes.y_max])
+    shape = (len(y), len(x))
+    lats = shared_arrays.create(f'{prefix}lats', shape, dtype)
+    lons = shared_arrays.create(f'{prefix}lons', shape, dtype)
+    for row in range(0, shape[0], block_rows):
+        rows = slice(row, min(row + block_rows, shape[0]))
+        lats[rows], lons[rows] = project_lats_lons(sat_band_key, x, y[rows])
+    return lats, lons
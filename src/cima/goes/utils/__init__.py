@@ -1,2 +1,8 @@
-from cima.goes.utils._timeit import timeit, start_time, diff_time
-from cima.goes.utils._process_info import get_usage
\ No newline at end of file
+from cima.goes._lazy import lazy_exports
+
+# Names are imported from their module on first use (PEP 562)
+__getattr__, __dir__, __all__ = lazy_exports(__name__, {
+    '_timeit': ['timeit', 'start_time', 'diff_time'],
+    '_process_info': ['get_usage'],
+    '_import_time': ['import_time', 'import_times'],
+})
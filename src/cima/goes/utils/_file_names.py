@@ -1,6 +1,7 @@
 import datetime
 from dataclasses import dataclass
 from enum import IntEnum, Enum, unique
+from typing import NamedTuple, Optional, Tuple
 import re
 
 # File neme pattern:
@@ -131,6 +132,74 @@ def hour_file_regex_pattern(hour: int, band: Band, product: Product = Product.CM
     return re.compile(hour_file_name(hour, band, product, mode, subproduct=subproduct))
 
 
+FILE_NAME_PATTERN = re.compile(
+    r'OR_(?P<product>[^-_/]+-[^-_/]+-[A-Za-z]+)(?P<subproduct>\d*)'
+    r'(?:-(?P<mode>M\d)(?:C(?P<band>\d{2}))?)?'
+    r'_(?P<sat>G\d\d)_s(?P<start>\d{14})_e(?P<end>\d{14})_c(?P<creation>\d{14})')
+
+
+FileNameKey = Tuple[str, str, Optional[int]]  # (product, subproduct, band)
+
+
+def goes_datetime(value: str) -> datetime.datetime:
+    # YYYYJJJHHMMSSs
+    return datetime.datetime(year=int(value[0:4]), month=1, day=1) + datetime.timedelta(
+        days=int(value[4:7]) - 1,
+        hours=int(value[7:9]),
+        minutes=int(value[9:11]),
+        seconds=int(value[11:13]),
+        milliseconds=int(value[13]) * 100)
+
+
+class GoesFileName(NamedTuple):
+    product: str
+    subproduct: str
+    mode: str
+    band: Optional[int]
+    sat: str
+    start: str
+    end: str
+    creation: str
+
+    @property
+    def key(self) -> FileNameKey:
+        return self.product, self.subproduct, self.band
+
+    @property
+    def hour(self) -> int:
+        return int(self.start[7:9])
+
+    @property
+    def minute(self) -> int:
+        return int(self.start[9:11])
+
+    @property
+    def start_datetime(self) -> datetime.datetime:
+        return goes_datetime(self.start)
+
+    @property
+    def end_datetime(self) -> datetime.datetime:
+        return goes_datetime(self.end)
+
+    @property
+    def creation_datetime(self) -> datetime.datetime:
+        return goes_datetime(self.creation)
+
+
+def parse_file_name(name: str) -> Optional[GoesFileName]:
+    match = FILE_NAME_PATTERN.search(name)
+    if match is None:
+        return None
+    product, subproduct, mode, band, sat, start, end, creation = match.groups()
+    return GoesFileName(product, subproduct, mode or '', int(band) if band else None, sat, start, end, creation)
+
+
+def product_band_key(product_band: ProductBand) -> FileNameKey:
+    subproduct = '' if product_band.subproduct is None else str(product_band.subproduct)
+    band = None if product_band.band is None else int(product_band.band)
+    return product_band.product.value, subproduct, band
+
+
 def slice_obs_start(product=Product.CMIPF, subproduct: int = None):
     prefix_pos = len(path_prefix(year=1111, month=1, day=1, hour=11, product=product)) + len(
         file_name(band=Band.RED, product=product, subproduct=subproduct)) + 2
@@ -139,12 +208,17 @@ def slice_obs_start(product=Product.CMIPF, subproduct: int = None):
 
 # Browse: https://console.cloud.google.com/storage/browser/gcp-public-data-goes-16
 GOES_PUBLIC_BUCKET = 'gcp-public-data-goes-16'
+GCS_MEDIA_URL = 'https://storage.googleapis.com'
 
 
 def get_gcs_url(filepath: str):
     return f'https://storage.cloud.google.com/{GOES_PUBLIC_BUCKET}/{filepath}'
 
 
+def get_media_url(filepath: str, bucket: str = GOES_PUBLIC_BUCKET, base_url: str = GCS_MEDIA_URL):
+    return f'{base_url}/{bucket}/{filepath}'
+
+
 def get_browse_url(filepath: str):
     parts = filepath.split('_')
     product = '-'.join(parts[1].split('-')[:-1])
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from typing import Dict
+
+
+def import_times(statement: str = 'import cima.goes') -> Dict[str, int]:
+    '''
+    Cumulative import time (microseconds) of each top level module
+    that statement imports, in a new interpreter (python -X importtime).
+    What the interpreter imports at startup (site, encodings...) is left out.
+    '''
+    startup = _import_times('pass')
+    return {name: us for name, us in _import_times(statement).items() if name not in startup}
+
+
+def _import_times(statement: str) -> Dict[str, int]:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that imports them
+        if len(fields) != 3 or not fields[1].strip().isdigit() or fields[2].startswith('  '):
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def import_time(statement: str = 'import cima.goes') -> int:
+    '''
+    Microseconds that statement spends importing, e.g. to keep a budget:
+    assert import_time('from cima.goes.storage import NFS') < 200_000
+    '''
+    return sum(import_times(statement).values())
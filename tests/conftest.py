@@ -0,0 +1,64 @@
+import os
+import sys
+
+# Tests run against the source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np
+import pytest
+
+GOES_HEIGHT = 35786023.0
+GOES_LON = -75.0
+FULL_DISK_ANGLE = 0.151844
+
+
+def write_goes_dataset(filename, size=300, data=None, memory=False):
+    '''
+    Small CMIPF-like dataset: a full disk geos grid of size x size pixels and a
+    packed, unsigned CMI variable (brightness temperature by default).
+    '''
+    from netCDF4 import Dataset
+    dataset = Dataset(filename, 'w', format='NETCDF4', diskless=memory, persist=not memory)
+    dataset.createDimension('x', size)
+    dataset.createDimension('y', size)
+    projection = dataset.createVariable('goes_imager_projection', np.int32)
+    projection.perspective_point_height = GOES_HEIGHT
+    projection.longitude_of_projection_origin = GOES_LON
+    projection.sweep_angle_axis = 'x'
+    projection.semi_major_axis = 6378137.0
+    projection.semi_minor_axis = 6356752.31414
+    step = 2 * FULL_DISK_ANGLE / (size - 1)
+    for name, start, sign in (('x', -FULL_DISK_ANGLE, 1), ('y', FULL_DISK_ANGLE, -1)):
+        axis = dataset.createVariable(name, np.int16, (name,))
+        axis.scale_factor = sign * step
+        axis.add_offset = start
+        axis[:] = start + sign * step * np.arange(size)
+    cmi = dataset.createVariable('CMI', np.int16, ('y', 'x'), fill_value=np.int16(-1))
+    cmi._Unsigned = 'true'
+    cmi.scale_factor = np.float32(0.04)
+    cmi.add_offset = np.float32(173.15)
+    cmi.units = 'K'
+    cmi.long_name = 'ABI L2+ Cloud and Moisture Imagery brightness temperature'
+    if data is None:
+        rows, cols = np.mgrid[0:size, 0:size]
+        data = 200.0 + 100.0 * (rows + cols) / (2 * size)
+    cmi[:, :] = data
+    if memory:
+        return dataset
+    dataset.close()
+    return filename
+
+
+@pytest.fixture
+def goes_dataset(tmp_path):
+    from netCDF4 import Dataset
+    datasets = []
+
+    def open_goes_dataset(size=300, data=None):
+        filename = write_goes_dataset(str(tmp_path / f'goes-{len(datasets)}.nc'), size, data)
+        datasets.append(Dataset(filename))
+        return datasets[-1]
+
+    yield open_goes_dataset
+    for dataset in datasets:
+        dataset.close()
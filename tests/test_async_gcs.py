@@ -0,0 +1,152 @@
+import asyncio
+import contextlib
+import numpy as np
+import pytest
+from aiohttp import web
+from cima.goes.storage._async_gcs import AGCS
+from cima.goes.storage._blobs import ListedBlob
+
+BUCKET = 'test-bucket'
+PAGE_SIZE = 2
+OBJECTS = {f'ABI-L2-CMIPF/2020/001/00/object-{i}.nc': bytes([i]) * (1000 + i) for i in range(5)}
+
+
+class FixtureServer(object):
+    '''
+    Minimal GCS JSON API listing and media download over aiohttp.web
+    '''
+    def __init__(self, failures: int = 0, chunk_size: int = 300, objects: dict = None, page_size: int = PAGE_SIZE):
+        self.failures = failures
+        self.chunk_size = chunk_size
+        self.objects = OBJECTS if objects is None else objects
+        self.page_size = page_size
+        self.listing_requests = []
+        self.media_requests = 0
+        self.app = web.Application()
+        self.app.router.add_get('/storage/v1/b/{bucket}/o', self.list_objects)
+        self.app.router.add_get('/media/{bucket}/{name:.*}', self.download)
+
+    async def list_objects(self, request):
+        self.listing_requests.append(dict(request.query))
+        names = sorted(name for name in self.objects if name.startswith(request.query.get('prefix', '')))
+        offset = int(request.query.get('pageToken', 0))
+        page = {'items': [
+            {'name': name, 'size': str(len(self.objects[name])), 'generation': str(1000 + i)}
+            for i, name in enumerate(names[offset:offset + self.page_size], start=offset)
+        ]}
+        if offset + self.page_size < len(names):
+            page['nextPageToken'] = str(offset + self.page_size)
+        return web.json_response(page)
+
+    async def download(self, request):
+        self.media_requests += 1
+        if self.media_requests <= self.failures:
+            return web.Response(status=503)
+        data = self.objects[request.match_info['name']]
+        response = web.StreamResponse()
+        response.content_length = len(data)
+        await response.prepare(request)
+        for start in range(0, len(data), self.chunk_size):
+            await response.write(data[start:start + self.chunk_size])
+            await asyncio.sleep(0)
+        await response.write_eof()
+        return response
+
+
+@contextlib.asynccontextmanager
+async def serve(server: FixtureServer, **kwargs):
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    storage = AGCS(bucket=BUCKET, base_url=f'http://127.0.0.1:{port}/media',
+                   api_url=f'http://127.0.0.1:{port}/storage/v1', backoff=0, **kwargs)
+    try:
+        yield storage
+    finally:
+        await storage.close()
+        await runner.cleanup()
+
+
+def blob(i: int) -> ListedBlob:
+    name = sorted(OBJECTS)[i]
+    return ListedBlob(name, len(OBJECTS[name]), 1000 + i)
+
+
+def test_list_blobs_follows_next_page_token():
+    server = FixtureServer()
+
+    async def run():
+        async with serve(server) as storage:
+            return await storage.list_blobs('ABI-L2-CMIPF/2020/001/')
+
+    blobs = asyncio.run(run())
+    assert [b.name for b in blobs] == sorted(OBJECTS)
+    assert [b.size for b in blobs] == [len(OBJECTS[name]) for name in sorted(OBJECTS)]
+    assert [b.generation for b in blobs] == [1000 + i for i in range(len(OBJECTS))]
+    assert [r.get('pageToken') for r in server.listing_requests] == [None, '2', '4']
+    assert all(r['delimiter'] == '/' for r in server.listing_requests)
+
+
+def test_download_retries_a_transient_status():
+    server = FixtureServer(failures=1)
+
+    async def run():
+        async with serve(server, retries=2) as storage:
+            return await storage.download_blob(blob(1))
+
+    assert asyncio.run(run()) == OBJECTS[blob(1).name]
+    assert server.media_requests == 2
+
+
+def test_download_gives_up_after_retries():
+    server = FixtureServer(failures=10)
+
+    async def run():
+        async with serve(server, retries=2) as storage:
+            return await storage.download_blob(blob(1))
+
+    with pytest.raises(Exception, match='503'):
+        asyncio.run(run())
+    assert server.media_requests == 3
+
+
+def test_download_is_streamed_in_chunks():
+    server = FixtureServer(chunk_size=100)
+
+    async def run():
+        async with serve(server) as storage:
+            return await storage.download_blobs([blob(i) for i in range(len(OBJECTS))])
+
+    assert asyncio.run(run()) == [OBJECTS[name] for name in sorted(OBJECTS)]
+
+
+def test_download_blob_into_reuses_the_buffer():
+    server = FixtureServer()
+    buffer = np.zeros(2000, dtype=np.uint8)
+
+    async def run():
+        async with serve(server) as storage:
+            sizes = []
+            for i in (4, 0):
+                sizes.append(await storage.download_blob_into(blob(i), buffer))
+            return sizes
+
+    sizes = asyncio.run(run())
+    assert sizes == [1004, 1000]
+    assert buffer[:1000].tobytes() == OBJECTS[blob(0).name]
+    # Past the last download, what the first one left
+    assert buffer[1000:1004].tobytes() == OBJECTS[blob(4).name][1000:]
+
+
+def test_download_blob_into_a_small_buffer_fails():
+    server = FixtureServer()
+
+    async def run():
+        async with serve(server) as storage:
+            return await storage.download_blob_into(blob(2), bytearray(1001))
+
+    with pytest.raises(Exception, match='does not fit'):
+        asyncio.run(run())
+    assert server.media_requests == 1
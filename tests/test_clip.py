@@ -0,0 +1,35 @@
+import numpy as np
+from netCDF4 import Dataset
+
+from cima.goes.tiles import RegionIndexes, save_netcdf_blocks
+
+
+def test_int16_pack_round_trips_unsigned_data(goes_dataset, tmp_path):
+    # Packed values over 32767 only fit an int16 read as unsigned
+    packed = np.arange(100 * 100, dtype=np.float64).reshape(100, 100) * 6.5
+    data = np.ma.masked_array(173.15 + 0.04 * packed, mask=packed == 0)
+    dataset = goes_dataset(size=100, data=data)
+    indexes = RegionIndexes(x_min=10, x_max=90, y_min=5, y_max=95)
+    filename = str(tmp_path / 'clip.nc')
+    save_netcdf_blocks(filename, dataset, indexes, block_rows=16, pack='int16')
+
+    source = dataset['CMI'][indexes.y_min: indexes.y_max, indexes.x_min: indexes.x_max]
+    with Dataset(filename) as clipped:
+        variable = clipped['CMI']
+        assert variable.dtype == np.int16
+        assert variable._Unsigned == 'true'
+        values = variable[:, :]
+    assert source.max() > 173.15 + 0.04 * 32767
+    np.testing.assert_array_equal(np.ma.getmaskarray(values), np.ma.getmaskarray(source))
+    np.testing.assert_allclose(values.compressed(), source.compressed(), atol=0.02)
+
+
+def test_clip_without_packing(goes_dataset, tmp_path):
+    dataset = goes_dataset(size=100)
+    indexes = RegionIndexes(x_min=0, x_max=100, y_min=30, y_max=60)
+    filename = str(tmp_path / 'clip.nc')
+    save_netcdf_blocks(filename, dataset, indexes, block_rows=7)
+    with Dataset(filename) as clipped:
+        assert clipped['CMI'].dtype == np.float32
+        np.testing.assert_allclose(clipped['CMI'][:, :], dataset['CMI'][30:60, :], rtol=1e-6)
+        assert clipped['lats'].shape == (30, 100)
@@ -0,0 +1,10 @@
+import asyncio
+
+from cima.goes.tasks import Task, run_concurrent_async
+
+
+def test_run_concurrent_async_from_a_running_loop():
+    async def run():
+        return sorted(await run_concurrent_async([Task(pow, 2, i) for i in range(6)], 2))
+
+    assert asyncio.run(run()) == [2 ** i for i in range(6)]
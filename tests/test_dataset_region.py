@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from cima.goes.tiles import LatLonRegion, find_dataset_region, get_lats_lons, project_region_indexes
+
+
+def inside_pixels(dataset, region):
+    lats, lons = get_lats_lons(dataset)
+    inside = ((lats <= region.lat_north) & (lats >= region.lat_south) &
+              (lons >= region.lon_west) & (lons <= region.lon_east))
+    rows, cols = np.nonzero(inside)
+    return cols, rows
+
+
+def covers(indexes, x, y):
+    return (indexes.x_min <= x.min() and x.max() <= indexes.x_max and
+            indexes.y_min <= y.min() and y.max() <= indexes.y_max)
+
+
+def test_region_on_disk(goes_dataset):
+    dataset = goes_dataset()
+    region = LatLonRegion(lat_north=10, lat_south=-10, lon_west=-80, lon_east=-60)
+    indexes = project_region_indexes(dataset, region)
+    exhaustive = find_dataset_region(dataset, region, exhaustive=True).indexes
+    for name in ('x_min', 'x_max', 'y_min', 'y_max'):
+        assert abs(getattr(indexes, name) - getattr(exhaustive, name)) <= 1
+    assert covers(indexes, *inside_pixels(dataset, region))
+
+
+def test_region_crossing_the_limb(goes_dataset):
+    dataset = goes_dataset()
+    # The west edge is past the limb, the disk is widest at the equator
+    region = LatLonRegion(lat_north=10, lat_south=-10, lon_west=-170, lon_east=-100)
+    indexes = project_region_indexes(dataset, region)
+    x, y = inside_pixels(dataset, region)
+    assert covers(indexes, x, y)
+    assert (indexes.x_min, indexes.x_max, indexes.y_min, indexes.y_max) == (x.min(), x.max(), y.min(), y.max())
+
+
+def test_region_enclosing_the_disk(goes_dataset):
+    dataset = goes_dataset()
+    region = LatLonRegion(lat_north=90, lat_south=-90, lon_west=-180, lon_east=180)
+    indexes = project_region_indexes(dataset, region)
+    lats, _ = get_lats_lons(dataset)
+    rows, cols = np.nonzero(np.isfinite(lats))
+    assert (indexes.x_min, indexes.x_max, indexes.y_min, indexes.y_max) == (
+        cols.min(), cols.max(), rows.min(), rows.max())
+
+
+def test_region_off_the_disk(goes_dataset):
+    dataset = goes_dataset()
+    region = LatLonRegion(lat_north=10, lat_south=-10, lon_west=60, lon_east=80)
+    with pytest.raises(Exception, match='outside of the satellite disk'):
+        project_region_indexes(dataset, region)
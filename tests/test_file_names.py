@@ -0,0 +1,96 @@
+'''
+parse_file_name / product_band_key against the regex search and
+slice_obs_start path they replace. The benchmark prints its table with -s.
+'''
+import itertools
+import random
+import re
+import time
+
+from cima.goes import Band, Product, ProductBand
+from cima.goes.storage._blobs import ListedBlob, add_blobs_by_start
+from cima.goes.utils._file_names import (
+    ANY_MODE, file_regex_pattern, parse_file_name, path_prefix, product_band_key, slice_obs_start)
+
+BANDS = list(Band)
+MODES = ['M3', 'M4', 'M6']
+
+
+def goes_name(product: Product, band: Band, mode: str, start: str, subproduct: int = None) -> str:
+    hour = int(start[7:9])
+    subp = '' if subproduct is None else subproduct
+    band_str = '' if band is None else f'C{band:02d}'
+    return (f'{path_prefix(2020, 1, 1, hour, product)}OR_{product.value}{subp}-{mode}{band_str}_G16_'
+            f's{start}_e{start[:-1]}9_c{start[:-1]}8.nc')
+
+
+def synthetic_names(count: int, seed: int = 0):
+    generator = random.Random(seed)
+    names = []
+    for i in range(count):
+        start = f'2020001{generator.randrange(24):02d}{generator.randrange(60):02d}{generator.randrange(60):02d}{i % 10}'
+        names.append(goes_name(Product.CMIPF, generator.choice(BANDS), generator.choice(MODES), start))
+    return names
+
+
+def matches(pattern: re.Pattern, name: str) -> bool:
+    return pattern.search(name) is not None
+
+
+def parsed_matches(product_band: ProductBand, mode: str, name: str) -> bool:
+    file_name = parse_file_name(name)
+    return (file_name is not None and file_name.key == product_band_key(product_band) and
+            re.fullmatch(mode, file_name.mode) is not None)
+
+
+def test_parity_with_regex_search_and_slice_obs_start():
+    start = '20200011430216'
+    cases = [
+        (ProductBand(product, band, subproduct), mode)
+        for product, subproduct in ((Product.CMIPF, None), (Product.CMIPC, None), (Product.CMIPM, 1), (Product.CMIPM, 2))
+        for band in BANDS
+        for mode in MODES + [ANY_MODE]
+    ]
+    names = [
+        goes_name(product_band.product, product_band.band, mode, start, product_band.subproduct)
+        for product_band, mode in cases if mode != ANY_MODE
+    ] + [goes_name(Product.MCMIPF, None, 'M6', start), 'ABI-L2-CMIPF/2020/001/14/index.html']
+    for (product_band, mode), name in itertools.product(cases, names):
+        pattern = file_regex_pattern(product_band.band, product_band.product, mode, product_band.subproduct)
+        assert parsed_matches(product_band, mode, name) == matches(pattern, name), (product_band, mode, name)
+        if matches(pattern, name):
+            observation_start = slice_obs_start(product_band.product, product_band.subproduct)
+            assert parse_file_name(name).start == name[observation_start] == start
+
+
+def regex_grouping(blobs, product_bands, mode):
+    # One pass over the listing per band, as the per-pattern loops did
+    blobs_by_start = {}
+    for product_band in product_bands:
+        pattern = file_regex_pattern(product_band.band, product_band.product, mode, product_band.subproduct)
+        observation_start = slice_obs_start(product_band.product, product_band.subproduct)
+        band_key = (product_band.product, product_band.band)
+        for blob in blobs:
+            if pattern.search(blob.name):
+                blobs_by_start.setdefault(blob.name[observation_start], {}).setdefault(band_key, []).append(blob)
+    return blobs_by_start
+
+
+def parsed_grouping(blobs, product_bands, mode):
+    return add_blobs_by_start({}, blobs, product_bands, mode)
+
+
+def test_benchmark_100k_names():
+    blobs = [ListedBlob(name) for name in synthetic_names(100_000)]
+    product_bands = [ProductBand(Product.CMIPF, band) for band in BANDS]
+    rows = []
+    results = []
+    for label, group in (('regex search + slice_obs_start', regex_grouping), ('parse_file_name', parsed_grouping)):
+        started = time.perf_counter()
+        results.append(group(blobs, product_bands, 'M6'))
+        rows.append((label, time.perf_counter() - started))
+    assert results[0] == results[1]
+    print(f'\n{len(blobs)} names, {len(product_bands)} bands')
+    print(f'{"path":<34}{"s":>8}')
+    for label, seconds in rows:
+        print(f'{label:<34}{seconds:>8.3f}')
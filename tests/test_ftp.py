@@ -0,0 +1,138 @@
+import ftplib
+import logging
+import socket
+import threading
+import pytest
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+from cima.goes.storage import _ftp
+from cima.goes.storage._ftp import FTP
+
+logging.getLogger('pyftpdlib').setLevel(logging.CRITICAL)
+
+
+class DroppingHandler(FTPHandler):
+    '''
+    Drops the control connection instead of confirming the transfers of the commands in drops
+    (the transfer itself is done). Commands in refusals are refused once with their reply.
+    '''
+    drops = []
+    refusals = {}
+    logins = 0
+
+    def pre_process_command(self, line, cmd, arg):
+        self.last_command = cmd
+        reply = self.refusals.pop(cmd, None)
+        if reply is not None:
+            self.respond(reply)
+            if reply.startswith('421'):
+                self.close_when_done()
+            return
+        return super().pre_process_command(line, cmd, arg)
+
+    def on_login(self, username):
+        DroppingHandler.logins += 1
+
+    def respond(self, resp, *args, **kwargs):
+        if resp.startswith('226') and getattr(self, 'last_command', None) in self.drops:
+            self.drops.remove(self.last_command)
+            self.close()
+            return
+        return super().respond(resp, *args, **kwargs)
+
+
+@pytest.fixture
+def server(tmp_path):
+    authorizer = DummyAuthorizer()
+    authorizer.add_user('user', 'password', str(tmp_path), perm='elradfmwMT')
+    (tmp_path / 'readonly').mkdir()
+    authorizer.override_perm('user', str(tmp_path / 'readonly'), perm='elr', recursive=True)
+    DroppingHandler.authorizer = authorizer
+    DroppingHandler.drops = []
+    DroppingHandler.refusals = {}
+    DroppingHandler.logins = 0
+    ftp_server = ThreadedFTPServer(('127.0.0.1', 0), DroppingHandler)
+    thread = threading.Thread(target=ftp_server.serve_forever, kwargs={'timeout': 0.05}, daemon=True)
+    thread.start()
+    yield ftp_server
+    ftp_server.close_all()
+    thread.join()
+
+
+@pytest.fixture
+def storage(server):
+    ftp = FTP('127.0.0.1', server.address[1], 'user', 'password', pool_size=2, timeout=5)
+    yield ftp
+    ftp.close()
+
+
+def test_upload_download_append(storage, tmp_path):
+    storage.upload_data(b'abc', '/a/b/c.txt')
+    storage.upload_data(b'rel', 'rel/dir/f.txt')
+    assert storage.download_data('/a/b/c.txt') == b'abc'
+    assert (tmp_path / 'rel' / 'dir' / 'f.txt').read_bytes() == b'rel'
+    assert [name.split('/')[-1] for name in storage.list('/a/b')] == ['c.txt']
+    storage.append_data(b'1\n', '/a/log.txt')
+    storage.append_data(b'2\n', '/a/log.txt')
+    assert storage.download_data('/a/log.txt') == b'1\n2\n'
+    assert DroppingHandler.logins == 1
+
+
+def test_append_dropped_mid_transfer_is_not_retried(storage, tmp_path):
+    storage.append_data(b'1\n', '/log.txt')
+    DroppingHandler.drops = ['APPE']
+    with pytest.raises(ftplib.all_errors):
+        storage.append_data(b'2\n', '/log.txt')
+    storage.append_data(b'3\n', '/log.txt')
+    assert (tmp_path / 'log.txt').read_bytes() == b'1\n2\n3\n'
+
+
+def test_append_on_a_dropped_idle_connection_is_retried(storage, tmp_path):
+    storage.append_data(b'1\n', '/log.txt')
+    for ftp, _ in storage._idle:
+        ftp.sock.shutdown(socket.SHUT_RDWR)
+    storage.append_data(b'2\n', '/log.txt')
+    assert (tmp_path / 'log.txt').read_bytes() == b'1\n2\n'
+    assert DroppingHandler.logins == 2
+
+
+def test_download_dropped_mid_transfer_is_retried(storage):
+    storage.upload_data(b'data', '/f.bin')
+    DroppingHandler.drops = ['RETR']
+    assert storage.download_data('/f.bin') == b'data'
+    assert DroppingHandler.logins == 2
+
+
+def test_transient_replies_are_retried_on_the_same_connection(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(_ftp, 'TEMP_ERROR_DELAY', 0)
+    storage.upload_data(b'data', '/f.bin')
+    DroppingHandler.refusals = {'RETR': '450 Busy, try again.'}
+    assert storage.download_data('/f.bin') == b'data'
+    DroppingHandler.refusals = {'APPE': '452 Insufficient storage space.'}
+    storage.append_data(b'1\n', '/log.txt')
+    assert (tmp_path / 'log.txt').read_bytes() == b'1\n'
+    assert DroppingHandler.logins == 1
+
+
+def test_closing_reply_reconnects(storage, monkeypatch):
+    monkeypatch.setattr(_ftp, 'TEMP_ERROR_DELAY', 0)
+    storage.upload_data(b'data', '/f.bin')
+    DroppingHandler.refusals = {'RETR': '421 Service not available, closing control connection.'}
+    assert storage.download_data('/f.bin') == b'data'
+    assert DroppingHandler.logins == 2
+
+
+def test_directories_not_created_are_not_cached(storage, tmp_path):
+    (tmp_path / 'file').write_bytes(b'')
+    with pytest.raises(ftplib.error_perm):
+        storage.upload_data(b'x', '/file/f.txt')
+    with pytest.raises(ftplib.error_perm):
+        storage.upload_data(b'x', '/readonly/new/f.txt')
+    assert '/file' not in storage._dirs
+    assert '/readonly/new' not in storage._dirs
+    # Existing directories are confirmed, and cached
+    assert '/readonly' in storage._dirs
+    (tmp_path / 'file').unlink()
+    storage.upload_data(b'x', '/file/f.txt')
+    assert (tmp_path / 'file' / 'f.txt').read_bytes() == b'x'
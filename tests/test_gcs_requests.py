@@ -0,0 +1,173 @@
+'''
+Requests made per processed hour against a local fake GCS server, for the
+per-call client of the original GCS, the cached client and pool of GCS,
+and AGCS. Run with -s to see the table.
+'''
+import asyncio
+import threading
+import time
+from typing import List
+
+import google.cloud.storage as gcs
+from aiohttp import web
+from google.auth.credentials import AnonymousCredentials
+
+from cima.goes import Band, ProductBand, Product
+from cima.goes.storage._async_gcs import AGCS
+from cima.goes.storage._blobs import BlobsByStart, add_blobs_by_start, group_blobs_by_start
+from cima.goes.storage._gcs import GCS
+from test_async_gcs import FixtureServer, BUCKET
+
+BANDS = [ProductBand(Product.CMIPF, band) for band in (Band.RED, Band.VEGGIE, Band.BLUE, Band.CLEAN_LONGWAVE_WINDOW)]
+HOURS = 3
+SCANS_PER_HOUR = 6
+
+
+def scan_objects() -> dict:
+    objects = {}
+    for hour in range(HOURS):
+        for scan in range(SCANS_PER_HOUR):
+            start = f'2020001{hour:02d}{scan * 10:02d}216'
+            for product_band in BANDS:
+                name = (f'ABI-L2-CMIPF/2020/001/{hour:02d}/OR_ABI-L2-CMIPF-M6C{product_band.band.value:02d}_G16_'
+                        f's{start}_e{start}_c{start}.nc')
+                objects[name] = bytes(2000 + product_band.band.value)
+    return objects
+
+
+class GCSFixtureServer(FixtureServer):
+    '''
+    FixtureServer plus the bucket metadata and download endpoints of the JSON API,
+    counting the requests and the client connections.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket_requests = 0
+        self.connections = set()
+        self.app.middlewares.append(self.count_connection)
+        self.app.router.add_get('/storage/v1/b/{bucket}', self.get_bucket)
+        self.app.router.add_get('/download/storage/v1/b/{bucket}/o/{name:.*}', self.download)
+
+    @web.middleware
+    async def count_connection(self, request, handler):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        return await handler(request)
+
+    async def get_bucket(self, request):
+        self.bucket_requests += 1
+        return web.json_response({'name': request.match_info['bucket']})
+
+    def counts(self) -> dict:
+        return {
+            'listings': len(self.listing_requests),
+            'bucket': self.bucket_requests,
+            'media': self.media_requests,
+            'connections': len(self.connections),
+        }
+
+
+class ServerThread(object):
+    def __init__(self, server: GCSFixtureServer):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.runner = web.AppRunner(self.server.app)
+        asyncio.run_coroutine_threadsafe(self.runner.setup(), self.loop).result()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        asyncio.run_coroutine_threadsafe(site.start(), self.loop).result()
+        return f'http://127.0.0.1:{self.runner.addresses[0][1]}'
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class LocalGCS(GCS):
+    def __init__(self, endpoint: str, **kwargs):
+        self.endpoint = endpoint
+        super().__init__(bucket=BUCKET, **kwargs)
+
+    def _new_client(self):
+        client = super()._new_client()
+        return gcs.Client(project='<none>', credentials=AnonymousCredentials(), _http=client._http,
+                          client_options={'api_endpoint': self.endpoint})
+
+
+class PerCallClientGCS(LocalGCS):
+    '''
+    GCS as it was: a client and a get_bucket round trip per call, one listing per band
+    '''
+    def get_client(self):
+        return gcs.Client(project='<none>', credentials=AnonymousCredentials(),
+                          client_options={'api_endpoint': self.endpoint})
+
+    def get_bucket(self):
+        return self.get_client().get_bucket(self.bucket)
+
+    def _blobs_by_start(self, get_prefix, product_bands: List[ProductBand], hours: List[int] = None,
+                        delimiter='/') -> BlobsByStart:
+        blobs_by_start: BlobsByStart = {}
+        for product_band in product_bands:
+            blobs = self.list_blobs(get_prefix(product_band.product), delimiter=delimiter)
+            add_blobs_by_start(blobs_by_start, blobs, [product_band], self.mode, hours)
+        return blobs_by_start
+
+
+def process_hours(storage: GCS):
+    for hour in range(HOURS):
+        for group in storage.grouped_one_hour_blobs(2020, 1, 1, hour, BANDS):
+            for band_blobs in group.blobs:
+                for blob in band_blobs.blobs:
+                    storage.download_blob(blob)
+
+
+async def process_hours_async(storage: AGCS):
+    for hour in range(HOURS):
+        for group in await storage.grouped_one_hour_blobs(2020, 1, 1, hour, BANDS):
+            blobs = [blob for band_blobs in group.blobs for blob in band_blobs.blobs]
+            await storage.download_blobs(blobs)
+
+
+def measure(name: str, run) -> dict:
+    objects = scan_objects()
+    server = GCSFixtureServer(objects=objects, page_size=1000, chunk_size=1 << 16)
+    with ServerThread(server) as endpoint:
+        started = time.perf_counter()
+        run(endpoint)
+        elapsed = time.perf_counter() - started
+    counts = server.counts()
+    assert counts['media'] == len(objects)
+    row = {name: value / HOURS for name, value in counts.items()}
+    row.update(storage=name, ms=1000 * elapsed / HOURS)
+    return row
+
+
+def test_requests_per_processed_hour():
+    def run_agcs(endpoint):
+        async def run():
+            async with AGCS(bucket=BUCKET, base_url=f'{endpoint}/media',
+                            api_url=f'{endpoint}/storage/v1', backoff=0) as storage:
+                await process_hours_async(storage)
+        asyncio.run(run())
+
+    rows = [
+        measure('GCS, client per call', lambda endpoint: process_hours(PerCallClientGCS(endpoint))),
+        measure('GCS', lambda endpoint: process_hours(LocalGCS(endpoint))),
+        measure('AGCS', run_agcs),
+    ]
+    print('\nper processed hour:', f'{len(BANDS)} bands x {SCANS_PER_HOUR} scans')
+    print(f'{"storage":<22}{"listings":>9}{"bucket":>8}{"media":>7}{"connections":>13}{"ms":>8}')
+    for row in rows:
+        print(f'{row["storage"]:<22}{row["listings"]:>9.1f}{row["bucket"]:>8.1f}{row["media"]:>7.1f}'
+              f'{row["connections"]:>13.1f}{row["ms"]:>8.1f}')
+    per_call, cached, agcs = rows
+    assert per_call['listings'] == len(BANDS) and per_call['bucket'] >= len(BANDS)
+    # At most the client's own bucket metadata lookup, once per process
+    assert cached['listings'] == 1 and cached['bucket'] * HOURS <= 1
+    assert cached['connections'] < per_call['connections']
+    assert agcs['listings'] == 1 and agcs['bucket'] == 0
@@ -0,0 +1,101 @@
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from cima.goes.storage._datasets import open_dataset_from_url
+from cima.goes.storage._http import HTTP
+from conftest import write_goes_dataset
+
+BUCKET = 'gcp-public-data-goes-16'
+FILEPATH = 'ABI-L2-CMIPF/2020/001/00/OR_ABI-L2-CMIPF-M6C13_G16_s20200010000216_e20200010009536_c20200010010029.nc'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    '''
+    Serves server.files by path, honoring single Range requests.
+    '''
+    def do_HEAD(self):
+        self.reply(body=False)
+
+    def do_GET(self):
+        self.reply(body=True)
+
+    def reply(self, body):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get('Range')
+        self.server.requests.append((self.command, requested))
+        start, end = 0, len(data) - 1
+        if requested is not None:
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', requested)
+            start = int(match[1])
+            end = min(int(match[2]), end) if match[2] else end
+        self.send_response(200 if requested is None else 206)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if requested is not None:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start: end + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    with open(write_goes_dataset(str(tmp_path / 'goes.nc'), size=200), 'rb') as f:
+        data = f.read()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.files = {f'/{BUCKET}/{FILEPATH}': data}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def open_or_skip(server, open_dataset):
+    try:
+        return open_dataset()
+    except OSError:
+        if not any(requested for _, requested in server.requests):
+            pytest.skip('netCDF-C built without byte-range support')
+        raise
+
+
+def check_dataset(server, dataset):
+    try:
+        assert dataset.dimensions['x'].size == 200
+        assert dataset['CMI'][100, 100] == pytest.approx(250.0, abs=0.05)
+    finally:
+        dataset.close()
+    ranges = [requested for _, requested in server.requests if requested is not None]
+    assert ranges
+    size = len(next(iter(server.files.values())))
+    # Nothing asked for the whole file
+    assert all(requested != f'bytes=0-{size - 1}' for requested in ranges)
+
+
+def test_open_dataset_from_url(server):
+    url = f'http://127.0.0.1:{server.server_port}/{BUCKET}/{FILEPATH}'
+    dataset = open_or_skip(server, lambda: open_dataset_from_url(url))
+    check_dataset(server, dataset)
+
+
+def test_http_storage_byte_range(server):
+    storage = HTTP(bucket=BUCKET, byte_range=True, base_url=f'http://127.0.0.1:{server.server_port}')
+    dataset = open_or_skip(server, lambda: storage.get_dataset(FILEPATH))
+    check_dataset(server, dataset)
+
+
+def test_open_missing_url(server):
+    url = f'http://127.0.0.1:{server.server_port}/{BUCKET}/missing.nc'
+    with pytest.raises(OSError):
+        open_dataset_from_url(url)
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+# Backends that only their storages may load
+BACKENDS = ['google.cloud.storage', 'aiohttp', 'aioftp']
+
+MEASURE = '''
+import json, sys, time
+started = time.perf_counter()
+{statement}
+print(json.dumps({{'seconds': time.perf_counter() - started, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def run_import(statement: str) -> dict:
+    # A fresh interpreter: nothing imported by pytest or other tests
+    env = dict(os.environ, PYTHONPATH=SRC)
+    output = subprocess.run([sys.executable, '-c', MEASURE.format(statement=statement)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize('statement, budget', [
+    ('import cima.goes', 0.25),
+    ('from cima.goes.storage import NFS', 1.0),
+    ('from cima.goes.projects import BatchProcess', 1.5),
+])
+def test_import_time_budget(statement, budget):
+    # Best of 3, so a busy machine doesn't fail it
+    seconds = min(run_import(statement)['seconds'] for _ in range(3))
+    assert seconds < budget, f'{statement}: {seconds:.3f}s, budget {budget}s'
+
+
+@pytest.mark.parametrize('statement', [
+    'import cima.goes',
+    'from cima.goes.storage import NFS',
+    'from cima.goes.projects import BatchProcess',
+])
+def test_backends_are_not_imported(statement):
+    modules = set(run_import(statement)['modules'])
+    assert not modules & set(BACKENDS)
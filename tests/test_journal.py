@@ -0,0 +1,97 @@
+import datetime
+import os
+from cima.goes.storage._file_systems import Storage
+from cima.goes.projects._journal import ProgressJournal
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.files = {}
+
+    def get_storage_info(self):
+        pass
+
+    def list(self, path: str):
+        return [name for name in self.files if name.startswith(path)]
+
+    def mkdir(self, path: str):
+        pass
+
+    def append_data(self, data: bytes, filepath: str):
+        self.files[filepath] = self.files.get(filepath, b'') + data
+
+    def append_stream(self, stream, filepath: str):
+        self.append_data(stream.read(), filepath)
+
+    def upload_data(self, data: bytes, filepath: str):
+        self.files[filepath] = data
+
+    def upload_stream(self, stream, filepath: str):
+        self.upload_data(stream.read(), filepath)
+
+    def download_data(self, filepath: str) -> bytes:
+        return self.files[filepath]
+
+    def download_stream(self, filepath: str):
+        pass
+
+    def get_dataset(self, blob):
+        pass
+
+
+DAY = datetime.date(2020, 1, 1)
+
+
+def test_leftover_files_are_not_flushed_again(tmp_path):
+    log = MemoryStorage()
+    journal = ProgressJournal('R', str(tmp_path), log, 'logs', flush_interval=0)
+    journal.record(DAY, 0, 'a')
+    journal.record(DAY, 1, 'b')
+    journal.flush(force=True)
+
+    # A new run finds the local file of the previous one (e.g. it crashed before close)
+    journal = ProgressJournal('R', str(tmp_path), log, 'logs', flush_interval=0)
+    assert journal.flush(force=True) == 0
+    journal.record(DAY, 2, 'c')
+    journal.flush(force=True)
+    assert log.files['logs/R.log'] == b'2020-01-01 0# a\n2020-01-01 1# b\n2020-01-01 2# c\n'
+    assert journal.completed() == {(DAY, 0), (DAY, 1), (DAY, 2)}
+
+    journal.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_partial_lines_wait_for_the_next_flush(tmp_path):
+    log = MemoryStorage()
+    journal = ProgressJournal('R', str(tmp_path), log, 'logs', flush_interval=0)
+    journal.record(DAY, 0, 'a')
+    with open(journal.local_filepath(), 'ab') as f:
+        f.write(b'2020-01-01 1# b')
+    journal.flush(force=True)
+    with open(journal.local_filepath(), 'ab') as f:
+        f.write(b'\n')
+    ProgressJournal('R', str(tmp_path), log, 'logs').flush(force=True)
+    assert log.files['logs/R.log'] == b'2020-01-01 0# a\n2020-01-01 1# b\n'
+
+
+def test_projects_on_the_same_host_have_their_own_journals(tmp_path, monkeypatch):
+    from test_shards import OneScanPerHour, RANGE, UNITS, process
+    from cima.goes import ProductBand, Product, Band
+    from cima.goes.projects._project import BatchProcess
+
+    monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+    log = MemoryStorage()
+    first, second = [
+        BatchProcess(OneScanPerHour(), [ProductBand(Product.CMIPF, Band.RED)], [RANGE], log_storage=log,
+                     log_base_path=base, machine_id='host')
+        for base in ('first', 'second')]
+    assert first.journal_path != second.journal_path
+
+    # The first project left a journal file behind, e.g. it crashed before flushing it
+    first.journal(RANGE).record(RANGE.from_date, 0, 'first')
+    out = str(tmp_path / 'out.txt')
+    second.run(process, out, 0, None)
+    with open(out) as f:
+        assert len(f.read().splitlines()) == UNITS
+    assert b'first' not in log.files['second/host/R.log']
+    assert first.journal(RANGE).remaining({RANGE.from_date: [0, 1]}) == {RANGE.from_date: [1]}
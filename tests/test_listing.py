@@ -0,0 +1,24 @@
+from cima.goes import Band, Product, ProductBand
+from cima.goes.storage import IndexedGoesStorage
+from cima.goes.storage._blobs import ListedBlob
+from cima.goes.storage._gcs import GCS
+
+NAMES = [
+    f'ABI-L2-CMIPF/2020/001/00/OR_ABI-L2-CMIPF-M6C13_G16_s202000100{minute}0216_e202000100{minute}9536_c202000100{minute}9599.nc'
+    for minute in range(6)
+]
+
+
+class ListingGCS(GCS):
+    def list_blobs(self, path: str, delimiter='/'):
+        return [ListedBlob(name, 1000 + i, 2000 + i) for i, name in enumerate(NAMES) if name.startswith(path)]
+
+
+def test_indexed_blobs_carry_the_listed_size(tmp_path):
+    bucket = ListingGCS()
+    storage = IndexedGoesStorage(bucket, path=str(tmp_path))
+    blobs = storage.one_hour_blobs(2020, 1, 1, 0, ProductBand(Product.CMIPF, Band.CLEAN_LONGWAVE_WINDOW)).blobs
+    assert [(blob.name, blob.size, blob.generation) for blob in blobs] == [
+        (name, 1000 + i, 2000 + i) for i, name in enumerate(NAMES)]
+    gcs_blob = bucket.gcs_blob(blobs[2])
+    assert (gcs_blob.name, gcs_blob.generation, gcs_blob.bucket.name) == (NAMES[2], 2002, bucket.bucket)
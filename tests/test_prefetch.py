@@ -0,0 +1,26 @@
+from cima.goes.projects._watcher import _listing_storage
+from cima.goes.storage import GoesStorage, IndexedGoesStorage, PrefetchedGoesStorage
+from cima.goes.storage._blobs import ListedBlob
+from cima.goes.storage._gcs import GCS
+
+
+class CountingGCS(GCS):
+    def __init__(self):
+        super().__init__()
+        self.downloads = []
+
+    def download_blob(self, blob):
+        self.downloads.append(blob.name)
+        return b'downloaded'
+
+
+def test_prefetched_storage_is_a_goes_storage():
+    bucket = CountingGCS()
+    storage = PrefetchedGoesStorage(IndexedGoesStorage(bucket), {'a.nc': b'prefetched'})
+    assert isinstance(storage, GoesStorage)
+    assert _listing_storage(storage) is bucket
+    assert storage.download_blob(ListedBlob('a.nc')) == b'prefetched'
+    assert storage.download_blob(ListedBlob('b.nc')) == b'downloaded'
+    assert bucket.downloads == ['b.nc']
+    # Backend attributes still go through
+    assert storage.bucket == bucket.bucket
@@ -0,0 +1,120 @@
+'''
+TilePyramid and render_tiles against rendering every tile on its own with
+get_raster_image_stream. The benchmark prints its timing table with -s.
+'''
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from cima.goes.img import TilePyramid, get_colormap_lut, get_raster_image_stream, get_remap_plan, render_tiles
+from cima.goes.img._pyramid import tile_x_to_lon, tile_y_to_lat
+from cima.goes.img._remap import get_lats_lons_remap_plan, region_window
+from cima.goes.tiles import LatLonRegion, get_data, get_tiles
+from test_journal import MemoryStorage
+
+REGION = LatLonRegion(lat_north=-20, lat_south=-40, lon_west=-70, lon_east=-50)
+VMIN, VMAX = 210., 290.
+LUT = get_colormap_lut(lambda x: np.stack([x, 1 - x, x * x, np.ones_like(x)], axis=-1))
+
+
+def wavy_data(size: int) -> np.ndarray:
+    rows, cols = np.mgrid[0:size, 0:size]
+    return 250 + 40 * np.sin(rows / 37.) * np.cos(cols / 23.)
+
+
+def decode(data: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def tile_plan(dataset, z: int, x: int, y: int, tile_size: int):
+    # The Web Mercator pixel centers of one tile
+    xs = x + (np.arange(tile_size) + 0.5) / tile_size
+    ys = y + (np.arange(tile_size) + 0.5) / tile_size
+    lons, lats = np.meshgrid(tile_x_to_lon(xs, z), tile_y_to_lat(ys, z))
+    region = LatLonRegion(
+        lat_north=float(tile_y_to_lat(y, z)), lat_south=float(tile_y_to_lat(y + 1, z)),
+        lon_west=float(tile_x_to_lon(x, z)), lon_east=float(tile_x_to_lon(x + 1, z)))
+    return get_lats_lons_remap_plan(dataset, lats, lons, region_window(dataset, region), region=region)
+
+
+def render_tile(dataset, plan) -> bytes:
+    data = get_data(dataset, plan.window)
+    return get_raster_image_stream(data, plan, lut=LUT, vmin=VMIN, vmax=VMAX).getvalue()
+
+
+def tile_keys(files: dict, zoom: int):
+    for filepath in files:
+        z, x, y = filepath.split('/')[-3:]
+        if int(z) == zoom:
+            yield filepath, int(x), int(y.split('.')[0])
+
+
+def test_pyramid_tiles_match_per_tile_rendering(goes_dataset):
+    dataset = goes_dataset(size=1000, data=wavy_data(1000))
+    storage = MemoryStorage()
+    pyramid = TilePyramid(storage, 'tiles', REGION, max_zoom=6, min_zoom=5, lut=LUT, vmin=VMIN, vmax=VMAX,
+                          tile_size=64)
+    pyramid.write(dataset)
+    max_zoom_tiles = list(tile_keys(storage.files, 6))
+    assert len(max_zoom_tiles) > 4
+    for filepath, x, y in max_zoom_tiles:
+        expected = decode(render_tile(dataset, tile_plan(dataset, 6, x, y, 64)))
+        np.testing.assert_array_equal(decode(storage.files[filepath]), expected, err_msg=filepath)
+    # Lower zooms are 2x2 means of the one above, not remapped: close to it, not the same
+    for filepath, x, y in tile_keys(storage.files, 5):
+        expected = decode(render_tile(dataset, tile_plan(dataset, 5, x, y, 64)))
+        tile = decode(storage.files[filepath])
+        both = (tile[..., 3] > 0) & (expected[..., 3] > 0)
+        difference = np.abs(tile[..., :3].astype(np.int16) - expected[..., :3]).max(axis=2)[both]
+        assert difference.mean() < 4
+
+
+def test_render_tiles_match_per_tile_rendering(goes_dataset):
+    dataset = goes_dataset(size=1000, data=wavy_data(1000))
+    tiles = get_tiles(REGION, 5, 5, 0.5, 0.5)
+    images = render_tiles(dataset, tiles, lut=LUT, vmin=VMIN, vmax=VMAX, workers=2)
+    assert images.keys() == tiles.keys()
+    for key, region in tiles.items():
+        expected = render_tile(dataset, get_remap_plan(dataset, region))
+        np.testing.assert_array_equal(decode(images[key].getvalue()), decode(expected), err_msg=str(key))
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def test_benchmark_tiles(goes_dataset):
+    dataset = goes_dataset(size=3000, data=wavy_data(3000))
+    rows = []
+
+    tiles = get_tiles(REGION, 2.5, 2.5, 0.25, 0.25)
+    plans, seconds = timed(lambda: {key: get_remap_plan(dataset, region) for key, region in tiles.items()})
+    rows.append((f'{len(tiles)} tiles', 'per tile plans (once)', seconds))
+    _, seconds = timed(lambda: [render_tile(dataset, plan) for plan in plans.values()])
+    rows.append(('', 'per tile get_raster_image_stream', seconds))
+    _, seconds = timed(lambda: render_tiles(dataset, tiles, lut=LUT, vmin=VMIN, vmax=VMAX, plans=plans))
+    rows.append(('', 'render_tiles', seconds))
+    _, seconds = timed(lambda: render_tiles(dataset, tiles, lut=LUT, vmin=VMIN, vmax=VMAX, plans=plans, workers=4))
+    rows.append(('', 'render_tiles, 4 threads', seconds))
+
+    storage = MemoryStorage()
+    pyramid = TilePyramid(storage, 'tiles', REGION, max_zoom=7, min_zoom=3, lut=LUT, vmin=VMIN, vmax=VMAX)
+    _, seconds = timed(lambda: pyramid.geometry(dataset))
+    label = 'zoom 3-7 pyramid'
+    rows.append((label, 'pyramid plan (once)', seconds))
+    written, seconds = timed(lambda: pyramid.write(dataset))
+    rows.append((f'{len(written)} tiles', 'TilePyramid.write', seconds))
+    keys = [(z, x, y) for z in range(3, 8) for _, x, y in tile_keys(storage.files, z)]
+    tile_plans, seconds = timed(lambda: [tile_plan(dataset, z, x, y, 256) for z, x, y in keys])
+    rows.append(('', 'per tile plans (once)', seconds))
+    _, seconds = timed(lambda: [render_tile(dataset, plan) for plan in tile_plans])
+    rows.append(('', 'per tile get_raster_image_stream', seconds))
+
+    print('\n3000x3000 full disk, 20x20 degrees region')
+    print(f'{"":<18}{"path":<36}{"ms":>8}')
+    for label, path, seconds in rows:
+        print(f'{label:<18}{path:<36}{1000 * seconds:>8.1f}')
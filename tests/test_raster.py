@@ -0,0 +1,90 @@
+'''
+get_raster_image_stream against the matplotlib/cartopy get_image_stream path.
+The benchmark prints its timing table with -s.
+'''
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from cima.goes.img import get_colormap_lut, get_raster_image_stream, get_remap_plan
+from cima.goes.tiles import LatLonRegion, get_data, get_lats_lons, project_region_indexes
+
+REGION = LatLonRegion(lat_north=-20, lat_south=-40, lon_west=-70, lon_east=-50)
+VMIN, VMAX = 210., 290.
+# Largest mean and 99th percentile absolute RGB difference (0..255 levels) accepted
+MEAN_TOLERANCE = 4
+P99_TOLERANCE = 16
+
+
+def wavy_data(size: int) -> np.ndarray:
+    rows, cols = np.mgrid[0:size, 0:size]
+    return 250 + 40 * np.sin(rows / 37.) * np.cos(cols / 23.)
+
+
+def decode(stream) -> np.ndarray:
+    return cv2.cvtColor(cv2.imdecode(np.frombuffer(stream.getvalue(), np.uint8), cv2.IMREAD_UNCHANGED),
+                        cv2.COLOR_BGRA2RGBA)
+
+
+def timed(function, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def test_raster_image_is_the_colormapped_remap(goes_dataset):
+    plt = pytest.importorskip('matplotlib.pyplot')
+    dataset = goes_dataset(size=600, data=wavy_data(600))
+    plan = get_remap_plan(dataset, REGION, width=80, height=60)
+    data = get_data(dataset, plan.window)
+    cmap = plt.get_cmap('viridis')
+    image = decode(get_raster_image_stream(data, plan, cmap=cmap, vmin=VMIN, vmax=VMAX))
+    assert image.shape == (60, 80, 4)
+    # Output pixel centers, nearest source pixel
+    lut = get_colormap_lut(cmap)
+    row, col = 30, 40
+    index = int(plan.indexes[row * 80 + col, 0])
+    value = np.asarray(data).ravel()[index]
+    expected = lut[int(np.rint((value - VMIN) * (len(lut) - 1) / (VMAX - VMIN)))]
+    np.testing.assert_array_equal(image[row, col], expected)
+
+
+def test_benchmark_raster_against_matplotlib(goes_dataset):
+    plt = pytest.importorskip('matplotlib.pyplot')
+    pytest.importorskip('cartopy')
+    from cima.goes.img import get_image_stream
+    dataset = goes_dataset(size=1500, data=wavy_data(1500))
+    cmap = plt.get_cmap('viridis')
+    window = project_region_indexes(dataset, REGION)
+    data = get_data(dataset, window)
+    lats, lons = get_lats_lons(dataset, window)
+
+    plan, plan_seconds = timed(lambda: get_remap_plan(dataset, REGION, window))
+    raster, raster_seconds = timed(lambda: get_raster_image_stream(data, plan, cmap=cmap, vmin=VMIN, vmax=VMAX))
+    figure, figure_seconds = timed(lambda: get_image_stream(data, lats, lons, REGION, cmap=cmap, vmin=VMIN, vmax=VMAX))
+
+    raster = decode(raster)
+    figure = decode(figure)
+    assert raster.shape[:2] == figure.shape[:2]
+    # get_image_stream leaves transparent margins around the map: compare the map area
+    rows, cols = np.nonzero(figure[..., 3])
+    figure = figure[rows.min(): rows.max() + 1, cols.min(): cols.max() + 1]
+    figure = cv2.resize(figure, raster.shape[1::-1], interpolation=cv2.INTER_NEAREST)
+    difference = np.abs(raster[..., :3].astype(np.int16) - figure[..., :3]).max(axis=2)
+    mean, p99 = difference.mean(), np.percentile(difference, 99)
+
+    print(f'\n{raster.shape[1]}x{raster.shape[0]} window, map area of the matplotlib image: '
+          f'{cols.max() - cols.min() + 1}x{rows.max() - rows.min() + 1}')
+    print(f'{"path":<30}{"ms":>8}')
+    print(f'{"get_remap_plan (once)":<30}{1000 * plan_seconds:>8.1f}')
+    print(f'{"get_raster_image_stream":<30}{1000 * raster_seconds:>8.1f}')
+    print(f'{"get_image_stream":<30}{1000 * figure_seconds:>8.1f}')
+    print(f'RGB difference: mean {mean:.2f}, 99th percentile {p99:.0f} levels')
+    assert mean <= MEAN_TOLERANCE
+    assert p99 <= P99_TOLERANCE
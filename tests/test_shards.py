@@ -0,0 +1,96 @@
+import collections
+import datetime
+import multiprocessing
+import os
+import pytest
+from cima.goes import ProductBand, Product, Band
+from cima.goes.storage._blobs import BandBlobs, GroupedBandBlobs, ListedBlob
+from cima.goes.storage._gcs import GCS
+from cima.goes.storage._nfs import NFS
+from cima.goes.projects import _project
+from cima.goes.projects._project import BatchProcess, DatesRange, HoursRange
+from cima.goes.projects._shards import NodeSharding, ShardLeases, BLOCK_SHARDING
+
+NODES = 3
+RANGE = DatesRange(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2), [HoursRange(0, 23)], name='R')
+UNITS = 2 * 24
+
+
+class OneScanPerHour(GCS):
+    def grouped_one_hour_blobs(self, year, month, day, hour, bands):
+        start = f'{year}{datetime.date(year, month, day).timetuple().tm_yday:03d}{hour:02d}000'
+        return [GroupedBandBlobs(start, [BandBlobs(Product.CMIPF, Band.RED, [ListedBlob('x')])])]
+
+
+def process(goes_storage, year, month, day, hour, minute, blobs, out, node, fail):
+    if (day, hour) == fail:
+        raise Exception(f'Failed {day} {hour}')
+    fd = os.open(out, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(fd, f'{year}-{month:02d}-{day:02d} {hour} {node}\n'.encode('utf-8'))
+    finally:
+        os.close(fd)
+    return hour
+
+
+def run_node(base: str, index: int, workers: int, fail=None):
+    # Worker processes mount this storage instead of a real GCS
+    _project.mount_goes_storage = lambda info: OneScanPerHour()
+    sharding = NodeSharding(NODES, index, storage=NFS(), path=os.path.join(base, 'leases'),
+                            method=BLOCK_SHARDING, lease_seconds=10, poll_interval=0.1)
+    batch = BatchProcess(OneScanPerHour(), [ProductBand(Product.CMIPF, Band.RED)], [RANGE],
+                         machine_id=f'node{index}', journal_path=os.path.join(base, f'journal{index}'),
+                         sharding=sharding)
+    try:
+        for _ in batch.iter_run(process, os.path.join(base, 'out.txt'), index, fail, workers=workers):
+            pass
+    except Exception:
+        if fail is None:
+            raise
+
+
+def run_nodes(base: str, workers: int, fails: dict = None):
+    context = multiprocessing.get_context('fork')
+    nodes = [
+        context.Process(target=run_node, args=(base, index, workers, (fails or {}).get(index)))
+        for index in range(NODES)]
+    for node in nodes:
+        node.start()
+    for node in nodes:
+        node.join(60)
+        assert node.exitcode == 0
+    with open(os.path.join(base, 'out.txt')) as f:
+        return [line.split(' ') for line in f.read().splitlines()]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_every_unit_is_processed_once(tmp_path, workers):
+    lines = run_nodes(str(tmp_path), workers)
+    units = collections.Counter((date, hour) for date, hour, _ in lines)
+    assert len(units) == UNITS
+    assert set(units.values()) == {1}
+    leases = ShardLeases(NFS(), str(tmp_path / 'leases'), NODES * 4, 'test')
+    assert all(leases.lease(shard).done for shard in range(NODES * 4))
+
+
+def test_units_of_a_released_shard_are_not_processed_again(tmp_path):
+    # Node 0 fails at the third unit of its first shard (block sharding: 4 units per shard)
+    lines = run_nodes(str(tmp_path), 1, fails={0: (1, 2)})
+    units = collections.Counter((date, hour) for date, hour, _ in lines)
+    assert len(units) == UNITS
+    assert set(units.values()) == {1}
+    by_node = {(date, hour): node for date, hour, node in lines}
+    assert by_node['2020-01-01', '0'] == by_node['2020-01-01', '1'] == '0'
+    assert by_node['2020-01-01', '2'] != '0'
+
+
+def test_only_one_claim_of_a_free_shard_wins(tmp_path):
+    claims = [ShardLeases(NFS(), str(tmp_path), 1, f'node{i}') for i in range(5)]
+    assert [leases.claim(0) for leases in claims].count(True) == 1
+    holder = next(leases for leases in claims if leases.held)
+    holder.units_done(0, [(0, datetime.date(2020, 1, 1), 3)])
+    holder.release(0)
+    other = next(leases for leases in claims if leases is not holder)
+    assert other.claim(0)
+    assert other.done_units[0] == {(0, datetime.date(2020, 1, 1), 3)}
+    assert not holder.claim(0)
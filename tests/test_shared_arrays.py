@@ -0,0 +1,104 @@
+'''
+SharedArrays through BatchProcess workers. The benchmark compares the
+memory of workers projecting their own full disk lats/lons with workers
+attaching the ones published by share_lats_lons; run with -s for the table.
+'''
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from cima.goes import Band, Product, ProductBand
+from cima.goes.projects import _project
+from cima.goes.projects._project import BatchProcess, DatesRange, HoursRange
+from cima.goes.tasks import SharedArrays, worker_resource
+from cima.goes.tiles import get_lats_lons, share_lats_lons
+from conftest import write_goes_dataset
+from test_shards import OneScanPerHour
+
+WORKERS = 4
+HOURS = 8
+MB = 1 << 20
+
+
+def batch_process(tmp_path) -> BatchProcess:
+    hours = DatesRange(datetime.date(2020, 1, 1), datetime.date(2020, 1, 1), [HoursRange(0, HOURS - 1)], name='S')
+    return BatchProcess(OneScanPerHour(), [ProductBand(Product.CMIPF, Band.RED)], [hours],
+                        journal_path=str(tmp_path / 'journal'))
+
+
+def read_shared(goes_storage, year, month, day, hour, minute, blobs, shared_arrays=None):
+    lats = shared_arrays['lats']
+    return os.getpid(), lats.flags.writeable, float(np.nansum(np.where(np.isfinite(lats), lats, np.nan)))
+
+
+def test_workers_see_the_shared_arrays(goes_dataset, tmp_path, monkeypatch):
+    monkeypatch.setattr(_project, 'mount_goes_storage', lambda info: OneScanPerHour())
+    dataset = goes_dataset(size=200)
+    with SharedArrays() as shared_arrays:
+        lats, _ = share_lats_lons(shared_arrays, dataset)
+        expected = float(np.nansum(np.where(np.isfinite(lats), lats, np.nan)))
+        results = [result for results in batch_process(tmp_path).iter_run(
+            read_shared, workers=2, shared_arrays=shared_arrays) for result in results]
+    assert len(results) == HOURS
+    assert {pid for pid, _, _ in results} - {os.getpid()}
+    assert all(not writeable for _, writeable, _ in results)
+    assert all(total == pytest.approx(expected) for _, _, total in results)
+
+
+def touch_lats_lons(goes_storage, year, month, day, hour, minute, blobs, filename, shared_arrays=None):
+    import psutil
+    from netCDF4 import Dataset
+    if shared_arrays is None:
+        # What every worker did before: its own projection of the full disk
+        def project():
+            with Dataset(filename) as dataset:
+                return get_lats_lons(dataset)
+        lats, lons = worker_resource('lats_lons', project)
+    else:
+        lats, lons = shared_arrays['lats'], shared_arrays['lons']
+    valid = int(np.count_nonzero(np.isfinite(lats) & np.isfinite(lons)))
+    memory = psutil.Process().memory_full_info()
+    return os.getpid(), memory.uss, memory.rss, valid
+
+
+def worker_memory(batch: BatchProcess, filename: str, shared_arrays: SharedArrays = None):
+    results = [result for results in batch.iter_run(
+        touch_lats_lons, filename, workers=WORKERS, shared_arrays=shared_arrays) for result in results]
+    assert not [result for result in results if isinstance(result, Exception)]
+    by_worker = {}
+    for pid, uss, rss, valid in results:
+        previous = by_worker.get(pid, (0, 0, valid))
+        by_worker[pid] = (max(previous[0], uss), max(previous[1], rss), valid)
+    return by_worker
+
+
+def test_benchmark_worker_memory(tmp_path, monkeypatch):
+    pytest.importorskip('psutil')
+    monkeypatch.setattr(_project, 'mount_goes_storage', lambda info: OneScanPerHour())
+    filename = write_goes_dataset(str(tmp_path / 'goes.nc'), size=1500)
+    batch = batch_process(tmp_path)
+
+    private = worker_memory(batch, filename)
+    from netCDF4 import Dataset
+    with SharedArrays() as shared_arrays, Dataset(filename) as dataset:
+        lats, lons = share_lats_lons(shared_arrays, dataset)
+        shared_bytes = lats.nbytes + lons.nbytes
+        del lats, lons
+        shared = worker_memory(batch, filename, shared_arrays)
+
+    rows = []
+    for label, by_worker, published in (('own get_lats_lons', private, 0), ('SharedArrays', shared, shared_bytes)):
+        uss = [memory[0] for memory in by_worker.values()]
+        rss = [memory[1] for memory in by_worker.values()]
+        rows.append((label, len(by_worker), np.mean(uss) / MB, np.mean(rss) / MB, (sum(uss) + published) / MB))
+        assert len({memory[2] for memory in by_worker.values()}) == 1
+    print(f'\n1500x1500 full disk, {WORKERS} workers, published: {shared_bytes / MB:.1f} MB')
+    print(f'{"lats/lons":<20}{"workers":>8}{"USS MB":>9}{"RSS MB":>9}{"total MB":>10}')
+    for label, workers, uss, rss, total in rows:
+        print(f'{label:<20}{workers:>8}{uss:>9.1f}{rss:>9.1f}{total:>10.1f}')
+    (_, _, private_uss, _, private_total), (_, _, shared_uss, _, shared_total) = rows
+    # The private copies are float64 lats and lons, 36 MB per worker
+    assert private_uss - shared_uss > 20
+    assert shared_total < private_total
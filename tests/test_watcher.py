@@ -0,0 +1,100 @@
+import datetime
+import os
+import pytest
+from cima.goes import ProductBand, Product, Band
+from cima.goes.storage._blobs import ListedBlob
+from cima.goes.storage._cache import CachedGoesStorage
+from cima.goes.storage._gcs import GCS
+from cima.goes.storage._listing import IndexedGoesStorage
+from cima.goes.projects._watcher import ScanWatcher
+from cima.goes.utils._file_names import path_prefix
+
+BANDS = [ProductBand(Product.CMIPF, Band.CLEAN_LONGWAVE_WINDOW), ProductBand(Product.CMIPF, Band.RED)]
+# Minutes after the scan start when each band file is published
+DELAYS = {Band.CLEAN_LONGWAVE_WINDOW: 5, Band.RED: 8}
+FIRST_SCAN = datetime.datetime(2020, 1, 1, 11, 0)
+SCANS = 18
+
+
+class LocalBucket(GCS):
+    '''
+    GOES bucket in a local directory, where a file is only visible
+    from its publication time on (by the simulated clock)
+    '''
+    def __init__(self, path: str, clock):
+        super().__init__()
+        self.path = path
+        self.clock = clock
+        self.published = {}
+
+    def add(self, start: datetime.datetime, band: Band, published: datetime.datetime):
+        day_of_year = start.timetuple().tm_yday
+        stamp = f'{start.year}{day_of_year:03d}{start:%H%M%S}0'
+        name = (path_prefix(start.year, start.month, start.day, start.hour) +
+                f'OR_ABI-L2-CMIPF-M6C{int(band):02d}_G16_s{stamp}_e{stamp}_c{stamp}.nc')
+        filepath = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as f:
+            f.write(name.encode('utf-8'))
+        self.published[name] = published
+
+    def list_blobs(self, path: str, delimiter='/'):
+        return [
+            ListedBlob(name, len(name), 1) for name, published in sorted(self.published.items())
+            if name.startswith(path) and published <= self.clock() and
+            (delimiter is None or delimiter not in name[len(path):])
+        ]
+
+    def get_blob(self, name: str, generation: int = None, size: int = None):
+        return ListedBlob(name, size, generation)
+
+    def download_blob(self, blob) -> bytes:
+        with open(os.path.join(self.path, blob.name), 'rb') as f:
+            return f.read()
+
+
+def process(goes_storage, year, month, day, hour, minute, blobs, processed, clock):
+    start = datetime.datetime(year, month, day, hour, minute)
+    data = {band: goes_storage.download_blob(blob) for (_, band), blob in blobs.items()}
+    processed.append((start, clock(), data))
+    return start
+
+
+@pytest.fixture
+def replay(tmp_path):
+    now = {'time': FIRST_SCAN}
+    clock = lambda: now['time']
+    bucket = LocalBucket(str(tmp_path / 'bucket'), clock)
+    for i in range(SCANS):
+        start = FIRST_SCAN + datetime.timedelta(minutes=10 * i)
+        for band, delay in DELAYS.items():
+            bucket.add(start, band, start + datetime.timedelta(minutes=delay))
+    return bucket, now, clock
+
+
+def test_replay_processes_every_scan_once_when_complete(replay, tmp_path):
+    bucket, now, clock = replay
+    # Indexed would never see the new scans of a listed day; Cached is still used to read them
+    goes_storage = CachedGoesStorage(IndexedGoesStorage(bucket, str(tmp_path / 'listings')), str(tmp_path / 'cache'))
+    processed = []
+    watcher = ScanWatcher(goes_storage, BANDS, process, processed, clock, utcnow=clock)
+    results = []
+    while now['time'] < FIRST_SCAN + datetime.timedelta(minutes=10 * SCANS + 30):
+        results.extend(watcher.poll())
+        now['time'] += datetime.timedelta(minutes=1)
+
+    starts = [FIRST_SCAN + datetime.timedelta(minutes=10 * i) for i in range(SCANS)]
+    assert results == starts
+    for start, at, data in processed:
+        # As soon as its last band was published
+        assert at == start + datetime.timedelta(minutes=max(DELAYS.values()))
+        assert set(data) == {band.band for band in BANDS}
+    assert goes_storage.stats.misses == 2 * SCANS
+    # Handled starts older than keep_hours are forgotten
+    assert len(watcher.handled) <= 6 * watcher.keep_hours + 1
+
+
+def test_keep_hours_covers_the_listed_hours(replay):
+    bucket, _, clock = replay
+    with pytest.raises(Exception, match='keep_hours'):
+        ScanWatcher(bucket, BANDS, process, [], clock, keep_hours=1, utcnow=clock)